@@ -2,157 +2,68 @@ from typing import List, Dict
 
 import asyncio
 import base64
+import collections
+import functools
+import itertools
 import json
 import os
+import threading
 import urllib.error
 import urllib.request
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, ValidationError
 import time
-import cv2
-import numpy as np
-from ultralytics import YOLO
 from starlette.concurrency import run_in_threadpool
-from PIL import Image
 import io
 import sys
-from contextlib import redirect_stdout, redirect_stderr
-
-# --- Dithering helpers (native implementation to avoid extra pip deps) ---
-def _nearest_palette_color(pixel, palette):
-    # pixel: (3,) array, palette: (N,3)
-    diffs = palette - pixel
-    dists = (diffs * diffs).sum(axis=1)
-    idx = int(np.argmin(dists))
-    return palette[idx], idx
-
-def _quantize_image_to_palette(arr, palette):
-    # arr: HxWx3 uint8
-    h, w, _ = arr.shape
-    out = np.zeros_like(arr)
-    # vectorized distance to 2-color palette
-    pa = palette.reshape((1, 1, palette.shape[0], 3))
-    aa = arr.reshape((h, w, 1, 3)).astype(np.int32)
-    dists = ((aa - pa) ** 2).sum(axis=3)
-    idx = np.argmin(dists, axis=2)
-    out = palette[idx]
-    return out.astype(np.uint8)
-
-def _floyd_steinberg_dither(pil_img, palette):
-    arr = np.array(pil_img).astype(np.float32)
-    h, w, _ = arr.shape
-    pal = np.array(palette, dtype=np.float32)
-    for y in range(h):
-        for x in range(w):
-            old = arr[y, x].copy()
-            nearest, _ = _nearest_palette_color(old, pal)
-            arr[y, x] = nearest
-            err = old - nearest
-            if x + 1 < w:
-                arr[y, x + 1] += err * (7 / 16)
-            if y + 1 < h:
-                if x > 0:
-                    arr[y + 1, x - 1] += err * (3 / 16)
-                arr[y + 1, x] += err * (5 / 16)
-                if x + 1 < w:
-                    arr[y + 1, x + 1] += err * (1 / 16)
-    arr = np.clip(arr, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
-
-def _atkinson_dither(pil_img, palette):
-    arr = np.array(pil_img).astype(np.float32)
-    h, w, _ = arr.shape
-    pal = np.array(palette, dtype=np.float32)
-    for y in range(h):
-        for x in range(w):
-            old = arr[y, x].copy()
-            nearest, _ = _nearest_palette_color(old, pal)
-            arr[y, x] = nearest
-            err = (old - nearest) / 8.0
-            if x + 1 < w:
-                arr[y, x + 1] += err
-            if x + 2 < w:
-                arr[y, x + 2] += err
-            if y + 1 < h:
-                if x - 1 >= 0:
-                    arr[y + 1, x - 1] += err
-                arr[y + 1, x] += err
-                if x + 1 < w:
-                    arr[y + 1, x + 1] += err
-            if y + 2 < h:
-                arr[y + 2, x] += err
-    arr = np.clip(arr, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
-
-def _sierra3_dither(pil_img, palette):
-    # Sierra-3 kernel
-    arr = np.array(pil_img).astype(np.float32)
-    h, w, _ = arr.shape
-    pal = np.array(palette, dtype=np.float32)
-    for y in range(h):
-        for x in range(w):
-            old = arr[y, x].copy()
-            nearest, _ = _nearest_palette_color(old, pal)
-            arr[y, x] = nearest
-            err = old - nearest
-            if x + 1 < w:
-                arr[y, x + 1] += err * (5 / 32)
-            if x + 2 < w:
-                arr[y, x + 2] += err * (3 / 32)
-            if y + 1 < h:
-                if x - 2 >= 0:
-                    arr[y + 1, x - 2] += err * (2 / 32)
-                if x - 1 >= 0:
-                    arr[y + 1, x - 1] += err * (4 / 32)
-                arr[y + 1, x] += err * (5 / 32)
-                if x + 1 < w:
-                    arr[y + 1, x + 1] += err * (4 / 32)
-                if x + 2 < w:
-                    arr[y + 1, x + 2] += err * (2 / 32)
-            if y + 2 < h:
-                if x - 1 >= 0:
-                    arr[y + 2, x - 1] += err * (2 / 32)
-                arr[y + 2, x] += err * (3 / 32)
-                if x + 1 < w:
-                    arr[y + 2, x + 1] += err * (2 / 32)
-    arr = np.clip(arr, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
-
-def _bayer_matrix(n):
-    if n == 1:
-        return np.array([[0]])
-    else:
-        smaller = _bayer_matrix(n // 2)
-        a = 4 * smaller + np.array([[0, 2], [3, 1]])
-        top = np.hstack((a, a + 2))
-        bottom = np.hstack((a + 3, a + 1))
-        return np.vstack((top, bottom))
-
-def _bayer_dither(pil_img, palette, order=8):
-    arr = np.array(pil_img).astype(np.uint8)
-    h, w, _ = arr.shape
-    pal = np.array(palette, dtype=np.uint8)
-    mat = _bayer_matrix(order)
-    norm = (mat + 0.5) / (order * order)
-    # luminance
-    lum = (0.299 * arr[..., 0] + 0.587 * arr[..., 1] + 0.114 * arr[..., 2]).astype(np.uint8)
-    out = np.zeros_like(arr)
-    for y in range(h):
-        for x in range(w):
-            threshold = norm[y % order, x % order] * 255
-            if lum[y, x] > threshold:
-                out[y, x] = pal[1]
-            else:
-                out[y, x] = pal[0]
-    return Image.fromarray(out)
 
-from src.models import CharacterSheet, ConversationState, PendingGoal, Pillar
+from src.dithering import (
+    AVATAR_SIZES,
+    BAYER_ORDERS,
+    DEFAULT_PNG_COMPRESS_LEVEL,
+    ERROR_DIFFUSION_KERNELS,
+    OUTPUT_FORMATS,
+    PALETTES,
+    PoolSaturated,
+    cache_from_env,
+    cache_key,
+    decode_sizes,
+    free_shared,
+    normalize_algorithm,
+    pool_from_env,
+    render_pixels,
+    render_png,
+    render_renditions,
+    zip_bundle,
+)
+
+from src.models import CharacterSheet, ConversationState, LockInSession, PendingGoal, Pillar
 from src.onboarding.agent import ArchitectAgent
 from src.storage import load_profile, save_profile
+from src.vision import (
+    CascadeDetector,
+    FrameError,
+    FrameTimer,
+    LatestFrameSlot,
+    MotionTotals,
+    RateLimited,
+    batcher_from_env,
+    cascade_from_env,
+    debouncer_from_env,
+    decode_image,
+    detector_from_env,
+    metrics_from_env,
+    motion_gate_from_env,
+    rate_controller_from_env,
+    split_binary_frame,
+    split_json_frame,
+    tracker_from_env,
+    utc_iso,
+)
 
 
 class Message(BaseModel):
@@ -197,74 +108,416 @@ MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "phone-det
 TARGET_CLASSES = {"cell phone", "remote"}
 # Lower threshold for better sensitivity during debugging
 CONF_THRESHOLD = 0.2
+# PHONE_DETECT_ENABLED=0 never loads the detector (workers that only serve
+# profile/LLM routes); ultralytics/torch are then never imported.
+VISION_ENABLED = os.getenv("PHONE_DETECT_ENABLED", "1") == "1"
+# Independent model copies serving the shared batcher.  Threads in this
+# process by default; with PHONE_DETECT_PROCESS=spawn each is its own process.
+DETECTOR_REPLICAS = max(1, int(os.getenv("PHONE_DETECT_REPLICAS", 1)))
+# PHONE_DETECT_LEAN=1 (opt-in): the model itself drops everything but
+# TARGET_CLASSES above CONF_THRESHOLD, so ?raw=1 only shows those too.
+LEAN_DETECTIONS = os.getenv("PHONE_DETECT_LEAN", "0") == "1"
+# Frames that waited longer than this for the detector are skipped
+LATE_DROP_SEC = float(os.getenv("PHONE_DETECT_LATE_DROP_SEC", 0.5))
 
 # Custom 2-color palette: black and cream
 CUSTOM_PALETTE_RGB = [
     (0, 0, 0),
     (254, 241, 220),
 ]
+# Themed palettes (src/dithering/palettes.py) selectable via the `palette` form field
+DEFAULT_PALETTE = "noir"
+
+# Dithered PNGs keyed by upload hash + parameters (see src/dithering/cache.py)
+dither_cache = cache_from_env()
+# Dedicated process pool for dithering, kept off Starlette's threadpool
+image_pool = pool_from_env()
+
+# One lock per user around the background profile writes below (distraction
+# events, avatar URLs), so they cannot drop each other's updates.  The lock is
+# per-process only: it does not serialise writers in other workers or hosts.
+_profile_locks = collections.defaultdict(threading.Lock)
+_profile_locks_guard = threading.Lock()
+
+
+def _profile_lock(user_id):
+    with _profile_locks_guard:
+        return _profile_locks[user_id]
+
+
+# Distraction-event writes in flight, kept referenced until they finish.
+_profile_writes = set()
+
+# The detector is loaded and warmed up on a background thread at startup
+# (_load_detector); it stays None until then.  GET /ready reports progress.
+# `detector` is the first of the PHONE_DETECT_REPLICAS loaded copies.
+detector = None
+detector_replicas = []
+id2name = {}
+wanted_ids = set()
+detector_status = {"state": "loading" if VISION_ENABLED else "disabled"}
+
+
+def _close_detector(replica):
+    # A detector in another process (PHONE_DETECT_PROCESS) owns a shared-memory ring.
+    close = getattr(replica, "close", None)
+    if close is not None:
+        close()
+
+
+def _load_detector():
+    """Load the phone detector replicas and run a warm-up frame through each."""
+    global detector, id2name, wanted_ids
+    started = time.perf_counter()
+    loaded = []
+    try:
+        for _ in range(DETECTOR_REPLICAS):
+            # PHONE_DETECT_BACKEND=torch|onnx|openvino (see src/vision/detectors.py)
+            loaded.append(detector_from_env(MODEL_PATH))
+            names = loaded[-1].names
+            ids = {i for i, n in names.items() if n in TARGET_CLASSES}
+            # PHONE_DETECT_CASCADE puts a cheaper model in front (see src/vision/cascade.py)
+            loaded[-1] = cascade_from_env(loaded[-1], MODEL_PATH, ids, CONF_THRESHOLD)
+        if LEAN_DETECTIONS:
+            for replica in loaded:
+                replica.restrict(ids, CONF_THRESHOLD)
+        detector_status["load_sec"] = round(time.perf_counter() - started, 2)
+        detector_status["warmup_ms"] = round(max(replica.warmup() for replica in loaded), 1)
+    except Exception as e:
+        print(f"[Detector] Phone detector unavailable: {e}")
+        for replica in loaded:
+            _close_detector(replica)
+        detector_status.update(state="failed", error=str(e))
+        return
+    id2name, wanted_ids = names, ids
+    detector_replicas[:] = loaded
+    detector = loaded[0]
+    detector_status.update(state="ready", replicas=len(loaded))
+    print(f"[Detector] Ready in {detector_status['load_sec']}s (warm-up {detector_status['warmup_ms']} ms)")
 
-try:
-    model = YOLO(MODEL_PATH)
-    id2name = model.names
-    wanted_ids = {i for i, n in id2name.items() if n in TARGET_CLASSES}
-except Exception:
-    model = None
-    id2name = {}
-    wanted_ids = set()
 
+@app.on_event("startup")
+def _start_detector_loading():
+    if VISION_ENABLED:
+        threading.Thread(target=_load_detector, name="detector-loader", daemon=True).start()
 
-async def infer_frame_async(frame):
-    """Run model(frame) in a threadpool to avoid blocking the event loop."""
-    if model is None:
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 while the phone detector is still loading.
+
+    A disabled or failed detector does not hold the worker back; the other
+    routes work without it.
+    """
+    body = {"ready": detector_status["state"] != "loading", "detector": detector_status}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+# Rolling per-stage latency histograms, process-wide and per connection (src/vision/metrics.py)
+pipeline_metrics = metrics_from_env()
+connection_metrics = {}
+_connection_ids = itertools.count(1)
+# Open sockets per scheduling key (user_id, or the connection itself)
+_connections_per_key = collections.Counter()
+
+
+def _infer_batch(replica, frames):
+    """One batched forward pass on a replica; returns one Detections object per frame."""
+    started = time.perf_counter()
+    dets = detector_replicas[replica].predict(frames)
+    # Per batch: the gap to a frame's "infer" stage is batching + threadpool hop.
+    pipeline_metrics.record("model", (time.perf_counter() - started) * 1000)
+    return dets
+
+
+# Frames from all sockets are grouped into batched forward passes
+# (PHONE_DETECT_MAX_BATCH frames or PHONE_DETECT_MAX_WAIT_MS, see src/vision/batcher.py),
+# filled round-robin across users and capped at PHONE_DETECT_USER_FPS per user.
+detector_batcher = batcher_from_env([functools.partial(_infer_batch, i) for i in range(DETECTOR_REPLICAS)])
+# Frames with no meaningful motion reuse the last detections (src/vision/motion.py)
+motion_totals = MotionTotals()
+
+
+async def infer_frame_async(frame, key=None):
+    """Run inference on one frame via the shared batcher; returns its Detections.
+
+    ``key`` is who the frame is scheduled and rate-limited as.
+    """
+    if detector is None:
         raise RuntimeError("Model not loaded")
-    def _call(f):
-        # suppress model's stdout/stderr (ultralytics prints inference info)
-        with open(os.devnull, 'w') as devnull:
-            with redirect_stdout(devnull), redirect_stderr(devnull):
-                return model(f, False)
+    return await detector_batcher.submit(frame, key)
+
+
+def _detector_capacity_fps():
+    """Frames/s the detector replicas sustain at the batch sizes seen so far."""
+    model_ms = pipeline_metrics.quantile("model")
+    if not model_ms or not detector_batcher.batches:
+        return None
+    mean_batch = detector_batcher.frames / detector_batcher.batches
+    return len(detector_batcher.replicas) * mean_batch * 1000.0 / model_ms
+
+
+@app.get("/api/phone-detect/metrics")
+def phone_detect_metrics():
+    """Per-stage latency p50/p95/p99 (ms), overall and for each open connection."""
+    return {
+        "global": pipeline_metrics.stats(),
+        "connections": {conn_id: m.stats() for conn_id, m in list(connection_metrics.items())},
+    }
+
+
+@app.get("/api/phone-detect/stats")
+def phone_detect_stats():
+    """Batching, scheduling, motion-gate and cascade metrics for the phone detector."""
+    stats = {**detector_batcher.stats(), "motion": motion_totals.stats()}
+    cascades = [replica.stats() for replica in detector_replicas if isinstance(replica, CascadeDetector)]
+    if cascades:
+        stats["cascade"] = cascades
+    return stats
+
+
+def _saturated_response(exc):
+    return HTTPException(
+        status_code=503,
+        detail="Image processing is busy, please retry shortly.",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _resolve_palette(name):
+    if name == DEFAULT_PALETTE:
+        return [tuple(c) for c in CUSTOM_PALETTE_RGB]
+    if name not in PALETTES:
+        raise HTTPException(status_code=400, detail=f"Unknown palette '{name}'. Choose one of {sorted(PALETTES)}")
+    return [tuple(c) for c in PALETTES[name]]
+
+
+def _check_output(fmt, compress_level):
+    if fmt not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Output format must be one of {sorted(OUTPUT_FORMATS)}")
+    if not 0 <= compress_level <= 9:
+        raise HTTPException(status_code=400, detail="compress_level must be between 0 and 9")
 
-    return await run_in_threadpool(_call, frame)
+
+async def _dither_to_bytes(img_bytes, alg, order=8, parallel=False, palette=None, fmt="png", compress_level=DEFAULT_PNG_COMPRESS_LEVEL):
+    """Dither uploaded image bytes to the custom palette and return encoded bytes.
+
+    Results are cached by content hash, so a hit skips decoding entirely;
+    misses run on the dedicated image process pool.
+    """
+    palette = palette or [tuple(c) for c in CUSTOM_PALETTE_RGB]
+    alg = normalize_algorithm(alg)
+    key = cache_key(img_bytes, alg, palette, order=order if alg == "Bayer" else None, fmt=fmt, compress_level=compress_level)
+    cached = await run_in_threadpool(dither_cache.get, key)
+    if cached is not None:
+        return cached
+
+    out_bytes = await image_pool.run(render_png, img_bytes, palette, alg, order, fmt, compress_level, bands=parallel)
+    await run_in_threadpool(dither_cache.put, key, out_bytes)
+    return out_bytes
+
+
+async def _avatar_renditions(img_bytes, alg, order=8, parallel=False, palette=None, fmt="png", compress_level=DEFAULT_PNG_COMPRESS_LEVEL):
+    """Return {size: encoded bytes} for every avatar size from a single decode."""
+    palette = palette or [tuple(c) for c in CUSTOM_PALETTE_RGB]
+    alg = normalize_algorithm(alg)
+    keys = {
+        size: cache_key(
+            img_bytes, alg, palette, size=size, order=order if alg == "Bayer" else None,
+            fmt=fmt, compress_level=compress_level,
+        )
+        for size in AVATAR_SIZES
+    }
+    renditions = {}
+    for size, key in keys.items():
+        renditions[size] = await run_in_threadpool(dither_cache.get, key)
+    missing = [size for size, out_bytes in renditions.items() if out_bytes is None]
+    if not missing:
+        return renditions
+
+    # Decoded at reduced scale; each size's pixels depend only on the upload and that size.
+    rendered = await image_pool.run(
+        render_renditions, img_bytes, palette, alg, missing, order, fmt, compress_level, bands=parallel
+    )
+    for size, out_bytes in rendered.items():
+        renditions[size] = out_bytes
+        await run_in_threadpool(dither_cache.put, keys[size], out_bytes)
+    return renditions
 
 
 @app.post("/api/dither")
 async def dither_image(
     file: UploadFile = File(...),
     algorithm: str = Form("FloydSteinberg"),
+    order: int = Form(8),
+    parallel: bool = Form(False),
+    palette: str = Form(DEFAULT_PALETTE),
+    format: str = Form("png"),
+    compress_level: int = Form(DEFAULT_PNG_COMPRESS_LEVEL),
 ):
-    """Dither an uploaded image to the fixed 2-color palette.
-
-    Expects multipart/form-data with `file` and optional `algorithm` string.
-    Returns PNG image bytes.
+    """Dither an uploaded image to a named palette (black/cream by default).
+
+    Expects multipart/form-data with `file`, an optional `algorithm` string,
+    an optional Bayer `order` (2, 4, 8 or 16), an optional `parallel` flag
+    that spreads error diffusion on large images across band processes when
+    the operator has set DITHER_WORKERS above 1,
+    an optional `palette` name, an optional output `format` ("png" or "webp")
+    and an optional zlib `compress_level` (0-9) for PNG output.
+    Returns a palette PNG (1-bit for two-colour palettes) or lossless WebP.
     """
+    if order not in BAYER_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Bayer order must be one of {list(BAYER_ORDERS)}")
+    _check_output(format, compress_level)
+    colors = _resolve_palette(palette)
     data = await file.read()
 
-    def _process(img_bytes, alg):
-        pil = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        # palette as simple list of RGB tuples
-        palette = [tuple(c) for c in CUSTOM_PALETTE_RGB]
-
-        if alg == "Bayer":
-            dithered_img = _bayer_dither(pil, palette, order=8)
-        elif alg == "Atkinson":
-            dithered_img = _atkinson_dither(pil, palette)
-        elif alg == "Sierra":
-            dithered_img = _sierra3_dither(pil, palette)
-        else:
-            # Default Floyd-Steinberg
-            dithered_img = _floyd_steinberg_dither(pil, palette)
+    try:
+        out_bytes = await _dither_to_bytes(data, algorithm, order, parallel, colors, format, compress_level)
+    except PoolSaturated as e:
+        raise _saturated_response(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Dithering failed: {e}")
+
+    return StreamingResponse(io.BytesIO(out_bytes), media_type=OUTPUT_FORMATS[format])
+
+
+# Upper bound on algorithm x size variants in one batch request.
+MAX_BATCH_VARIANTS = 16
+
+
+def _parse_batch(algorithms, sizes):
+    """Parse comma-separated batch fields into (algorithm, size) variants.
+
+    An empty size list means the original resolution only.
+    """
+    valid = ["Bayer", *ERROR_DIFFUSION_KERNELS]
+    algs = [a.strip() for a in algorithms.split(",") if a.strip()]
+    for alg in algs:
+        if alg not in valid:
+            raise HTTPException(status_code=400, detail=f"Unknown algorithm '{alg}'. Choose from {valid}")
+    try:
+        size_list = [int(v) for v in sizes.split(",") if v.strip()] or [None]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="sizes must be a comma-separated list of integers")
+    if any(size is not None and size <= 0 for size in size_list):
+        raise HTTPException(status_code=400, detail="sizes must be positive")
+
+    variants = [(alg, size) for alg in dict.fromkeys(algs) for size in dict.fromkeys(size_list)]
+    if not variants:
+        raise HTTPException(status_code=400, detail="At least one algorithm is required")
+    if len(variants) > MAX_BATCH_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_VARIANTS} variants per batch")
+    return variants
+
+
+async def _dither_batch(img_bytes, variants, order, parallel, palette, fmt, compress_level):
+    """Return {(algorithm, size): encoded bytes} from a single decode.
+
+    Cached variants are served directly.  The rest share one decode job, which
+    leaves each size's pixels in shared memory; every variant is then its own
+    pool job, run concurrently, at most one per pool worker.
+    """
+    keys = {
+        (alg, size): cache_key(
+            img_bytes, alg, palette, size=size, order=order if alg == "Bayer" else None,
+            fmt=fmt, compress_level=compress_level,
+        )
+        for alg, size in variants
+    }
+    results = await run_in_threadpool(lambda: {variant: dither_cache.get(key) for variant, key in keys.items()})
+    missing = [variant for variant, out_bytes in results.items() if out_bytes is None]
+    if not missing:
+        return results
+
+    decoded = await image_pool.run(decode_sizes, img_bytes, sorted({size for _, size in missing}, key=lambda s: s or 0))
+    try:
+        rendered = await image_pool.run_all([
+            (render_pixels, decoded[size][2], *decoded[size][:2], palette, alg, order, fmt, compress_level)
+            for alg, size in missing
+        ], bands=parallel)
+    finally:
+        for _, _, pixels in decoded.values():
+            free_shared(pixels)
+
+    # Keep whatever finished, so a retry after saturation only redoes the rest.
+    failure = None
+    finished = {}
+    for variant, out_bytes in zip(missing, rendered):
+        if isinstance(out_bytes, BaseException):
+            failure = failure or out_bytes
+            continue
+        results[variant] = finished[keys[variant]] = out_bytes
+    await run_in_threadpool(lambda: [dither_cache.put(key, out_bytes) for key, out_bytes in finished.items()])
+    if failure is not None:
+        raise failure
+    return results
+
 
-        out = io.BytesIO()
-        dithered_img.save(out, format="PNG")
-        out.seek(0)
-        return out
+@app.post("/api/dither/batch")
+async def dither_batch(
+    file: UploadFile = File(...),
+    algorithms: str = Form("FloydSteinberg,Atkinson,Sierra,Bayer"),
+    sizes: str = Form(""),
+    order: int = Form(8),
+    parallel: bool = Form(False),
+    palette: str = Form(DEFAULT_PALETTE),
+    format: str = Form("png"),
+    compress_level: int = Form(DEFAULT_PNG_COMPRESS_LEVEL),
+):
+    """Dither one upload with several algorithms and sizes in a single request.
+
+    `algorithms` and `sizes` are comma-separated; every combination is
+    rendered (an empty `sizes` means original resolution).  The image is
+    decoded once.  The other fields match /api/dither.
+    Returns a zip archive with one `{algorithm}_{size|full}.{format}` entry per variant.
+    """
+    if order not in BAYER_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Bayer order must be one of {list(BAYER_ORDERS)}")
+    _check_output(format, compress_level)
+    variants = _parse_batch(algorithms, sizes)
+    colors = _resolve_palette(palette)
+    data = await file.read()
 
     try:
-        out_buf = await run_in_threadpool(_process, data, algorithm)
+        results = await _dither_batch(data, variants, order, parallel, colors, format, compress_level)
+    except PoolSaturated as e:
+        raise _saturated_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Dithering failed: {e}")
 
-    return StreamingResponse(out_buf, media_type="image/png")
+    bundle = zip_bundle({
+        f"{alg}_{size or 'full'}.{format}": results[(alg, size)]
+        for alg, size in variants
+    })
+    return StreamingResponse(
+        io.BytesIO(bundle),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="dither_batch.zip"'},
+    )
+
+
+@app.get("/api/dither/cache")
+def dither_cache_stats():
+    """Hit/miss counters and size of the dithered-image cache."""
+    return dither_cache.stats()
+
+
+@app.get("/api/dither/pool")
+def dither_pool_stats():
+    """Queue depth and throughput of the image process pool."""
+    return image_pool.stats()
+
+
+@app.on_event("shutdown")
+def _shutdown_image_pool():
+    # Let running jobs finish so their shared-memory payloads are unlinked.
+    image_pool.shutdown(wait=True)
+
+
+@app.on_event("shutdown")
+def _shutdown_detector():
+    for replica in detector_replicas:
+        _close_detector(replica)
 
 
 @app.post("/api/profile/{user_id}/avatar")
@@ -272,144 +525,339 @@ async def save_profile_avatar(
     user_id: str,
     file: UploadFile = File(...),
     algorithm: str = Form("FloydSteinberg"),
+    order: int = Form(8),
+    parallel: bool = Form(False),
+    palette: str = Form(DEFAULT_PALETTE),
+    format: str = Form("png"),
+    compress_level: int = Form(DEFAULT_PNG_COMPRESS_LEVEL),
 ):
     """Dither an uploaded image and save it to Firebase Storage, then update the user's profile.
     
-    Returns the public URL of the saved image.
+    The upload is decoded once at reduced scale and dithered into every size in
+    AVATAR_SIZES; each rendition is stored as avatars/{user_id}/profile_{size}.{format}.
+    Returns the URL of the largest rendition plus a {size: url} map.
     """
+    if order not in BAYER_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Bayer order must be one of {list(BAYER_ORDERS)}")
+    _check_output(format, compress_level)
+    colors = _resolve_palette(palette)
+    content_type = OUTPUT_FORMATS[format]
     try:
         # First, dither the image
         data = await file.read()
-        
-        def _process(img_bytes, alg):
-            pil = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-            palette = [tuple(c) for c in CUSTOM_PALETTE_RGB]
-            
-            if alg == "Bayer":
-                dithered_img = _bayer_dither(pil, palette, order=8)
-            elif alg == "Atkinson":
-                dithered_img = _atkinson_dither(pil, palette)
-            elif alg == "Sierra":
-                dithered_img = _sierra3_dither(pil, palette)
-            else:
-                dithered_img = _floyd_steinberg_dither(pil, palette)
-            
-            out = io.BytesIO()
-            dithered_img.save(out, format="PNG")
-            out.seek(0)
-            return out.getvalue()
-        
-        dithered_bytes = await run_in_threadpool(_process, data, algorithm)
+        try:
+            renditions = await _avatar_renditions(data, algorithm, order, parallel, colors, format, compress_level)
+        except PoolSaturated as e:
+            raise _saturated_response(e)
         
         # Upload to Firebase Storage
+        rendition_urls = {}
         try:
             from firebase_admin import storage
             bucket = storage.bucket()
-            blob_name = f"avatars/{user_id}/profile.png"
-            blob = bucket.blob(blob_name)
-            blob.upload_from_string(dithered_bytes, content_type="image/png")
-            blob.make_public()
-            image_url = blob.public_url
+            for size, out_bytes in renditions.items():
+                blob_name = f"avatars/{user_id}/profile_{size}.{format}"
+                blob = bucket.blob(blob_name)
+                blob.upload_from_string(out_bytes, content_type=content_type)
+                blob.make_public()
+                rendition_urls[str(size)] = blob.public_url
         except Exception as e:
             # If Firebase Storage fails, we can still return the dithered image
             # and save a data URL or base64 in Firestore
             print(f"[Firebase Storage] Failed to upload avatar: {e}")
             # Fallback: convert to base64 data URL
-            b64_data = base64.b64encode(dithered_bytes).decode('utf-8')
-            image_url = f"data:image/png;base64,{b64_data}"
+            for size, out_bytes in renditions.items():
+                b64_data = base64.b64encode(out_bytes).decode('utf-8')
+                rendition_urls[str(size)] = f"data:{content_type};base64,{b64_data}"
+        image_url = rendition_urls[str(max(renditions))]
         
         # Update the user's profile with the avatar URL
         try:
-            profile_data = load_profile(user_id) or {}
-            cs = profile_data.setdefault("character_sheet", {})
-            cs["avatar_url"] = image_url
-            
-            save_profile(profile_data, user_id)
+            await run_in_threadpool(_save_avatar_urls, user_id, image_url, rendition_urls)
         except Exception as e:
             print(f"[Profile] Failed to update avatar URL: {e}")
         
-        return {"avatar_url": image_url, "ok": True}
+        return {"avatar_url": image_url, "avatar_renditions": rendition_urls, "ok": True}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save avatar: {e}")
 
 
-@app.websocket("/ws/phone-detect")
-async def phone_detect_ws(websocket: WebSocket):
-    """Accepts JSON frames with base64 JPEGs and replies with JSON detections.
+async def _receive_frames(websocket: WebSocket, slot: LatestFrameSlot):
+    """Read frames off the socket into ``slot`` until the client disconnects.
 
-    Expected incoming message: {"type":"frame","frame_id":"...","image":"data:image/jpeg;base64,..."}
-    Response: {"type":"detection","frame_id":...,"frame_width":W,"frame_height":H,"detections":[{class,confidence,bbox,bbox_px}]}
+    Images are not decoded here; only the frame that survives gets decoded.
     """
-    await websocket.accept()
-    if model is None:
-        await websocket.send_text(json.dumps({"type": "error", "code": "model_unavailable", "message": "Phone detector model is not loaded on the server."}))
-        await websocket.close()
-        return
-
     try:
         while True:
-            raw = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                slot.put(message["bytes"])
+                continue
             try:
-                msg = json.loads(raw)
+                msg = json.loads(message.get("text") or "")
             except Exception:
                 await websocket.send_text(json.dumps({"type": "error", "code": "invalid_json"}))
                 continue
+            if msg.get("type") == "frame":
+                slot.put(msg)
+    except (WebSocketDisconnect, RuntimeError):
+        return
+    finally:
+        slot.close()
 
-            if msg.get("type") != "frame":
-                continue
 
-            frame_id = msg.get("frame_id")
-            image_b64 = msg.get("image") or msg.get("data")
-            # frame received
-            if not image_b64:
-                await websocket.send_text(json.dumps({"type": "error", "code": "invalid_frame", "frame_id": frame_id}))
-                continue
+def _save_avatar_urls(user_id, image_url, rendition_urls):
+    with _profile_lock(user_id):
+        profile_data = load_profile(user_id) or {}
+        cs = profile_data.setdefault("character_sheet", {})
+        cs["avatar_url"] = image_url
+        cs["avatar_renditions"] = rendition_urls
+        save_profile(profile_data, user_id)
 
-            if image_b64.startswith("data:"):
-                image_b64 = image_b64.split(",", 1)[1]
 
-            try:
-                img_bytes = base64.b64decode(image_b64)
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            except Exception:
-                await websocket.send_text(json.dumps({"type": "error", "code": "invalid_frame", "frame_id": frame_id}))
-                continue
+def _record_distraction_event(user_id, session_id, session_started, event):
+    """Append a debounced distraction event to the user's LockInSession.
 
-            if frame is None:
-                await websocket.send_text(json.dumps({"type": "error", "code": "invalid_frame", "frame_id": frame_id}))
-                continue
+    Starts are appended to distraction_events (and counted); an end fills in
+    "ended" on the matching start.  The session is created on first use.
+    """
+    try:
+        with _profile_lock(user_id):
+            profile_data = load_profile(user_id) or {}
+            cs = profile_data.setdefault("character_sheet", {"user_id": user_id})
+            history = cs.setdefault("lockin_history", [])
+            session = next((s for s in history if s.get("id") == session_id), None)
+            if session is None:
+                session = LockInSession(
+                    id=session_id,
+                    start_time=utc_iso(session_started),
+                    end_time=utc_iso(session_started),
+                    duration_seconds=0,
+                ).model_dump()
+                history.append(session)
+
+            events = session.setdefault("distraction_events", [])
+            if event["type"] == "distraction_started":
+                events.append({"ts": event["ts"], "type": event["kind"]})
+                session["distractions_detected"] = session.get("distractions_detected", 0) + 1
+                cs["phone_distractions_total"] = cs.get("phone_distractions_total", 0) + 1
+            else:
+                for entry in reversed(events):
+                    if entry.get("ts") == event["started"]:
+                        entry["ended"] = event["ts"]
+                        break
+            session["end_time"] = event["ts"]
+            session["duration_seconds"] = int(time.time() - session_started)
+            save_profile(profile_data, user_id)
+    except Exception as e:
+        print(f"[Profile] Failed to record distraction event: {e}")
 
-            H, W = frame.shape[:2]
+
+async def _persist_distraction_event(previous, *args):
+    if previous is not None:
+        await asyncio.wait([previous])
+    await run_in_threadpool(_record_distraction_event, *args)
+
+
+def _profile_write_done(task):
+    _profile_writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[Profile] Failed to record distraction event: {task.exception()}")
+
+
+@app.websocket("/ws/phone-detect")
+async def phone_detect_ws(websocket: WebSocket):
+    """Accepts JPEG/WebP frames and replies with JSON detections.
+
+    Frames may be binary (16-byte header + raw image bytes, see src/vision/protocol.py)
+    or legacy JSON text: {"type":"frame","frame_id":"...","image":"data:image/jpeg;base64,..."}
+    Response: {"type":"detection","frame_id":...,"frame_width":W,"frame_height":H,
+    "detections":[{class,confidence,bbox,bbox_px}],"dropped":{...}}
+    holding only TARGET_CLASSES boxes above CONF_THRESHOLD.  With ?layout=compact
+    the reply carries "layout":"compact" and columnar detections instead:
+    {"xyxy":[[x1,y1,x2,y2],...],"conf":[...],"cls":[...],"names":{cls:name}}.
+    ?raw=1 adds the unfiltered boxes as "raw_detections" in the same layout
+    (TARGET_CLASSES only when PHONE_DETECT_LEAN=1).
+    Binary frames also get "client_timestamp" echoed back.
+
+    Only the newest frame is processed: frames that arrive while inference is
+    busy replace each other, and frames older than LATE_DROP_SEC are skipped.
+    "dropped" carries the connection's running received/superseded/stale counts,
+    plus frames skipped for going over the per-user PHONE_DETECT_USER_FPS cap.
+    With PHONE_DETECT_MOTION_GATE=1, frames with no meaningful motion since the
+    last inference reuse its detections; "motion" reports whether this one did, plus skip ratio and saved ms.
+    With PHONE_DETECT_MODE=track the detector runs every PHONE_DETECT_TRACK_EVERY
+    frames and optical flow carries the boxes in between; detections then carry a
+    "track_id" column and "source" says which stage produced them.
+
+    A per-connection debouncer (src/vision/distraction.py) emits
+    {"type":"distraction_started"|"distraction_ended",...} when the state flips.
+    By default each frame then only gets {"type":"status","frame_id":...,"distracted":bool}
+    plus the small "dropped", "source", "motion" and "client_timestamp" fields;
+    connect with ?detections=1 to receive the full detection message instead.
+    With ?user_id=...&session_id=..., events are appended to that LockInSession's
+    distraction_events in the user's profile.
+
+    Every frame's stages (queue, base64, imdecode, motion, infer, track,
+    postprocess, send, total) feed the latency histograms behind
+    GET /api/phone-detect/metrics; ?metrics=1 also echoes them as "timings".
+
+    Every PHONE_DETECT_CONTROL_SEC the server sends
+    {"type":"control","fps":...,"max_width":...,"max_height":...,"jpeg_quality":...}
+    from this connection's latency and the detector's measured capacity and
+    backlog (src/vision/rate_control.py); clients should follow it.
+    """
+    await websocket.accept()
+    if detector is None:
+        if detector_status["state"] == "loading":
+            await websocket.send_text(json.dumps({"type": "error", "code": "model_loading", "message": "Phone detector is still loading; retry shortly."}))
+            # 1013 "try again later": the client reconnects with backoff.
+            await websocket.close(code=1013)
+        else:
+            await websocket.send_text(json.dumps({"type": "error", "code": "model_unavailable", "message": "Phone detector model is not loaded on the server."}))
+            await websocket.close()
+        return
+
+    slot = LatestFrameSlot(max_age_sec=LATE_DROP_SEC)
+    motion_gate = motion_gate_from_env(motion_totals)
+    tracker = tracker_from_env()
+    debouncer = debouncer_from_env(wanted_ids, CONF_THRESHOLD)
+    full_detections = websocket.query_params.get("detections") in ("1", "true", "full")
+    include_raw = websocket.query_params.get("raw") in ("1", "true")
+    compact = websocket.query_params.get("layout") == "compact"
+    user_id = websocket.query_params.get("user_id")
+    session_id = websocket.query_params.get("session_id") or f"ws-{int(time.time() * 1000)}"
+    session_started = time.time()
+    conn_id = f"conn-{next(_connection_ids)}"
+    metrics = connection_metrics[conn_id] = pipeline_metrics.child()
+    include_timings = websocket.query_params.get("metrics") in ("1", "true")
+    # Fair scheduling and the frame cap apply per user; anonymous sockets count alone.
+    schedule_key = user_id or conn_id
+    _connections_per_key[schedule_key] += 1
+    rate_limited = 0
+    rate_control = rate_controller_from_env()
+    receiver = asyncio.create_task(_receive_frames(websocket, slot))
+    last_write = None
+    try:
+        while True:
+            data = await slot.get()
+            if data is None:
+                return
+
+            # Ahead of the `continue`s below, so rate-limited and failing clients hear it too.
+            if rate_control is not None and rate_control.due():
+                advice = rate_control.advise(
+                    latency_ms=metrics.quantile("total"),
+                    capacity_fps=_detector_capacity_fps(),
+                    clients=len(connection_metrics),
+                    backlog=detector_batcher.stats()["pending"],
+                    backlog_limit=len(detector_batcher.replicas) * detector_batcher.max_batch,
+                    # This socket's share of the per-user PHONE_DETECT_USER_FPS cap.
+                    fps_cap=detector_batcher.rate_limit_fps / _connections_per_key[schedule_key],
+                )
+                await websocket.send_text(json.dumps(advice))
+
+            timer = FrameTimer()
+            timer.add("queue", slot.last_wait_sec * 1000)
+            binary = isinstance(data, bytes)
+            client_ts = None
             try:
-                results = await infer_frame_async(frame)
-            except Exception as e:
-                await websocket.send_text(json.dumps({"type": "error", "code": "inference_failed", "message": str(e), "frame_id": frame_id}))
+                if binary:
+                    frame_id, _, client_ts, image_bytes = split_binary_frame(data)
+                else:
+                    with timer.stage("base64"):
+                        frame_id, image_bytes = split_json_frame(data)
+                with timer.stage("imdecode"):
+                    frame = decode_image(image_bytes, frame_id)
+            except FrameError as e:
+                await websocket.send_text(json.dumps({"type": "error", "code": e.code, "frame_id": e.frame_id}))
                 continue
 
-            results = results[0]
-            detections = []
-            raw_detections = []
-            if results.boxes and len(results.boxes) > 0:
-                for (cls_id, conf, xyxy) in zip(results.boxes.cls.tolist(), results.boxes.conf.tolist(), results.boxes.xyxy.tolist()):
-                    x1, y1, x2, y2 = xyxy
-                    w = max(0.0, x2 - x1)
-                    h = max(0.0, y2 - y1)
-                    bbox_px = {"x1": int(x1), "y1": int(y1), "x2": int(x2), "y2": int(y2)}
-                    bbox_norm = {"x": float(x1 / W), "y": float(y1 / H), "w": float(w / W), "h": float(h / H)}
-                    class_name = id2name.get(int(cls_id), str(cls_id))
-                    raw_detections.append({"class": class_name, "confidence": float(conf), "bbox": bbox_norm, "bbox_px": bbox_px})
-                    # keep only wanted classes above threshold for the existing 'detections' field
-                    if int(cls_id) in wanted_ids and conf >= CONF_THRESHOLD:
-                        detections.append({"class": class_name, "confidence": float(conf), "bbox": bbox_norm, "bbox_px": bbox_px})
-
-            resp = {"type": "detection", "frame_id": frame_id, "timestamp": int(time.time() * 1000), "frame_width": W, "frame_height": H, "detections": detections, "raw_detections": raw_detections}
-            # send response
-            await websocket.send_text(json.dumps(resp))
+            H, W = frame.shape[:2]
+            dets = None
+            if motion_gate:
+                with timer.stage("motion"):
+                    dets = motion_gate.reuse(frame)
+            reused = dets is not None
+            source = "reused" if reused else "detector"
+            if not reused and tracker is not None and not tracker.due(frame):
+                with timer.stage("track"):
+                    dets = await run_in_threadpool(tracker.propagate, frame)
+                source = "tracker"
+            elif not reused:
+                started = time.perf_counter()
+                try:
+                    with timer.stage("infer"):
+                        dets = await infer_frame_async(frame, schedule_key)
+                except RateLimited:
+                    # Over PHONE_DETECT_USER_FPS: skip this frame, the next one will do.
+                    rate_limited += 1
+                    continue
+                except Exception as e:
+                    await websocket.send_text(json.dumps({"type": "error", "code": "inference_failed", "message": str(e), "frame_id": frame_id}))
+                    continue
+                if tracker is not None:
+                    with timer.stage("track"):
+                        dets = await run_in_threadpool(tracker.observe, frame, dets)
+                if motion_gate:
+                    with timer.stage("motion"):
+                        motion_gate.update(frame, dets, (time.perf_counter() - started) * 1000)
+
+            with timer.stage("postprocess"):
+                event = debouncer.update(dets, frame.shape)
+            if event is not None:
+                await websocket.send_text(json.dumps(event))
+                if user_id:
+                    # Persist off the frame loop; chained so a start is written before its end.
+                    last_write = asyncio.create_task(_persist_distraction_event(last_write, user_id, session_id, session_started, event))
+                    _profile_writes.add(last_write)
+                    last_write.add_done_callback(_profile_write_done)
+
+            with timer.stage("postprocess"):
+                if not full_detections:
+                    resp = {"type": "status", "frame_id": frame_id, "distracted": debouncer.active}
+                else:
+                    resp = {"type": "detection", "frame_id": frame_id, "timestamp": int(time.time() * 1000), "frame_width": W, "frame_height": H}
+                    kept = dets.filter(wanted_ids, CONF_THRESHOLD)
+                    if compact:
+                        resp["layout"] = "compact"
+                        resp["detections"] = kept.to_compact(id2name)
+                        if include_raw:
+                            resp["raw_detections"] = dets.to_compact(id2name)
+                    else:
+                        resp["detections"] = kept.to_entries(id2name, W, H)
+                        if include_raw:
+                            resp["raw_detections"] = dets.to_entries(id2name, W, H)
+                    resp["distracted"] = debouncer.active
+                # Per-connection diagnostics go out with either message.
+                if binary:
+                    resp["client_timestamp"] = client_ts
+                resp["dropped"] = {**slot.drop_counts(), "rate_limited": rate_limited}
+                resp["source"] = source
+                if motion_gate:
+                    resp["motion"] = {"reused": reused, **motion_gate.stats()}
+                if include_timings:
+                    # Everything up to serialization; "send" only shows up in the metrics.
+                    resp["timings"] = timer.rounded()
+                payload = json.dumps(resp)
+            with timer.stage("send"):
+                await websocket.send_text(payload)
+            metrics.record_all(timer.finish())
 
     except WebSocketDisconnect:
         return
+    finally:
+        receiver.cancel()
+        connection_metrics.pop(conn_id, None)
+        _connections_per_key[schedule_key] -= 1
+        if not _connections_per_key[schedule_key]:
+            del _connections_per_key[schedule_key]
+            detector_batcher.forget(schedule_key)
 
 
 @app.post("/api/onboarding/architect-reply")
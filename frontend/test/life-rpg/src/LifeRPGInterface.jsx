@@ -340,6 +340,7 @@ export default function LifeRPGInterface() {
             setDitheredPreviewUrl={setDitheredPreviewUrl}
             fileInputRef={fileInputRef} 
             takePhotoRef={takePhotoRef} 
+            userId={characterSheet?.user_id}
           />
                     </div>
 
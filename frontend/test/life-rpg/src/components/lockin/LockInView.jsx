@@ -2,7 +2,10 @@ import React, { useRef, useState, useEffect, useMemo } from 'react';
 import { RotateCcw, Download, Radio, Send, Power, Video, VideoOff, Check, Play, ClipboardList, Clock, ArrowRight, Plus, Minus, Lock } from 'lucide-react';
 import GeminiMapView from './GeminiMapView';
 
-export default function LockInView({ availableQuests = [], sendFile, selectedAlgorithm, setSelectedAlgorithm, ditheredPreviewUrl, setDitheredPreviewUrl, fileInputRef, takePhotoRef }) {
+// Size of the binary /ws/phone-detect frame header (see src/vision/protocol.py)
+const FRAME_HEADER_BYTES = 16;
+
+export default function LockInView({ availableQuests = [], sendFile, selectedAlgorithm, setSelectedAlgorithm, ditheredPreviewUrl, setDitheredPreviewUrl, fileInputRef, takePhotoRef, userId }) {
   const [showSetup, setShowSetup] = useState(true);
   const [lockdownDuration, setLockdownDuration] = useState(60 * 60); // Default 1 hour in seconds
   const [lockdownTimeLeft, setLockdownTimeLeft] = useState(60 * 60);
@@ -14,7 +17,10 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
   const pendingStreamRef = useRef(null);
   const detectionWsRef = useRef(null);
   const detectionIntervalRef = useRef(null);
-  const [detectionState, setDetectionState] = useState({ detections: [] });
+  const frameIdRef = useRef(0);
+  // Frame rate / size / quality; the server adjusts these with "control" messages.
+  const frameControlRef = useRef({ fps: 3, maxWidth: 320, maxHeight: 240, quality: 0.6 });
+  const [detectionState, setDetectionState] = useState({ detections: {} });
   const [videoReady, setVideoReady] = useState(false);
   const [lastSentFrameTs, setLastSentFrameTs] = useState(0);
 
@@ -54,7 +60,7 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
   const [editingTaskText, setEditingTaskText] = useState('');
   const [phoneDetectionCount, setPhoneDetectionCount] = useState(0);
   const [showPhoneNotification, setShowPhoneNotification] = useState(false);
-  const lastPhoneDetectionRef = useRef(null);
+  const sessionIdRef = useRef(null);
   const tabs = ['lockin', 'gemini-map', 'placeholder2']; // Array of tab identifiers
   const [activeTabIndex, setActiveTabIndex] = useState(0); // Index of current tab
 
@@ -74,6 +80,8 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
       try {
         const stream = await navigator.mediaDevices.getUserMedia({ video: true });
         pendingStreamRef.current = stream;
+        // One lock-in session per camera activation; reconnects keep the same id.
+        sessionIdRef.current = `lockin-${Date.now()}`;
         setCameraActive(true);
       } catch (err) { /* camera denied */ }
     }
@@ -86,9 +94,9 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
       if (!ws || ws.readyState !== WebSocket.OPEN) return;
       if (!video || !video.videoWidth || !video.videoHeight) return;
 
-      const targetW = 320;
-      const scale = targetW / video.videoWidth;
-      const cw = targetW;
+      const { maxWidth, maxHeight, quality } = frameControlRef.current;
+      const scale = Math.min(maxWidth / video.videoWidth, maxHeight / video.videoHeight, 1);
+      const cw = Math.round(video.videoWidth * scale);
       const ch = Math.round(video.videoHeight * scale);
 
       let canvas = canvasRef.current;
@@ -100,11 +108,22 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
       canvas.height = ch;
       const ctx = canvas.getContext('2d');
       ctx.drawImage(video, 0, 0, cw, ch);
-      const dataUrl = canvas.toDataURL('image/jpeg', 0.6);
-      const frameId = `${Date.now()}`;
-      const payload = { type: 'frame', frame_id: frameId, image: dataUrl };
+      // Binary frame: 16-byte header ("LF", version, flags, frame_id, timestamp) + raw JPEG
+      const blob = await new Promise((resolve) => canvas.toBlob(resolve, 'image/jpeg', quality));
+      if (!blob || ws.readyState !== WebSocket.OPEN) return;
+      const jpeg = new Uint8Array(await blob.arrayBuffer());
+      const frame = new ArrayBuffer(FRAME_HEADER_BYTES + jpeg.length);
+      const header = new DataView(frame);
+      header.setUint8(0, 0x4c);
+      header.setUint8(1, 0x46);
+      header.setUint8(2, 1);
+      header.setUint8(3, 0);
+      frameIdRef.current = (frameIdRef.current + 1) >>> 0;
+      header.setUint32(4, frameIdRef.current, true);
+      header.setBigUint64(8, BigInt(Date.now()), true);
+      new Uint8Array(frame, FRAME_HEADER_BYTES).set(jpeg);
       setLastSentFrameTs(Date.now());
-      try { ws.send(JSON.stringify(payload)); } catch (e) { /* ignore send errors */ }
+      try { ws.send(frame); } catch (e) { /* ignore send errors */ }
     } catch (e) { /* sendFrame error */ }
   };
 
@@ -126,6 +145,11 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
     });
   };
 
+  const startFrameTimer = () => {
+    if (detectionIntervalRef.current) clearInterval(detectionIntervalRef.current);
+    detectionIntervalRef.current = setInterval(sendFrame, Math.round(1000 / frameControlRef.current.fps));
+  };
+
   const scheduleReconnect = () => {
     if (reconnectTimerRef.current) return;
     const delay = backoffRef.current;
@@ -145,20 +169,35 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
     
     setDetectionConnState('connecting');
     try {
-      const ws = new WebSocket(DETECTOR_WS_URL);
+      // detections=1: the overlay still draws boxes; distraction counting comes
+      // from the server's debounced distraction_started events.
+      const params = new URLSearchParams({ detections: '1', layout: 'compact' });
+      if (userId) params.set('user_id', userId);
+      if (sessionIdRef.current) params.set('session_id', sessionIdRef.current);
+      const ws = new WebSocket(`${DETECTOR_WS_URL}?${params}`);
       detectionWsRef.current = ws;
       
       ws.onopen = () => {
         setDetectionConnState('connected');
         backoffRef.current = 1000;
-        if (detectionIntervalRef.current) clearInterval(detectionIntervalRef.current);
-        detectionIntervalRef.current = setInterval(sendFrame, 333);
+        startFrameTimer();
       };
       
       ws.onmessage = (ev) => {
         try { 
           const msg = JSON.parse(ev.data); 
-          if (msg.type === 'detection') setDetectionState(msg); 
+          if (msg.type === 'detection') setDetectionState(msg);
+          else if (msg.type === 'control') {
+            const prevFps = frameControlRef.current.fps;
+            frameControlRef.current = { fps: msg.fps, maxWidth: msg.max_width, maxHeight: msg.max_height, quality: msg.jpeg_quality };
+            if (msg.fps !== prevFps) startFrameTimer();
+          }
+          else if (msg.type === 'distraction_started') {
+            setPhoneDetectionCount(prev => prev + 1);
+            setShowPhoneNotification(true);
+            // Auto-hide notification after 5 seconds
+            setTimeout(() => setShowPhoneNotification(false), 5000);
+          }
         } catch (e) { 
           console.debug('Failed to parse WebSocket message:', e);
         }
@@ -206,7 +245,7 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
       if (ws) { try { ws.onopen = ws.onmessage = ws.onclose = ws.onerror = null; ws.close(); } catch (e) {} detectionWsRef.current = null; }
       backoffRef.current = 1000;
       setDetectionConnState('idle');
-      setDetectionState({ detections: [] });
+      setDetectionState({ detections: {} });
     } catch (e) { console.error('stopDetection', e); }
   };
 
@@ -260,33 +299,18 @@ export default function LockInView({ availableQuests = [], sendFile, selectedAlg
     const h = video.videoHeight || canvas.clientHeight || 240;
     canvas.width = w; canvas.height = h;
     ctx.clearRect(0, 0, w, h);
-    const dets = detectionState && detectionState.detections ? detectionState.detections : [];
-    
-    // Check for phone detections
-    const phoneDetections = dets.filter(d => {
-      const className = (d.class || '').toLowerCase();
-      return className.includes('phone') || className.includes('cell phone') || className.includes('mobile phone');
-    });
-    
-    // If phone detected and camera is active, show notification and increment counter
-    if (phoneDetections.length > 0 && cameraActive) {
-      const now = Date.now();
-      // Only trigger notification if it's been at least 3 seconds since last detection (to avoid spam)
-      if (!lastPhoneDetectionRef.current || (now - lastPhoneDetectionRef.current) > 3000) {
-        lastPhoneDetectionRef.current = now;
-        setPhoneDetectionCount(prev => prev + 1);
-        setShowPhoneNotification(true);
-        // Auto-hide notification after 5 seconds
-        setTimeout(() => setShowPhoneNotification(false), 5000);
-      }
-    }
+    // layout=compact: xyxy in frame pixels, conf and cls per box (see backend/api.py)
+    const dets = (detectionState && detectionState.detections) || {};
+    const boxes = dets.xyxy || [];
+    const sx = w / (detectionState.frame_width || w);
+    const sy = h / (detectionState.frame_height || h);
     
-    dets.forEach(d => {
-      const bb = d.bbox || {};
-      const x = (bb.x || 0) * w;
-      const y = (bb.y || 0) * h;
-      const bw = (bb.w || 0) * w;
-      const bh = (bb.h || 0) * h;
+    boxes.forEach(([x1, y1, x2, y2], i) => {
+      const d = { class: (dets.names || {})[dets.cls[i]] || String(dets.cls[i]), confidence: dets.conf[i] };
+      const x = x1 * sx;
+      const y = y1 * sy;
+      const bw = (x2 - x1) * sx;
+      const bh = (y2 - y1) * sy;
       ctx.lineWidth = 3;
       // Use red color for phone detections
       const isPhone = (d.class || '').toLowerCase().includes('phone');
@@ -1,14 +1,24 @@
+import os
+import sys
 import time
 import cv2
 import numpy as np
 import base64
 import json
 import argparse
+import threading
 from ffpyplayer.player import MediaPlayer
 from ultralytics import YOLO
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from starlette.concurrency import run_in_threadpool
 
+# Repo root on sys.path for the shared tracker in src/vision
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.vision import DetectTracker, Detections, LatestValue
+
 # --- CONFIG ---
 MODEL_PATH = "yolo11s.pt" # Use "yolo11n.pt" if your computer is slow
 VIDEO_PATH = "D:\\Lock In Labs\\phone-detector\\sample_video.mp4"  # Sample video included, or replace with your own
@@ -18,6 +28,7 @@ COOLDOWN_SEC = 3.0
 LATE_DROP_SEC = 0.25
 STREAK_REQUIRED = 15
 MIN_BOX_AREA_RATIO = 0.01
+DETECT_EVERY = 5 # In --track mode, run YOLO every N frames and track in between
 # ---------------
 
 def get_screen_size():
@@ -118,119 +129,180 @@ async def ws_phone_detect(websocket: WebSocket):
     except WebSocketDisconnect:
         return
 
-def play_video_ffpy(path: str):
-    ff_opts = {
-        'out_format': 'rgb24',
-        'sync': 'audio',
-        'genpts': 1,
-        'framedrop': True,
-        'analyzeduration': 0,
-        'probesize': 32,
-        'fflags': 'nobuffer',
-    }
-    player = MediaPlayer(path, ff_opts=ff_opts)
-
-    start_wall = None
+class VideoPlayback:
+    """Full-screen video window that advances one step per call, without blocking.
+
+    The render loop calls :meth:`step` between its own frames, so detection
+    keeps running while the video plays.
+    """
+
     win = "Video"
 
-    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
-    
-    # Create dummy frame to initialize window
-    dummy = np.zeros((SCREEN_H, SCREEN_W, 3), dtype=np.uint8)
-    cv2.imshow(win, dummy)
-    cv2.waitKey(1)
+    def __init__(self, path: str):
+        ff_opts = {
+            'out_format': 'rgb24',
+            'sync': 'audio',
+            'genpts': 1,
+            'framedrop': True,
+            'analyzeduration': 0,
+            'probesize': 32,
+            'fflags': 'nobuffer',
+        }
+        self.player = MediaPlayer(path, ff_opts=ff_opts)
+        self.start_wall = None
+        # Decoded frame waiting for its presentation time: (frame_bgr, target wall time)
+        self.pending = None
+        win = self.win
+
+        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+
+        # Create dummy frame to initialize window
+        dummy = np.zeros((SCREEN_H, SCREEN_W, 3), dtype=np.uint8)
+        cv2.imshow(win, dummy)
+        cv2.waitKey(1)
+
+        # Configure window properties
+        cv2.setWindowProperty(win, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
+        try:
+            cv2.setWindowProperty(win, cv2.WND_PROP_ASPECT_RATIO, cv2.WINDOW_FREERATIO)
+        except Exception:
+            pass
 
-    # Configure window properties
-    cv2.setWindowProperty(win, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
-    try:
-        cv2.setWindowProperty(win, cv2.WND_PROP_ASPECT_RATIO, cv2.WINDOW_FREERATIO)
-    except Exception:
-        pass
+        video_width = SCREEN_W - 250
+        video_height = SCREEN_H + 100
+        x_pos = (SCREEN_W - video_width) // 2
+        y_pos = (SCREEN_H - video_height) // 2
 
-    video_width = SCREEN_W - 250 
-    video_height = SCREEN_H + 100
-    x_pos = (SCREEN_W - video_width) // 2
-    y_pos = (SCREEN_H - video_height) // 2
-    
-    cv2.resizeWindow(win, video_width, video_height)
-    cv2.moveWindow(win, x_pos, y_pos)
+        cv2.resizeWindow(win, video_width, video_height)
+        cv2.moveWindow(win, x_pos, y_pos)
 
-    try:
-        cv2.setWindowProperty(win, cv2.WND_PROP_TOPMOST, 1)
-    except Exception:
-        pass
+        try:
+            cv2.setWindowProperty(win, cv2.WND_PROP_TOPMOST, 1)
+        except Exception:
+            pass
 
-    try:
-        while True:
-            frame, val = player.get_frame()
+    def step(self) -> bool:
+        """Show the next frame if it is due; False once the video has ended."""
+        if self.pending is None:
+            frame, val = self.player.get_frame()
             if val == 'eof':
-                break
+                return False
             if frame is None:
-                time.sleep(0.005)
-                continue
+                return True
 
             img, pts = frame
-            if start_wall is None:
-                start_wall = time.time() - (pts if pts is not None else 0.0)
-
-            if pts is not None:
-                target = start_wall + pts
-                delay = target - time.time()
-                if delay < -LATE_DROP_SEC:
-                    continue
-                elif delay > 0:
-                    time.sleep(min(delay, 0.05))
+            if self.start_wall is None:
+                self.start_wall = time.time() - (pts if pts is not None else 0.0)
+            target = self.start_wall + pts if pts is not None else time.time()
+            if target - time.time() < -LATE_DROP_SEC:
+                return True
 
             w, h = img.get_size()
             bytearray_img = img.to_bytearray()[0]
             frame_bgr = np.frombuffer(bytearray_img, dtype=np.uint8).reshape(h, w, 3)
-            frame_bgr = cv2.cvtColor(frame_bgr, cv2.COLOR_RGB2BGR)
+            self.pending = (cv2.cvtColor(frame_bgr, cv2.COLOR_RGB2BGR), target)
 
-            cv2.imshow(win, frame_bgr)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-    finally:
-        player.close_player()
+        frame_bgr, target = self.pending
+        if time.time() >= target:
+            cv2.imshow(self.win, frame_bgr)
+            self.pending = None
+        return True
+
+    def close(self):
+        self.player.close_player()
         try:
-            cv2.setWindowProperty(win, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
+            cv2.setWindowProperty(self.win, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
         except Exception:
             pass
-        cv2.destroyWindow(win)
+        cv2.destroyWindow(self.win)
 
 
-def run_local():
-    """Run the original webcam-based demo loop."""
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        raise RuntimeError("Could not open webcam")
-
+def play_video_ffpy(path: str):
+    """Play ``path`` to the end (or 'q'), blocking the caller."""
+    playback = VideoPlayback(path)
     try:
-        try:
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        except Exception:
-            pass
+        while playback.step():
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        playback.close()
 
-        print("[INFO] Press 'q' to quit")
-        last_trigger = 0
-        streak_hits = 0
 
-        while True:
+def draw_tracks(frame, dets):
+    """Draw tracked boxes with their IDs (used instead of results.plot() in track mode)."""
+    for (x1, y1, x2, y2), cls_id, conf, track_id in zip(dets.xyxy.astype(int).tolist(), dets.cls.tolist(), dets.conf.tolist(), dets.ids.tolist()):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 200, 255), 2)
+        label = f"#{track_id} {id2name.get(cls_id, cls_id)} {conf:.2f}"
+        cv2.putText(frame, label, (x1, max(12, y1 - 6)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 1)
+    return frame
+
+
+class StageRate:
+    """Frames per second through one pipeline stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def tick(self):
+        self.count += 1
+
+    def fps(self):
+        return self.count / max(time.perf_counter() - self.started, 1e-9)
+
+
+def capture_loop(cap, frames, stop, rate):
+    """Capture stage: keep only the newest webcam frame in ``frames``."""
+    try:
+        while not stop.is_set():
             ret, frame = cap.read()
             if not ret:
                 break
+            frames.put(frame)
+            rate.tick()
+    finally:
+        stop.set()
+        frames.close()
+
+
+def detect_loop(frames, rendered, stop, video_active, rate, track=False, detect_every=DETECT_EVERY, show=True):
+    """Inference stage: detect (or track), debounce and trigger the video.
+
+    Runs as fast as the model allows on whichever frame is newest.  Results
+    go to ``rendered`` only when a window shows them; drawing is left to the
+    render stage.
+    """
+    last_trigger = 0
+    streak_hits = 0
+    tracker = DetectTracker(detect_every=detect_every) if track else None
+    try:
+        while not stop.is_set():
+            frame = frames.get(timeout=0.1)
+            if frame is None:
+                continue
 
             H, W = frame.shape[:2]
             frame_area = float(H * W)
 
-            results = model(frame, verbose=False)[0]
-            annotated = results.plot()
+            results = None
+            if tracker is None or tracker.due(frame):
+                results = model(frame, verbose=False)[0]
+                dets = Detections.from_results(results)
+                if tracker is not None:
+                    dets = tracker.observe(frame, dets)
+                    results = None
+            else:
+                dets = tracker.propagate(frame)
+            rate.tick()
+            if show:
+                rendered.put((frame, dets, results))
 
             # Check for phone detection with size filter
             hit = False
-            if results.boxes and len(results.boxes) > 0:
-                for (cls_id, conf, xyxy) in zip(results.boxes.cls.tolist(),
-                                                results.boxes.conf.tolist(),
-                                                results.boxes.xyxy.tolist()):
+            if len(dets) > 0:
+                for (cls_id, conf, xyxy) in zip(dets.cls.tolist(),
+                                                dets.conf.tolist(),
+                                                dets.xyxy.tolist()):
                     if cls_id in wanted_ids and conf >= CONF_THRESHOLD:
                         x1, y1, x2, y2 = xyxy
                         box_area = max(0.0, (x2 - x1)) * max(0.0, (y2 - y1))
@@ -245,19 +317,98 @@ def run_local():
                 streak_hits = 0
 
             now = time.time()
-            if streak_hits >= STREAK_REQUIRED and (now - last_trigger) > COOLDOWN_SEC:
+            if streak_hits >= STREAK_REQUIRED and (now - last_trigger) > COOLDOWN_SEC and not video_active.is_set():
                 last_trigger = now
                 streak_hits = 0
-                print("[EVENT] Phone detected → playing video.")
-                play_video_ffpy(VIDEO_PATH)   # blocks until video is done (or 'q')
+                print("[EVENT] Phone detected" + (" → playing video." if show else "."))
+                if show:
+                    video_active.set()
+    finally:
+        stop.set()
+        rendered.close()
+
+
+def render_loop(rendered, stop, video_active):
+    """Render stage (main thread, where OpenCV windows must live)."""
+    playback = None
+    try:
+        while not stop.is_set():
+            item = rendered.get(timeout=0.005 if playback is not None else 0.03)
+            if item is not None:
+                frame, dets, results = item
+                annotated = results.plot() if results is not None else draw_tracks(frame.copy(), dets)
+                cv2.imshow("YOLOv11 Realtime Detection", annotated)
+
+            if video_active.is_set() and playback is None:
+                playback = VideoPlayback(VIDEO_PATH)
+            if playback is not None and not playback.step():
+                playback.close()
+                playback = None
+                video_active.clear()
 
-            cv2.imshow("YOLOv11 Realtime Detection", annotated)
             if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+                if playback is None:
+                    break
+                # 'q' during the video only stops the video
+                playback.close()
+                playback = None
+                video_active.clear()
+    finally:
+        if playback is not None:
+            playback.close()
+
+
+def run_local(track=False, detect_every=DETECT_EVERY, show=True):
+    """Run the webcam demo as a capture → inference → render pipeline.
+
+    Each stage has its own thread and hands over only its newest output, so
+    a slow stage drops frames instead of holding up the others: detection
+    runs as fast as the model allows and the video plays without pausing it.
+    With ``track`` the model only runs every ``detect_every`` frames (or when
+    a track is lost) and optical flow follows the boxes in between.  Without
+    ``show`` nothing is drawn or displayed and events are only printed.
+    """
+    cap = cv2.VideoCapture(0)
+    if not cap.isOpened():
+        raise RuntimeError("Could not open webcam")
 
+    try:
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    except Exception:
+        pass
+
+    frames, rendered = LatestValue(), LatestValue()
+    stop, video_active = threading.Event(), threading.Event()
+    capture_rate, detect_rate = StageRate(), StageRate()
+    stages = [
+        threading.Thread(target=capture_loop, args=(cap, frames, stop, capture_rate), name="capture", daemon=True),
+        threading.Thread(
+            target=detect_loop,
+            args=(frames, rendered, stop, video_active, detect_rate, track, detect_every, show),
+            name="detect",
+            daemon=True,
+        ),
+    ]
+    print("[INFO] Press 'q' to quit" if show else "[INFO] Press Ctrl+C to quit")
+    for stage in stages:
+        stage.start()
+    try:
+        if show:
+            render_loop(rendered, stop, video_active)
+        else:
+            while not stop.wait(0.5):
+                pass
+    except KeyboardInterrupt:
+        pass
     finally:
+        stop.set()
+        for stage in stages:
+            stage.join(timeout=5)
         cap.release()
-        cv2.destroyAllWindows()
+        if show:
+            cv2.destroyAllWindows()
+        print(f"[INFO] Capture {capture_rate.fps():.1f} fps, detection {detect_rate.fps():.1f} fps "
+              f"({frames.superseded} camera frames skipped)")
 
 
 def main():
@@ -265,14 +416,22 @@ def main():
     parser.add_argument("--server", action="store_true", help="Run as a FastAPI WebSocket server instead of local webcam demo")
     parser.add_argument("--host", default="127.0.0.1", help="Host to bind the server")
     parser.add_argument("--port", type=int, default=9001, help="Port for the WebSocket server")
+    parser.add_argument("--track", action="store_true", help="Local mode: detect every N frames and track in between")
+    parser.add_argument("--detect-every", type=int, default=DETECT_EVERY, help="Frames between detector runs in --track mode")
+    parser.add_argument("--no-window", action="store_true", help="Local mode: skip drawing and display, only print events")
+    parser.add_argument("--shm-serve", metavar="ADDRESS", help="Serve the detector to backend/api.py over shared memory (host:port or socket path; needs PHONE_DETECT_AUTHKEY)")
     args = parser.parse_args()
 
-    if args.server:
+    if args.shm_serve:
+        from src.vision import authkey_from_env, detector_from_env, parse_address, serve_forever
+        print(f"[INFO] Serving detector over shared memory on {args.shm_serve}")
+        serve_forever(parse_address(args.shm_serve), detector_from_env(MODEL_PATH, process=""), authkey_from_env())
+    elif args.server:
         import uvicorn
         print(f"[INFO] Starting phone-detector server on {args.host}:{args.port}")
         uvicorn.run("phone-detector.app:app", host=args.host, port=args.port, reload=False)
     else:
-        run_local()
+        run_local(track=args.track, detect_every=args.detect_every, show=not args.no_window)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+"""Benchmark the dithering engine and check it against golden outputs.
+
+Runs every algorithm over a matrix of image sizes (64 px up to 2048x2048,
+about 4 MP), palettes and source images, recording wall time, peak traced
+memory and pixels/second.  Each case's palette indices are hashed and compared
+with tests/golden/dither_golden.json, so a faster implementation can be
+checked for bit-exactness before it replaces the current one.
+
+Everything runs offline: sources are synthetic (seeded noise and gradients)
+or images already bundled in the repo.
+
+    python scripts/bench_dithering.py                      # full matrix, check goldens
+    python scripts/bench_dithering.py --sizes 64,256 --quick
+    python scripts/bench_dithering.py --record             # rewrite the goldens
+    python scripts/bench_dithering.py --json results.json  # save measurements
+    python scripts/bench_dithering.py --parallel 1,2,4     # band-process speedup
+
+``--parallel`` times wavefront-parallel error diffusion on a poster-sized
+image (``--poster WxH``, default 2400x3600) at each worker count instead of
+running the matrix.  It checks every result against the serial output and
+reports the speedup over 1 worker, which is the serial engine.  Measured so
+far on the photo source with the noir palette:
+
+    FloydSteinberg, 1 CPU:         1: 2431 ms  2: 2426 ms (1.00x)  4: 2762 ms (0.88x)
+    Stucki, 1 CPU:                 1: 3761 ms  2: 5296 ms (0.71x)  4: 5821 ms (0.65x)
+    reported by a reviewer:        1: 2646 ms  2: 3119 ms (0.85x)  4: 3555 ms (0.74x)
+
+No crossover has been found: every measured case was slower in parallel.
+src/dithering/parallel.py explains why contiguous bands cap the usable
+concurrency at about two on a poster.  DITHER_PARALLEL_MIN_PIXELS (16 MP
+by default) keeps requests on the serial engine; lower it only for a host
+where this mode shows a speedup.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+# Ensure repo root is on sys.path so `from src...` imports work when running
+# the script directly (python scripts/bench_dithering.py)
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.dithering import ERROR_DIFFUSION_KERNELS, PALETTES, dither_indices
+from src.dithering.error_diffusion import error_diffusion_indices
+from src.dithering.parallel import parallel_error_diffusion_indices, shutdown_band_pool
+
+GOLDEN_PATH = os.path.join(ROOT, "tests", "golden", "dither_golden.json")
+
+SIZES = (64, 256, 512, 1024, 2048)
+ALGORITHMS = ("Bayer", *ERROR_DIFFUSION_KERNELS)
+BENCH_PALETTES = ("noir", "gameboy", "pico8")  # 2, 4 and 16 colours
+# 24x36 in at 100 dpi, the default size for --parallel.
+POSTER_SIZE = (2400, 3600)
+BUNDLED_IMAGES = {
+    "photo": os.path.join(ROOT, "phone-detector", "phone-detected.jpeg"),
+}
+
+
+def synthetic_image(kind, side):
+    """Deterministic side x side RGB test image."""
+    if kind == "noise":
+        rng = np.random.default_rng(side)
+        return Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8))
+    if kind == "gradient":
+        # Smooth ramps stress error accumulation far more than noise does.
+        ramp = np.linspace(0, 255, side, dtype=np.float32)
+        arr = np.stack(
+            [ramp[None, :].repeat(side, 0), ramp[:, None].repeat(side, 1), ramp[::-1][None, :].repeat(side, 0)],
+            axis=-1,
+        )
+        return Image.fromarray(arr.astype(np.uint8))
+    raise ValueError(f"Unknown synthetic image '{kind}'")
+
+
+def source_image(source, side):
+    if source in BUNDLED_IMAGES:
+        img = Image.open(BUNDLED_IMAGES[source]).convert("RGB")
+        return img.resize((side, side), Image.LANCZOS)
+    return synthetic_image(source, side)
+
+
+def sources():
+    return ["noise", "gradient", *BUNDLED_IMAGES]
+
+
+def digest(arr):
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.sha256(str(arr.shape).encode("ascii"))
+    h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def case_name(source, side, palette, algorithm):
+    return f"{source}/{side}/{palette}/{algorithm}"
+
+
+def poster_image(source, size=POSTER_SIZE):
+    """Deterministic ``size`` (w, h) RGB image built from ``source``."""
+    w, h = size
+    return source_image(source, max(w, h)).crop((0, 0, w, h))
+
+
+def run_case(img, palette, algorithm, repeat):
+    """Return (indices, best wall time in seconds, peak traced bytes)."""
+    colors = PALETTES[palette]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        idx = dither_indices(img, colors, algorithm)
+        best = min(best, time.perf_counter() - start)
+
+    # Separate, untimed pass: tracemalloc slows allocation-heavy code.
+    tracemalloc.start()
+    dither_indices(img, colors, algorithm)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return idx, best, peak
+
+
+def load_goldens():
+    if not os.path.exists(GOLDEN_PATH):
+        return {}
+    with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_goldens(goldens):
+    os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+    with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(goldens.items())), f, indent=1)
+        f.write("\n")
+
+
+def check_golden(goldens, name, input_digest, output_digest):
+    """Return 'ok', 'MISMATCH', 'missing' or 'input changed'."""
+    entry = goldens.get(name)
+    if entry is None:
+        return "missing"
+    if entry["input"] != input_digest:
+        # e.g. a different Pillow resampling the bundled photo
+        return "input changed"
+    return "ok" if entry["output"] == output_digest else "MISMATCH"
+
+
+def run(sizes, algorithms, palettes, source_names, repeat, record):
+    goldens = load_goldens()
+    results = []
+    print(f"{'case':<40} {'ms':>10} {'Mpx/s':>8} {'peak MB':>8}  golden")
+    for source in source_names:
+        for side in sizes:
+            img = source_image(source, side)
+            input_digest = digest(np.asarray(img))
+            for palette in palettes:
+                for algorithm in algorithms:
+                    name = case_name(source, side, palette, algorithm)
+                    idx, seconds, peak = run_case(img, palette, algorithm, repeat)
+                    output_digest = digest(idx.astype(np.uint8))
+                    if record:
+                        goldens[name] = {"input": input_digest, "output": output_digest}
+                        status = "recorded"
+                    else:
+                        status = check_golden(goldens, name, input_digest, output_digest)
+                    pixels = side * side
+                    results.append({
+                        "case": name,
+                        "pixels": pixels,
+                        "seconds": seconds,
+                        "pixels_per_sec": pixels / seconds,
+                        "peak_bytes": peak,
+                        "golden": status,
+                    })
+                    print(f"{name:<40} {seconds * 1000:>10.1f} {pixels / seconds / 1e6:>8.2f} {peak / 2**20:>8.1f}  {status}")
+    if record:
+        save_goldens(goldens)
+    return results
+
+
+def diffuse(arr, palette, algorithm, workers):
+    """Serial engine for 1 worker, otherwise the band engine whatever the image size."""
+    kernel = ERROR_DIFFUSION_KERNELS[algorithm]
+    if workers == 1:
+        return error_diffusion_indices(arr, palette, kernel)
+    return parallel_error_diffusion_indices(arr, palette, kernel, workers=workers)
+
+
+def run_parallel(worker_counts, algorithms, palette, source, repeat, size=POSTER_SIZE):
+    """Time error diffusion on a poster at each worker count; return results."""
+    img = poster_image(source, size)
+    arr = np.asarray(img, dtype=np.float32)
+    pixels = img.width * img.height
+    colors = np.array(PALETTES[palette], dtype=np.float32)
+    results = []
+    print(f"{source} {img.width}x{img.height}, palette {palette}")
+    print(f"{'case':<28} {'ms':>10} {'Mpx/s':>8} {'speedup':>8}  matches serial")
+    for algorithm in algorithms:
+        if algorithm not in ERROR_DIFFUSION_KERNELS:
+            continue
+        serial = None
+        base = None
+        for workers in worker_counts:
+            # Untimed warm-up: band processes start once and are then reused.
+            diffuse(arr, colors, algorithm, workers)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                idx = diffuse(arr, colors, algorithm, workers)
+                best = min(best, time.perf_counter() - start)
+            if serial is None:
+                serial = diffuse(arr, colors, algorithm, 1)
+            base = base or best
+            same = bool((idx == serial).all())
+            name = f"{algorithm}/workers={workers}"
+            results.append({
+                "case": name,
+                "pixels": pixels,
+                "workers": workers,
+                "seconds": best,
+                "pixels_per_sec": pixels / best,
+                "speedup": base / best,
+                "golden": "ok" if same else "MISMATCH",
+            })
+            print(f"{name:<28} {best * 1000:>10.1f} {pixels / best / 1e6:>8.2f} {base / best:>7.2f}x  {'yes' if same else 'NO'}")
+    shutdown_band_pool()
+    return results
+
+
+def _csv(value, cast=str):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dithering and check golden outputs.")
+    parser.add_argument("--sizes", type=lambda v: _csv(v, int), default=list(SIZES), help="comma-separated square sides in px")
+    parser.add_argument("--algorithms", type=_csv, default=list(ALGORITHMS))
+    parser.add_argument("--palettes", type=_csv, default=list(BENCH_PALETTES))
+    parser.add_argument("--sources", type=_csv, default=sources())
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best is reported")
+    parser.add_argument("--quick", action="store_true", help="single timed run per case")
+    parser.add_argument("--record", action="store_true", help="write current outputs as the new goldens")
+    parser.add_argument("--json", help="also write measurements to this file")
+    parser.add_argument(
+        "--parallel", type=lambda v: _csv(v, int),
+        help="comma-separated worker counts; benchmark parallel error diffusion on a poster instead",
+    )
+    parser.add_argument(
+        "--poster", type=lambda v: tuple(int(n) for n in v.lower().split("x")), default=POSTER_SIZE,
+        help="WxH of the --parallel image (default %dx%d)" % POSTER_SIZE,
+    )
+    args = parser.parse_args()
+
+    repeat = 1 if args.quick else args.repeat
+    if args.parallel:
+        results = run_parallel(args.parallel, args.algorithms, args.palettes[0], args.sources[0], repeat, args.poster)
+    else:
+        results = run(args.sizes, args.algorithms, args.palettes, args.sources, repeat, args.record)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    mismatches = [r["case"] for r in results if r["golden"] == "MISMATCH"]
+    if mismatches:
+        print(f"\n{len(mismatches)} case(s) differ from the golden outputs:")
+        for name in mismatches:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
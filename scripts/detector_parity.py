@@ -0,0 +1,99 @@
+"""Check an exported detector backend or a cascade against the PyTorch path.
+
+Runs the original .pt weights and the candidate over the same images and
+reports how well the candidate's boxes match (per class, by IoU), plus the
+CPU time per frame of each.  The export is created and cached on first
+use, just like in the API.  ``--cascade`` puts a fast model in front of
+the weights, as ``PHONE_DETECT_CASCADE`` does (see src/vision/cascade.py),
+to show the accuracy vs CPU-time trade-off of a band.
+
+    python scripts/detector_parity.py --backend onnx
+    python scripts/detector_parity.py --backend openvino --int8 --images a.jpg b.jpg
+    python scripts/detector_parity.py --cascade yolo11n.pt --band 0.1
+    python scripts/detector_parity.py --cascade 320 --backend onnx
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+# Ensure repo root is on sys.path so `from src...` imports work when running
+# the script directly (python scripts/detector_parity.py)
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.vision import CascadeDetector, compare_detections, load_detector
+
+DEFAULT_WEIGHTS = os.path.join(ROOT, "phone-detector", "yolo11s.pt")
+DEFAULT_IMAGES = [os.path.join(ROOT, "phone-detector", "phone-detected.jpeg")]
+TARGET_CLASSES = {"cell phone", "remote"}
+
+
+def timed_predict(detector, frames):
+    """Per-frame predictions (as the API sees them) and CPU ms per frame."""
+    started = time.process_time()
+    dets = [detector.predict([frame])[0] for frame in frames]
+    return dets, (time.process_time() - started) * 1000 / len(frames)
+
+
+def load_cascade(args, class_ids):
+    if args.cascade.isdigit():
+        fast = load_detector(args.weights, args.backend, int8=args.int8, imgsz=int(args.cascade))
+    else:
+        fast_weights = args.cascade if os.path.dirname(args.cascade) else os.path.join(os.path.dirname(args.weights), args.cascade)
+        fast = load_detector(fast_weights, args.backend, int8=args.int8, imgsz=args.imgsz)
+    accurate = load_detector(args.weights, args.backend, int8=args.int8, imgsz=args.imgsz)
+    return CascadeDetector(fast, accurate, class_ids, args.min_conf, band=args.band)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a detector backend or cascade with PyTorch.")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default="torch")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--cascade", help="fast model in front of --weights: a weights file or a smaller imgsz")
+    parser.add_argument("--band", type=float, default=0.1, help="cascade uncertainty band around --min-conf")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--min-conf", type=float, default=0.2)
+    parser.add_argument("--min-recall", type=float, default=0.9, help="exit non-zero below this recall")
+    args = parser.parse_args()
+    if args.backend == "torch" and not args.cascade:
+        parser.error("nothing to compare: pass --backend onnx|openvino and/or --cascade")
+
+    frames = [cv2.imread(path) for path in args.images]
+    missing = [path for path, frame in zip(args.images, frames) if frame is None]
+    if missing:
+        sys.exit(f"Could not read: {missing}")
+
+    reference = load_detector(args.weights, "torch", imgsz=args.imgsz)
+    class_ids = {i for i, n in reference.names.items() if n in TARGET_CLASSES}
+    if args.cascade:
+        # Same confidence floor as the cascade's accurate model.
+        reference.restrict(None, args.min_conf)
+        candidate = load_cascade(args, class_ids)
+    else:
+        candidate = load_detector(args.weights, args.backend, int8=args.int8, imgsz=args.imgsz)
+
+    ref_dets, ref_cpu_ms = timed_predict(reference, frames)
+    cand_dets, cand_cpu_ms = timed_predict(candidate, frames)
+    report = {
+        "backend": args.backend + ("-int8" if args.int8 else ""),
+        "all_classes": compare_detections(ref_dets, cand_dets, min_conf=args.min_conf),
+        "target_classes": compare_detections(ref_dets, cand_dets, min_conf=args.min_conf, class_ids=class_ids),
+        "cpu_ms_per_frame": {"reference": round(ref_cpu_ms, 1), "candidate": round(cand_cpu_ms, 1)},
+    }
+    if args.cascade:
+        report["cascade"] = {"fast": args.cascade, **candidate.stats()}
+    print(json.dumps(report, indent=2))
+    if report["target_classes"]["recall"] < args.min_recall:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from .error_diffusion import (
+    ERROR_DIFFUSION_KERNELS,
+    error_diffusion_dither,
+    error_diffusion_indices,
+)
+from .parallel import default_workers, parallel_error_diffusion_indices
+from .ordered import (
+    BAYER_ORDERS,
+    bayer_matrix,
+    luminance_ramp,
+    ordered_dither,
+    ordered_palette_indices,
+    threshold_map,
+)
+from .cache import DitherCache, cache_from_env, cache_key
+from .renditions import AVATAR_SIZES, decode_renditions, open_downscaled, resize_renditions
+from .pool import ImageJobPool, PoolSaturated, SharedBytes, free_shared, pool_from_env
+from .encoding import DEFAULT_PNG_COMPRESS_LEVEL, OUTPUT_FORMATS, encode_indexed, png_bit_depth, zip_bundle
+from .jobs import (
+    decode_sizes,
+    dither_indices,
+    dither_pil,
+    normalize_algorithm,
+    render_pixels,
+    render_png,
+    render_renditions,
+)
+from .palettes import PALETTES, PaletteLUT, palette_lut, register_palette
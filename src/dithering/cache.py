@@ -0,0 +1,137 @@
+"""Content-addressed cache for dithered images.
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus every parameter
+that changes the output (algorithm, palette, output size, Bayer order), so a
+re-upload of the same photo is served straight from the stored PNG without
+decoding it again.  A bounded in-memory LRU sits in front of an optional
+on-disk tier under ``data/``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Same folder src.storage keeps profiles in.
+DATA_DIR = "data"
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(
+    data: bytes,
+    algorithm: str,
+    palette: Iterable[Tuple[int, int, int]],
+    size: Optional[int] = None,
+    order: Optional[int] = None,
+    fmt: str = "png",
+    compress_level: Optional[int] = None,
+) -> str:
+    """Return the cache key for one dither request.
+
+    The key ends in the output format, which doubles as the disk file suffix.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    palette_part = "-".join("%02x%02x%02x" % tuple(c) for c in palette)
+    params = f"{algorithm}|{palette_part}|{size or 'full'}|{order or ''}|{compress_level}"
+    return f"{digest}.{hashlib.sha256(params.encode('utf-8')).hexdigest()[:16]}.{fmt}"
+
+
+class DitherCache:
+    """Thread-safe two-tier (memory LRU + optional disk) store of encoded image bytes."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        # Fan out on the first byte of the input digest to keep folders small.
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _remember(self, key: str, value: bytes) -> None:
+        # Caller holds the lock.
+        if len(value) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    value = f.read()
+            except OSError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(value)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"[DitherCache] Failed to write {path}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.disk_dir),
+            }
+
+
+def cache_from_env() -> DitherCache:
+    """Build the cache from ``DITHER_CACHE_MAX_BYTES`` / ``DITHER_CACHE_DISK``.
+
+    Set ``DITHER_CACHE_DISK=1`` to persist entries under ``data/dither_cache``.
+    """
+    max_bytes = int(os.getenv("DITHER_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    disk = os.getenv("DITHER_CACHE_DISK", "").lower() in ("1", "true", "yes")
+    disk_dir = os.path.join(DATA_DIR, "dither_cache") if disk else None
+    return DitherCache(max_bytes=max_bytes, disk_dir=disk_dir)
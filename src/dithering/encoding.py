@@ -0,0 +1,71 @@
+"""Compact encoders for dithered output.
+
+A dithered image only ever contains palette colours, so it is stored as a
+palette-mode image: a 1-bit PNG for two-colour palettes (2/4-bit for up to
+4/16 colours) instead of 24-bit RGB.  Lossless WebP is offered as an
+alternative for clients that accept it.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import zipfile
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Output format name -> MIME type
+OUTPUT_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+DEFAULT_PNG_COMPRESS_LEVEL = int(os.getenv("DITHER_PNG_COMPRESS_LEVEL", 6))
+
+
+def png_bit_depth(n_colors: int) -> int:
+    """Smallest PNG palette bit depth that can hold ``n_colors`` entries."""
+    for bits in (1, 2, 4):
+        if n_colors <= 1 << bits:
+            return bits
+    return 8
+
+
+def indexed_image(indices: np.ndarray, palette: Sequence[Tuple[int, int, int]]) -> Image.Image:
+    """Build a palette-mode image from an HxW array of palette indices."""
+    img = Image.fromarray(np.asarray(indices, dtype=np.uint8), mode="P")
+    img.putpalette([v for color in palette for v in color])
+    return img
+
+
+def encode_indexed(
+    indices: np.ndarray,
+    palette: Sequence[Tuple[int, int, int]],
+    fmt: str = "png",
+    compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL,
+) -> bytes:
+    """Encode palette indices as a palette PNG or lossless WebP."""
+    img = indexed_image(indices, palette)
+    out = io.BytesIO()
+    if fmt == "webp":
+        # WebP has no palette mode; lossless keeps the colours exact anyway.
+        img.convert("RGB").save(out, format="WEBP", lossless=True, quality=100, method=4)
+    elif fmt == "png":
+        img.save(out, format="PNG", bits=png_bit_depth(len(palette)), compress_level=compress_level)
+    else:
+        raise ValueError(f"Unsupported output format '{fmt}'")
+    return out.getvalue()
+
+
+def zip_bundle(files: Dict[str, bytes]) -> bytes:
+    """Pack ``{name: bytes}`` into a zip archive.
+
+    Entries are stored uncompressed: PNG and WebP are already deflated.
+    """
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return out.getvalue()
@@ -0,0 +1,199 @@
+"""Error-diffusion dithering driven by kernel descriptions.
+
+A kernel is a tuple of ``(dy, dx, weight)`` taps: the quantization error of
+pixel ``(y, x)`` is pushed to ``(y + dy, x + dx)`` scaled by ``weight``.
+Taps always point "forward" (``dy > 0``, or ``dy == 0`` and ``dx > 0``).
+
+Instead of walking pixels one at a time, the engine processes the image as a
+skewed wavefront: at step ``t`` it quantizes every pixel with
+``x == t - lag * y`` in a single batch of NumPy operations.  With
+``lag = 2 * max|dx| + 1`` every pixel's sources are finished before it is
+read and each target receives its contributions in exactly the same order as
+the classic row-major scan, so the output is bit-identical to it.  Tall
+images are processed in bands of rows to keep the skewed buffer small.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .palettes import nearest_function
+
+Kernel = Tuple[Tuple[int, int, float], ...]
+
+FLOYD_STEINBERG_KERNEL: Kernel = (
+    (0, 1, 7 / 16),
+    (1, -1, 3 / 16),
+    (1, 0, 5 / 16),
+    (1, 1, 1 / 16),
+)
+
+ATKINSON_KERNEL: Kernel = (
+    (0, 1, 1 / 8),
+    (0, 2, 1 / 8),
+    (1, -1, 1 / 8),
+    (1, 0, 1 / 8),
+    (1, 1, 1 / 8),
+    (2, 0, 1 / 8),
+)
+
+SIERRA3_KERNEL: Kernel = (
+    (0, 1, 5 / 32),
+    (0, 2, 3 / 32),
+    (1, -2, 2 / 32),
+    (1, -1, 4 / 32),
+    (1, 0, 5 / 32),
+    (1, 1, 4 / 32),
+    (1, 2, 2 / 32),
+    (2, -1, 2 / 32),
+    (2, 0, 3 / 32),
+    (2, 1, 2 / 32),
+)
+
+STUCKI_KERNEL: Kernel = (
+    (0, 1, 8 / 42),
+    (0, 2, 4 / 42),
+    (1, -2, 2 / 42),
+    (1, -1, 4 / 42),
+    (1, 0, 8 / 42),
+    (1, 1, 4 / 42),
+    (1, 2, 2 / 42),
+    (2, -2, 1 / 42),
+    (2, -1, 2 / 42),
+    (2, 0, 4 / 42),
+    (2, 1, 2 / 42),
+    (2, 2, 1 / 42),
+)
+
+BURKES_KERNEL: Kernel = (
+    (0, 1, 8 / 32),
+    (0, 2, 4 / 32),
+    (1, -2, 2 / 32),
+    (1, -1, 4 / 32),
+    (1, 0, 8 / 32),
+    (1, 1, 4 / 32),
+    (1, 2, 2 / 32),
+)
+
+# Rows per skewed working buffer; bounds scratch memory on very tall images.
+DEFAULT_BAND_ROWS = 256
+
+# Smallest image handed to the parallel engine.  Parallel bands have not beaten
+# the serial engine at any size measured so far (up to a 2400x3600 poster; see
+# scripts/bench_dithering.py --parallel), so the default sits well above that.
+# Lower it only once the bench shows a win on the host.
+PARALLEL_MIN_PIXELS = int(os.getenv("DITHER_PARALLEL_MIN_PIXELS", 16_000_000))
+
+# Algorithm names as sent by the frontend avatar picker.
+ERROR_DIFFUSION_KERNELS: Dict[str, Kernel] = {
+    "FloydSteinberg": FLOYD_STEINBERG_KERNEL,
+    "Atkinson": ATKINSON_KERNEL,
+    "Sierra": SIERRA3_KERNEL,
+    "Stucki": STUCKI_KERNEL,
+    "Burkes": BURKES_KERNEL,
+}
+
+
+def kernel_extent(kernel: Kernel) -> Tuple[int, int]:
+    """Return ``(max_dy, max_abs_dx)`` for a kernel."""
+    max_dy = max(dy for dy, _, _ in kernel)
+    max_dx = max(abs(dx) for _, dx, _ in kernel)
+    return max_dy, max_dx
+
+
+def wavefront_lag(kernel: Kernel) -> int:
+    """Column skew between consecutive rows that keeps the scan order exact."""
+    _, max_dx = kernel_extent(kernel)
+    return 2 * max_dx + 1
+
+
+def _diffuse_band(work: np.ndarray, out: np.ndarray, y0: int, y1: int, palette: np.ndarray, kernel: Kernel) -> None:
+    """Quantize rows ``y0:y1`` of ``work`` in place along a skewed wavefront.
+
+    The band is copied into a skewed buffer indexed ``[x + lag * y, y]`` so
+    that each wavefront, and each tap's target, is a contiguous slice.  The
+    ``max_dy`` rows below the band ride along as carry rows: they collect the
+    band's error and are written back to ``work`` for the next band.
+    """
+    h, w, _ = work.shape
+    max_dy, max_dx = kernel_extent(kernel)
+    lag = 2 * max_dx + 1
+    lookup = nearest_function(palette)
+    rows = y1 - y0
+    carry = min(max_dy, h - y1)
+    steps = w + lag * (rows - 1)
+
+    # Taps that fall off the image land in cells that are never read back,
+    # which matches dropping them.
+    skew = np.zeros((steps + max_dx + lag * max_dy + 1, rows + max_dy, 3), dtype=np.float32)
+    for r in range(rows + carry):
+        skew[lag * r:lag * r + w, r] = work[y0 + r]
+    idx_skew = np.zeros(skew.shape[:2], dtype=np.intp)
+
+    # Taps sharing a weight share one scaled error array per step.
+    weighted_taps: Dict[float, list] = {}
+    for dy, dx, weight in kernel:
+        weighted_taps.setdefault(weight, []).append((dx + lag * dy, dy))
+    taps = [(np.float32(weight), offsets) for weight, offsets in weighted_taps.items()]
+
+    for t in range(steps):
+        r_lo = max(0, -((w - 1 - t) // lag))
+        r_hi = min(rows - 1, t // lag) + 1
+        cur = skew[t, r_lo:r_hi]
+
+        idx = lookup(cur)
+        nearest = palette[idx]
+        err = cur - nearest
+        cur[...] = nearest
+        for weight, offsets in taps:
+            scaled = err * weight
+            for dt, dy in offsets:
+                skew[t + dt, r_lo + dy:r_hi + dy] += scaled
+        idx_skew[t, r_lo:r_hi] = idx
+
+    for r in range(rows):
+        out[y0 + r] = idx_skew[lag * r:lag * r + w, r]
+    for r in range(rows, rows + carry):
+        work[y0 + r] = skew[lag * r:lag * r + w, r]
+
+
+def error_diffusion_indices(
+    arr: np.ndarray,
+    palette: np.ndarray,
+    kernel: Kernel,
+    band_rows: int = DEFAULT_BAND_ROWS,
+    workers: int = 1,
+) -> np.ndarray:
+    """Dither ``arr`` (HxWx3) and return the HxW palette index of every pixel.
+
+    With ``workers > 1`` large images are split across processes (see
+    :mod:`.parallel`); the output is identical either way.
+    """
+    h, w, _ = arr.shape
+    pal = np.asarray(palette, dtype=np.float32)
+    if workers > 1 and h * w >= PARALLEL_MIN_PIXELS:
+        from .parallel import parallel_error_diffusion_indices
+
+        return parallel_error_diffusion_indices(arr, pal, kernel, workers=workers)
+    work = np.array(arr, dtype=np.float32)
+    out = np.empty((h, w), dtype=np.intp)
+    for y0 in range(0, h, band_rows):
+        _diffuse_band(work, out, y0, min(h, y0 + band_rows), pal, kernel)
+    return out
+
+
+def error_diffusion_dither(
+    pil_img: Image.Image,
+    palette: Sequence[Tuple[int, int, int]],
+    kernel: Kernel,
+    workers: int = 1,
+) -> Image.Image:
+    """Dither an RGB PIL image to ``palette`` using an error-diffusion kernel."""
+    arr = np.asarray(pil_img, dtype=np.float32)
+    pal = np.array(palette, dtype=np.float32)
+    idx = error_diffusion_indices(arr, pal, kernel, workers=workers)
+    return Image.fromarray(pal.astype(np.uint8)[idx])
@@ -0,0 +1,130 @@
+"""Self-contained dither jobs that can run in a worker process.
+
+Everything here takes and returns plain bytes / tuples so it can be shipped
+to an :class:`~src.dithering.pool.ImageJobPool` worker without dragging the
+FastAPI app (and its vision stack) into the child process.
+"""
+
+from __future__ import annotations
+
+import io
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .encoding import DEFAULT_PNG_COMPRESS_LEVEL, encode_indexed
+from .error_diffusion import ERROR_DIFFUSION_KERNELS, error_diffusion_indices
+from .ordered import ordered_palette_indices
+from .pool import SharedBytes, free_shared, read_payload, share_bytes
+from .renditions import decode_renditions
+
+Palette = Sequence[Tuple[int, int, int]]
+
+
+def normalize_algorithm(algorithm: str) -> str:
+    """Map unknown algorithm names to the Floyd-Steinberg default."""
+    if algorithm == "Bayer" or algorithm in ERROR_DIFFUSION_KERNELS:
+        return algorithm
+    return "FloydSteinberg"
+
+
+def dither_indices(pil_img: Image.Image, palette: Palette, algorithm: str, order: int = 8, workers: int = 1) -> np.ndarray:
+    """Dither a decoded RGB image with the named algorithm; return palette indices.
+
+    ``workers > 1`` splits error diffusion on large images across that many
+    band processes; callers get the count from the image pool's budget.
+    """
+    algorithm = normalize_algorithm(algorithm)
+    if algorithm == "Bayer":
+        return ordered_palette_indices(np.asarray(pil_img, dtype=np.uint8), palette, order)
+    arr = np.asarray(pil_img, dtype=np.float32)
+    return error_diffusion_indices(arr, palette, ERROR_DIFFUSION_KERNELS[algorithm], workers=workers)
+
+
+def dither_pil(pil_img: Image.Image, palette: Palette, algorithm: str, order: int = 8, workers: int = 1) -> Image.Image:
+    """Dither a decoded RGB image with the named algorithm."""
+    idx = dither_indices(pil_img, palette, algorithm, order=order, workers=workers)
+    return Image.fromarray(np.array(palette, dtype=np.uint8)[idx])
+
+
+def render_png(
+    payload,
+    palette: Palette,
+    algorithm: str,
+    order: int = 8,
+    fmt: str = "png",
+    compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL,
+    workers: int = 1,
+) -> bytes:
+    """Decode ``payload``, dither it at full size and return encoded bytes.
+
+    Output is a palette PNG by default; ``fmt="webp"`` gives lossless WebP.
+    """
+    pil = Image.open(io.BytesIO(read_payload(payload))).convert("RGB")
+    idx = dither_indices(pil, palette, algorithm, order=order, workers=workers)
+    return encode_indexed(idx, palette, fmt, compress_level)
+
+
+def render_renditions(
+    payload,
+    palette: Palette,
+    algorithm: str,
+    sizes: Sequence[int],
+    order: int = 8,
+    fmt: str = "png",
+    compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL,
+    workers: int = 1,
+) -> Dict[int, bytes]:
+    """Decode ``payload`` at reduced scale and return ``{size: encoded bytes}``."""
+    return {
+        size: encode_indexed(
+            dither_indices(resized, palette, algorithm, order=order, workers=workers),
+            palette,
+            fmt,
+            compress_level,
+        )
+        for size, resized in decode_renditions(read_payload(payload), sizes).items()
+    }
+
+
+def decode_sizes(payload, sizes: Sequence[Optional[int]]) -> Dict[Optional[int], Tuple[int, int, SharedBytes]]:
+    """Decode ``payload`` and place raw RGB pixels for every size in shared memory.
+
+    Values are ``(width, height, handle)``; a size of ``None`` means the
+    original resolution.  Bounded sizes are decoded at reduced scale exactly
+    as :func:`render_renditions` does, so both agree under one cache key.
+    Only the handles go back through the pool; the caller passes them to
+    :func:`render_pixels` and frees them with :func:`~.pool.free_shared`.
+    """
+    data = read_payload(payload)
+    decoded = {}
+    try:
+        if None in sizes:
+            pil = Image.open(io.BytesIO(data)).convert("RGB")
+            decoded[None] = (pil.width, pil.height, share_bytes(pil.tobytes()))
+        for size, resized in decode_renditions(data, [size for size in sizes if size]).items():
+            decoded[size] = (resized.width, resized.height, share_bytes(resized.tobytes()))
+    except BaseException:
+        for _, _, handle in decoded.values():
+            free_shared(handle)
+        raise
+    return decoded
+
+
+def render_pixels(
+    payload,
+    width: int,
+    height: int,
+    palette: Palette,
+    algorithm: str,
+    order: int = 8,
+    fmt: str = "png",
+    compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL,
+    workers: int = 1,
+) -> bytes:
+    """Dither already-decoded RGB pixels (see :func:`decode_sizes`) and encode them."""
+    pil = Image.frombytes("RGB", (width, height), read_payload(payload))
+    idx = dither_indices(pil, palette, algorithm, order=order, workers=workers)
+    return encode_indexed(idx, palette, fmt, compress_level)
+
@@ -0,0 +1,80 @@
+"""Ordered (Bayer) dithering with memoized threshold maps.
+
+Ordered dithering has no data dependencies between pixels, so the whole
+image is compared against a tiled threshold map in one array operation.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+BAYER_ORDERS = (2, 4, 8, 16)
+
+
+@lru_cache(maxsize=None)
+def bayer_matrix(order: int) -> np.ndarray:
+    """Return the ``order`` x ``order`` Bayer index matrix (values 0..order^2-1)."""
+    if order < 1 or order & (order - 1):
+        raise ValueError(f"Bayer order must be a power of two, got {order}")
+    if order == 1:
+        mat = np.array([[0]])
+    else:
+        a = 4 * bayer_matrix(order // 2)
+        top = np.hstack((a, a + 2))
+        bottom = np.hstack((a + 3, a + 1))
+        mat = np.vstack((top, bottom))
+    mat.setflags(write=False)
+    return mat
+
+
+@lru_cache(maxsize=None)
+def threshold_map(order: int) -> np.ndarray:
+    """Return the Bayer thresholds for ``order`` on the 0..255 scale."""
+    thresholds = (bayer_matrix(order) + 0.5) / (order * order) * 255
+    thresholds.setflags(write=False)
+    return thresholds
+
+
+def ordered_dither_indices(arr: np.ndarray, n_colors: int, order: int = 8) -> np.ndarray:
+    """Return the HxW palette index of every pixel of ``arr`` (HxWx3 uint8).
+
+    Indices are steps of a ramp from dark (0) to light (``n_colors - 1``);
+    luminance is split into ``n_colors - 1`` equal steps and the threshold map
+    decides whether each pixel rounds down or up within its step.  Use
+    :func:`ordered_palette_indices` to map the steps onto a real palette.
+    """
+    h, w, _ = arr.shape
+    lum = (0.299 * arr[..., 0] + 0.587 * arr[..., 1] + 0.114 * arr[..., 2]).astype(np.uint8)
+    scaled = lum.astype(np.int32) * (n_colors - 1)
+    base, frac = np.divmod(scaled, 255)
+
+    thresholds = threshold_map(order)
+    reps = (-(-h // order), -(-w // order))
+    tiled = np.tile(thresholds, reps)[:h, :w]
+    return base + (frac > tiled)
+
+
+def luminance_ramp(palette: Sequence[Tuple[int, int, int]]) -> np.ndarray:
+    """Palette indices ordered from dark to light.
+
+    The sort is stable, so palettes that already are a ramp keep their order.
+    """
+    lum = np.asarray(palette, dtype=np.float64) @ np.array([0.299, 0.587, 0.114])
+    return np.argsort(lum, kind="stable")
+
+
+def ordered_palette_indices(arr: np.ndarray, palette: Sequence[Tuple[int, int, int]], order: int = 8) -> np.ndarray:
+    """Bayer-dither ``arr`` (HxWx3 uint8) to indices into ``palette``, in any colour order."""
+    return luminance_ramp(palette)[ordered_dither_indices(arr, len(palette), order)]
+
+
+def ordered_dither(pil_img: Image.Image, palette: Sequence[Tuple[int, int, int]], order: int = 8) -> Image.Image:
+    """Dither an RGB PIL image to ``palette`` with a Bayer threshold map."""
+    arr = np.asarray(pil_img, dtype=np.uint8)
+    pal = np.array(palette, dtype=np.uint8)
+    idx = ordered_palette_indices(arr, palette, order)
+    return Image.fromarray(pal[idx])
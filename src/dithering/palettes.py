@@ -0,0 +1,153 @@
+"""Registered palettes with precomputed nearest-colour lookup tables.
+
+Finding the nearest palette entry by brute force costs ``O(P)`` distance
+computations per pixel, which is fine for the two-colour noir palette but
+scales badly for themed palettes.  Each registered palette instead gets a
+3D lookup table over a grid of ``CELL``-sized RGB cubes: a cell stores the
+palette index when one entry is provably the nearest for every colour inside
+it, so lookup is a single indexed gather.
+
+Cells that straddle a boundary between two entries are marked ambiguous and
+their pixels are refined on demand with the exact distance computation
+(the same float32 arithmetic as the brute-force path), so results never
+differ from brute force.  The grid extends past 0..255 because error
+diffusion routinely pushes working values outside the displayable range.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+Color = Tuple[int, int, int]
+
+# Grid geometry: cells of CELL units covering [GRID_MIN, GRID_MAX) per channel.
+CELL = 8
+GRID_MIN = -256
+GRID_MAX = 512
+AMBIGUOUS = -1
+# Squared-distance margin a cell's winner must keep over every rival.
+BOUNDARY_SLACK = 4.0
+
+# Below this many colours brute force over the small per-wavefront batches
+# is as cheap as a table lookup.
+LUT_MIN_COLORS = 16
+
+PALETTES: Dict[str, List[Color]] = {
+    # Default black and cream used across the noir UI
+    "noir": [(0, 0, 0), (254, 241, 220)],
+    "gameboy": [(15, 56, 15), (48, 98, 48), (139, 172, 15), (155, 188, 15)],
+    "sepia": [(43, 29, 14), (112, 79, 46), (186, 148, 102), (250, 235, 205)],
+    "pico8": [
+        (0, 0, 0), (29, 43, 83), (126, 37, 83), (0, 135, 81),
+        (171, 82, 54), (95, 87, 79), (194, 195, 199), (255, 241, 232),
+        (255, 0, 77), (255, 163, 0), (255, 236, 39), (0, 228, 54),
+        (41, 173, 255), (131, 118, 156), (255, 119, 168), (255, 204, 170),
+    ],
+}
+
+
+def exact_nearest_indices(pixels: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """Brute-force nearest palette index for ``pixels`` (n, 3) float32."""
+    # The channel sum is spelled out so float32 rounding matches a per-pixel
+    # ``(diffs * diffs).sum()``.
+    diffs = palette[None, :, :] - pixels[:, None, :]
+    sq = diffs * diffs
+    dists = sq[..., 0] + sq[..., 1] + sq[..., 2]
+    return np.argmin(dists, axis=1)
+
+
+class PaletteLUT:
+    """Nearest-colour lookup table for one palette."""
+
+    def __init__(self, colors: Sequence[Color]):
+        self.colors = np.array(colors, dtype=np.float32)
+        self.cells_per_axis = (GRID_MAX - GRID_MIN) // CELL
+        # One ring of ambiguous cells around the grid catches out-of-range
+        # colours, so lookups need no separate bounds check.
+        n = self.cells_per_axis + 2
+        table = np.full((n, n, n), AMBIGUOUS, dtype=np.int16)
+        table[1:-1, 1:-1, 1:-1] = self._build()
+        table.setflags(write=False)
+        self.table = table.ravel()
+        self._strides = np.array([n * n, n, 1], dtype=np.intp)
+
+    def _build(self) -> np.ndarray:
+        n = self.cells_per_axis
+        pal = self.colors.astype(np.float64)
+        lo = GRID_MIN + CELL * np.arange(n, dtype=np.float64)
+        hi = lo + CELL
+        center = lo + CELL / 2
+
+        # ``d_k(p) - d_m(p)`` is linear in p, so its minimum over a cell is
+        # found per axis at one of the cell's faces.  gap[c][i, m, k] is that
+        # per-axis minimum for axis c and cell index i.
+        delta = pal[:, None, :] - pal[None, :, :]  # (m, k, c) = m - k
+        gap = [
+            2 * np.minimum(lo[:, None, None] * delta[None, :, :, c], hi[:, None, None] * delta[None, :, :, c])
+            for c in range(3)
+        ]
+        norms = (pal * pal).sum(axis=1)
+        const = norms[None, :] - norms[:, None]  # (m, k) = |k|^2 - |m|^2
+        # Centre distances are separable too; they pick each cell's candidate.
+        dist = [(center[:, None] - pal[None, :, c]) ** 2 for c in range(3)]
+
+        cols = np.arange(n)
+        table = np.empty((n, n, n), dtype=np.int16)
+        for i in range(n):
+            d = dist[0][i][None, None, :] + dist[1][:, None, :] + dist[2][None, :, :]
+            m = d.argmin(axis=2)  # (g, b)
+            margin = gap[0][i][m] + gap[1][cols[:, None], m] + gap[2][cols[None, :], m] + const[m]
+            margin[cols[:, None], cols[None, :], m] = np.inf
+            # ``m`` wins everywhere in the cell only if every rival stays
+            # clearly farther; the slack absorbs float32 rounding.
+            table[i] = np.where(margin.min(axis=2) > BOUNDARY_SLACK, m, AMBIGUOUS)
+        return table
+
+    def nearest_indices(self, pixels: np.ndarray) -> np.ndarray:
+        """Nearest palette index for ``pixels`` (n, 3) float32."""
+        coords = pixels * np.float32(1.0 / CELL)
+        coords += np.float32(1 - GRID_MIN / CELL)
+        np.clip(coords, 0, self.cells_per_axis + 1, out=coords)
+        idx = self.table[coords.astype(np.intp) @ self._strides]
+
+        refine = idx == AMBIGUOUS
+        if refine.any():
+            idx[refine] = exact_nearest_indices(pixels[refine], self.colors)
+        return idx
+
+    def quantize(self, arr: np.ndarray) -> np.ndarray:
+        """Map every pixel of ``arr`` (HxWx3) to its nearest palette colour."""
+        h, w, _ = arr.shape
+        idx = self.nearest_indices(arr.reshape(-1, 3).astype(np.float32))
+        return self.colors.astype(np.uint8)[idx].reshape(h, w, 3)
+
+
+@lru_cache(maxsize=32)
+def _lut_for(colors: Tuple[Color, ...]) -> PaletteLUT:
+    return PaletteLUT(colors)
+
+
+def palette_lut(colors: Sequence[Sequence[int]]) -> PaletteLUT:
+    """Return the (memoized) lookup table for ``colors``."""
+    return _lut_for(tuple(tuple(int(v) for v in c) for c in colors))
+
+
+def register_palette(name: str, colors: Sequence[Color]) -> None:
+    """Add a named palette and build its lookup table up front."""
+    PALETTES[name] = [tuple(c) for c in colors]
+    if len(colors) >= LUT_MIN_COLORS:
+        palette_lut(colors)
+
+
+def nearest_function(palette: np.ndarray) -> Callable[[np.ndarray], np.ndarray]:
+    """Return ``f(pixels) -> indices`` for ``palette``, resolved once per image.
+
+    Larger palettes go through their lookup table; small ones use brute force.
+    """
+    if len(palette) >= LUT_MIN_COLORS:
+        return palette_lut(palette).nearest_indices
+    pal = np.asarray(palette, dtype=np.float32)
+    return lambda pixels: exact_nearest_indices(pixels, pal)
@@ -0,0 +1,233 @@
+"""Wavefront-parallel error diffusion across worker processes.
+
+The image is split into horizontal row bands, one per process, all working on
+one padded buffer in shared memory.  Pixel ``(y, x)`` sits on global
+wavefront step ``x + lag * y`` (see :mod:`.error_diffusion`); a band may run
+step ``t`` once the band above it has finished step ``t - 1``.  Each band
+posts a semaphore every ``SYNC_STEPS`` steps and the band below consumes
+those tokens, so every pixel still sees its error contributions in row-major
+order and the result is bit-identical to the serial engine.
+
+The critical path is still ``W + lag * H`` steps, and parallelism comes from
+splitting each wavefront's rows between processes.  A wavefront only spans
+``W / lag`` rows, so with bands of ``H / workers`` rows about
+``1 + W * workers / (lag * H)`` bands are busy at once.  On a tall poster
+that is about two, whatever the worker count, and the extra copies into
+shared memory eat most of the gain.  The serial engine has won every case
+measured so far (``scripts/bench_dithering.py --parallel``), which is why
+:data:`~.error_diffusion.PARALLEL_MIN_PIXELS` keeps ordinary uploads off
+this path.
+
+Band processes are started once per calling process and reused;
+``DITHER_WORKERS`` caps how many a call may use and defaults to 1 (serial).
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .error_diffusion import Kernel, kernel_extent
+from .palettes import nearest_function
+
+# Wavefront steps a band completes between semaphore posts.  Larger values
+# mean fewer cross-process wake-ups but a longer start-up lag per band.
+SYNC_STEPS = 32
+
+# A band waiting this long on the band above gives up (that band has died).
+BAND_TIMEOUT_SEC = 60.0
+
+
+def default_workers() -> int:
+    """Worker count from ``DITHER_WORKERS`` (defaults to 1, i.e. serial)."""
+    return max(1, int(os.getenv("DITHER_WORKERS", 1)))
+
+
+def _geometry(h: int, w: int, kernel: Kernel) -> Tuple[int, int, int, int]:
+    max_dy, max_dx = kernel_extent(kernel)
+    lag = 2 * max_dx + 1
+    stride = max(w + 2 * max_dx, lag + 1)
+    return max_dy, max_dx, lag, stride
+
+
+def _band_rows(h: int, workers: int, min_rows: int) -> List[Tuple[int, int]]:
+    rows = max(min_rows, -(-h // workers))
+    return [(y0, min(h, y0 + rows)) for y0 in range(0, h, rows)]
+
+
+# Semaphores between consecutive bands, set in each band process at start-up
+# (semaphores can only be handed to a process when it is created).
+_band_sems: list = []
+
+
+def _init_band_process(sems) -> None:
+    global _band_sems
+    _band_sems = sems
+
+
+class _BandPool:
+    """Persistent band processes plus the semaphores that pace them."""
+
+    def __init__(self, size: int):
+        # Spawned rather than forked: the API calls this from a threadpool.
+        ctx = mp.get_context("spawn")
+        self.size = size
+        self.sems = [ctx.Semaphore(0) for _ in range(size - 1)]
+        self.executor = ProcessPoolExecutor(
+            max_workers=size, mp_context=ctx, initializer=_init_band_process, initargs=(self.sems,)
+        )
+
+    def shutdown(self, wait: bool) -> None:
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_band_pool: Optional[_BandPool] = None
+# One call at a time per process: the semaphores are shared by every call.
+_band_lock = threading.Lock()
+
+
+def _get_band_pool(size: int) -> _BandPool:
+    global _band_pool
+    if _band_pool is None or _band_pool.size < size:
+        shutdown_band_pool()
+        _band_pool = _BandPool(size)
+    return _band_pool
+
+
+def shutdown_band_pool(wait: bool = True) -> None:
+    """Stop this process's band processes; the next parallel call restarts them."""
+    global _band_pool
+    if _band_pool is not None:
+        _band_pool.shutdown(wait)
+        _band_pool = None
+
+
+def _run_band(
+    buf_name: str,
+    idx_name: str,
+    shape: Tuple[int, int],
+    palette: np.ndarray,
+    kernel: Kernel,
+    band: Tuple[int, int],
+    above: Optional[Tuple[int, int]],
+    index: int,
+    last: bool,
+) -> None:
+    """Diffuse rows ``band`` of the shared buffer, pacing behind ``above``."""
+    h, w = shape
+    max_dy, max_dx, lag, stride = _geometry(h, w, kernel)
+    wait_sem = _band_sems[index - 1] if above is not None else None
+    post_sem = None if last else _band_sems[index]
+    buf_shm = shared_memory.SharedMemory(name=buf_name)
+    idx_shm = shared_memory.SharedMemory(name=idx_name)
+    buf = idx_buf = cur = None
+    try:
+        n_cells = (h + max_dy) * stride
+        buf = np.ndarray((n_cells, 3), dtype=np.float32, buffer=buf_shm.buf)
+        idx_buf = np.ndarray((n_cells,), dtype=np.intp, buffer=idx_shm.buf)
+
+        step = stride - lag
+        taps = [(dy * stride + dx, np.float32(weight)) for dy, dx, weight in kernel]
+        lookup = nearest_function(palette)
+
+        y0, y1 = band
+        first = lag * y0
+        steps = w + lag * (y1 - 1) - first
+        if above is not None:
+            above_first = lag * above[0]
+            above_steps = w + lag * (above[1] - above[0] - 1)
+        tokens = 0
+
+        for t in range(first, first + steps):
+            if above is not None:
+                # The band above must have finished every step before ``t``;
+                # each token stands for SYNC_STEPS of its steps (or the rest).
+                needed = -(-min(t - above_first, above_steps) // SYNC_STEPS)
+                while tokens < needed:
+                    if not wait_sem.acquire(timeout=BAND_TIMEOUT_SEC):
+                        raise RuntimeError("band above stopped making progress")
+                    tokens += 1
+
+            y_lo = max(y0, -((w - 1 - t) // lag))
+            y_hi = min(y1 - 1, t // lag)
+            n = y_hi - y_lo + 1
+            start = y_lo * stride + (t - lag * y_lo) + max_dx
+            stop = start + (n - 1) * step + 1
+            cur = buf[start:stop:step]
+
+            idx = lookup(cur)
+            nearest = palette[idx]
+            err = cur - nearest
+            cur[...] = nearest
+            for offset, weight in taps:
+                buf[start + offset:stop + offset:step] += err * weight
+            idx_buf[start:stop:step] = idx
+
+            done = t - first + 1
+            if post_sem is not None and (done % SYNC_STEPS == 0 or done == steps):
+                post_sem.release()
+    finally:
+        # Views must be dropped before the mapping can be closed.
+        buf = idx_buf = cur = None
+        buf_shm.close()
+        idx_shm.close()
+
+
+def parallel_error_diffusion_indices(
+    arr: np.ndarray,
+    palette: np.ndarray,
+    kernel: Kernel,
+    workers: Optional[int] = None,
+) -> np.ndarray:
+    """Process-parallel equivalent of :func:`error_diffusion_indices`."""
+    h, w, _ = arr.shape
+    pal = np.asarray(palette, dtype=np.float32)
+    max_dy, max_dx, lag, stride = _geometry(h, w, kernel)
+    # Bands must be at least ``max_dy`` rows so error only flows one band down.
+    bands = _band_rows(h, workers or default_workers(), max(1, max_dy))
+
+    n_cells = (h + max_dy) * stride
+    buf_shm = shared_memory.SharedMemory(create=True, size=n_cells * 3 * 4)
+    idx_shm = shared_memory.SharedMemory(create=True, size=n_cells * np.dtype(np.intp).itemsize)
+    buf = idx_buf = None
+    try:
+        buf = np.ndarray((h + max_dy, stride, 3), dtype=np.float32, buffer=buf_shm.buf)
+        buf[...] = 0
+        buf[:h, max_dx:max_dx + w] = arr
+
+        with _band_lock:
+            pool = _get_band_pool(len(bands))
+            # Submitted top band first: a band only ever waits on one that
+            # was handed to a process before it, so this cannot deadlock.
+            futures = [
+                pool.executor.submit(
+                    _run_band, buf_shm.name, idx_shm.name, (h, w), pal, kernel, band,
+                    bands[i - 1] if i > 0 else None, i, i == len(bands) - 1,
+                )
+                for i, band in enumerate(bands)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception as e:
+                # Unconsumed tokens would desynchronise the next call.
+                for future in futures:
+                    future.cancel()
+                # The other bands may sit in a wait until BAND_TIMEOUT_SEC; don't block on them.
+                shutdown_band_pool(wait=False)
+                raise RuntimeError("parallel dithering worker failed") from e
+
+        idx_buf = np.ndarray((h + max_dy, stride), dtype=np.intp, buffer=idx_shm.buf)
+        return idx_buf[:h, max_dx:max_dx + w].copy()
+    finally:
+        buf = idx_buf = None
+        buf_shm.close()
+        buf_shm.unlink()
+        idx_shm.close()
+        idx_shm.unlink()
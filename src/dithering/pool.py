@@ -0,0 +1,252 @@
+"""Dedicated, bounded process pool for CPU-bound image jobs.
+
+Dithering used to run on Starlette's shared threadpool, where a handful of
+concurrent avatar uploads starved every other sync endpoint.  Image jobs now
+go to their own pool of worker processes with an admission limit: once
+``workers + max_queue`` jobs are in flight, :meth:`ImageJobPool.run` raises
+:class:`PoolSaturated` and the endpoint answers 503 with ``Retry-After``.
+
+Only the compressed upload crosses the process boundary; decoded pixel
+arrays are created and discarded inside the worker.  Uploads larger than
+``SHARED_MEMORY_MIN_BYTES`` are handed over in a ``shared_memory`` block
+instead of being pickled through the pool's pipe.
+
+Jobs submitted with ``bands=True`` may also split error diffusion across
+extra band processes (see :mod:`.parallel`).  Those come out of one budget of
+``band_workers`` processes shared by every in-flight job, so a parallel
+request cannot multiply the pool's CPU use by the core count.  Each job gets
+at most an even per-worker share of the budget (never fewer than 2), so
+concurrent jobs all get bands, and each worker keeps at most that many band
+processes alive.  They are stopped along with the worker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory, util
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .parallel import default_workers as default_band_workers, shutdown_band_pool
+
+SHARED_MEMORY_MIN_BYTES = 256 * 1024
+DEFAULT_RETRY_AFTER_SEC = 2
+
+
+class PoolSaturated(Exception):
+    """Raised when the image pool's queue is full."""
+
+    def __init__(self, retry_after: int = DEFAULT_RETRY_AFTER_SEC):
+        super().__init__("Image processing pool is saturated")
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class SharedBytes:
+    """Picklable handle to bytes placed in a shared-memory block."""
+
+    name: str
+    size: int
+
+
+def read_payload(payload) -> bytes:
+    """Return the bytes behind a job payload (raw bytes or :class:`SharedBytes`)."""
+    if not isinstance(payload, SharedBytes):
+        return payload
+    shm = shared_memory.SharedMemory(name=payload.name)
+    try:
+        return bytes(shm.buf[:payload.size])
+    finally:
+        shm.close()
+
+
+def _release(shm: shared_memory.SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+
+def share_bytes(data: bytes) -> SharedBytes:
+    """Copy ``data`` into a new shared-memory block and return its handle.
+
+    The block outlives the process that made it (e.g. a pool worker handing
+    decoded pixels back); whoever holds the handle frees it with :func:`free_shared`.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+    except BaseException:
+        _release(shm)
+        raise
+    shm.close()
+    return SharedBytes(shm.name, len(data))
+
+
+def free_shared(handle: SharedBytes) -> None:
+    """Unlink a block made by :func:`share_bytes`; a no-op if it is already gone."""
+    try:
+        shm = shared_memory.SharedMemory(name=handle.name)
+    except FileNotFoundError:
+        return
+    _release(shm)
+
+
+def _init_worker() -> None:
+    # Stop this worker's band processes when it exits.  The priority puts this
+    # ahead of the queue finalizers (priority 10) that flush their stop messages.
+    util.Finalize(None, shutdown_band_pool, exitpriority=100)
+
+
+class ImageJobPool:
+    """Process pool with a queue-depth limit, driven from the event loop."""
+
+    def __init__(self, workers: int, max_queue: int, retry_after: int = DEFAULT_RETRY_AFTER_SEC, band_workers: int = 1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.band_workers = band_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight = 0
+        self._bands_inflight = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.workers) + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers import only src.dithering, never the API module.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=mp.get_context("spawn"), initializer=_init_worker
+            )
+        return self._executor
+
+    @property
+    def band_share(self) -> int:
+        """Most band processes one job may lease (and one worker keeps alive)."""
+        return max(2, self.band_workers // max(1, self.workers))
+
+    def _lease_bands(self) -> int:
+        """Take band processes for one job from the shared budget (1 means serial)."""
+        grant = min(self.band_share, self.band_workers - self._bands_inflight)
+        if grant < 2:
+            return 1
+        self._bands_inflight += grant
+        return grant
+
+    def _return_bands(self, bands: int) -> None:
+        if bands > 1:
+            self._bands_inflight -= bands
+
+    async def run(self, fn, data, *args, bands: bool = False):
+        """Run ``fn(payload, *args)`` in the pool, where payload carries ``data``.
+
+        ``data`` is bytes or a :class:`SharedBytes` the caller keeps owning.
+
+        With ``bands=True`` the call becomes ``fn(payload, *args, workers=n)``,
+        ``n`` being the band processes granted from the shared budget.
+        """
+        if self._inflight >= self.capacity:
+            self.rejected += 1
+            raise PoolSaturated(self.retry_after)
+
+        self._inflight += 1
+        leased = self._lease_bands() if bands else 1
+        kwargs = {"workers": leased} if bands else {}
+        try:
+            if self.workers <= 0:
+                # Pool disabled: fall back to the shared threadpool, still bounded.
+                result = await run_in_threadpool(fn, data, *args, **kwargs)
+            else:
+                result = await self._submit(fn, data, *args, **kwargs)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._inflight -= 1
+            self._return_bands(leased)
+        self.completed += 1
+        return result
+
+    async def run_all(self, calls, bands: bool = False):
+        """Run several ``(fn, data, *args)`` calls, at most one per worker at a time.
+
+        Fanning out more jobs than the pool admits at once would get part of
+        them rejected even on an idle server.  Results come back in order,
+        with the exception in place of a failed call's result.
+        """
+        limit = asyncio.Semaphore(max(1, self.workers))
+
+        async def one(call):
+            async with limit:
+                return await self.run(*call, bands=bands)
+
+        return await asyncio.gather(*(one(call) for call in calls), return_exceptions=True)
+
+    def _submit(self, fn, data, *args, **kwargs) -> "asyncio.Future":
+        shm = None
+        payload = data
+        if not isinstance(data, SharedBytes) and len(data) >= SHARED_MEMORY_MIN_BYTES:
+            shm = shared_memory.SharedMemory(create=True, size=len(data))
+            shm.buf[:len(data)] = data
+            payload = SharedBytes(shm.name, len(data))
+        try:
+            future = self._get_executor().submit(fn, payload, *args, **kwargs)
+        except BaseException:
+            if shm is not None:
+                _release(shm)
+            raise
+        if shm is not None:
+            # Cancelling the awaiting request does not stop a job that has
+            # started, so the block is freed only once the worker is done.
+            future.add_done_callback(lambda _: _release(shm))
+        return asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "inflight": self._inflight,
+            "band_workers": self.band_workers,
+            "bands_inflight": self._bands_inflight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Drop queued jobs and stop the workers.
+
+        Jobs already running are left to finish; with ``wait`` this returns
+        once they have, so their shared-memory payloads are released too.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        # Band processes started here when the pool runs jobs in-process.
+        shutdown_band_pool()
+
+
+def pool_from_env() -> ImageJobPool:
+    """Build the pool from ``IMAGE_POOL_WORKERS`` / ``IMAGE_POOL_MAX_QUEUE``.
+
+    ``IMAGE_POOL_WORKERS=0`` keeps jobs on the threadpool (useful in dev).
+    ``DITHER_WORKERS`` sets the band-process budget for parallel requests;
+    it defaults to 1, so ``parallel`` is ignored unless the operator opts in.
+    """
+    default_workers = min(2, os.cpu_count() or 1)
+    workers = int(os.getenv("IMAGE_POOL_WORKERS", default_workers))
+    max_queue = int(os.getenv("IMAGE_POOL_MAX_QUEUE", 8))
+    return ImageJobPool(workers=workers, max_queue=max_queue, band_workers=default_band_workers())
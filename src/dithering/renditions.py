@@ -0,0 +1,72 @@
+"""Reduced-resolution decoding for avatar renditions.
+
+Avatars are only ever shown at a few small sizes, so there is no point in
+decoding (let alone dithering) a 12 MP phone photo at full resolution.
+JPEGs are decoded with Pillow's draft mode, which lets libjpeg scale by
+1/2, 1/4 or 1/8 during the IDCT, and everything is then capped to the
+largest rendition before any per-pixel work happens.
+
+Renditions are cached under (upload, size), so a rendition's pixels must
+depend on nothing else: :func:`decode_renditions` picks the draft scale
+from each size alone and resizes straight to it, whichever other sizes are
+decoded alongside.
+"""
+
+from __future__ import annotations
+
+import io
+from typing import Dict, Sequence
+
+from PIL import Image
+
+# Sizes (longest side, px) the frontend displays avatars at.
+AVATAR_SIZES = (64, 128, 256)
+
+
+def open_downscaled(img_bytes: bytes, max_side: int) -> Image.Image:
+    """Decode ``img_bytes`` as RGB with its longest side capped to ``max_side``."""
+    img = Image.open(io.BytesIO(img_bytes))
+    # Only JPEG honours draft(); it picks the smallest scale still >= max_side.
+    img.draft("RGB", (max_side, max_side))
+    img = img.convert("RGB")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    return img
+
+
+def resize_renditions(img: Image.Image, sizes: Sequence[int] = AVATAR_SIZES) -> Dict[int, Image.Image]:
+    """Return ``{size: image}`` with each copy fitted inside ``size`` x ``size``.
+
+    Images already smaller than a size are not upscaled.
+    """
+    renditions = {}
+    for size in sorted(sizes, reverse=True):
+        copy = img.copy()
+        copy.thumbnail((size, size), Image.LANCZOS)
+        renditions[size] = copy
+    return renditions
+
+
+def decode_renditions(img_bytes: bytes, sizes: Sequence[int] = AVATAR_SIZES) -> Dict[int, Image.Image]:
+    """Decode ``img_bytes`` into ``{size: RGB image}`` fitted inside ``size`` x ``size``.
+
+    Each rendition comes from the decode ``open_downscaled`` would pick for
+    its own size; sizes that share a JPEG draft scale share one decode.
+    """
+    groups: Dict[tuple, list] = {}
+    for size in sorted(set(sizes), reverse=True):
+        # draft() only reads the header, so probing the scale is cheap.
+        probe = Image.open(io.BytesIO(img_bytes))
+        probe.draft("RGB", (size, size))
+        groups.setdefault(probe.size, []).append(size)
+
+    renditions = {}
+    for group in groups.values():
+        img = Image.open(io.BytesIO(img_bytes))
+        img.draft("RGB", (group[0], group[0]))
+        img = img.convert("RGB")
+        for size in group:
+            copy = img.copy()
+            copy.thumbnail((size, size), Image.LANCZOS)
+            renditions[size] = copy
+    return renditions
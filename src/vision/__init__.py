@@ -0,0 +1,39 @@
+from .protocol import (
+    FLAG_WEBP,
+    FRAME_HEADER,
+    Frame,
+    FrameError,
+    decode_image,
+    pack_frame,
+    parse_binary_frame,
+    parse_json_frame,
+    split_binary_frame,
+    split_json_frame,
+)
+from .mailbox import LatestFrameSlot, LatestValue
+from .batcher import InferenceBatcher, RateLimited, batcher_from_env
+from .detectors import (
+    BACKENDS,
+    Detections,
+    YoloDetector,
+    compare_detections,
+    detector_from_env,
+    export_model,
+    load_detector,
+)
+from .cascade import CascadeDetector, cascade_from_env
+from .motion import MotionGate, MotionTotals, motion_gate_from_env
+from .tracking import DetectTracker, Track, tracker_from_env
+from .distraction import DistractionDebouncer, debouncer_from_env, utc_iso
+from .metrics import FrameTimer, LatencyHistogram, StageMetrics, metrics_from_env
+from .shm_transport import (
+    FrameRing,
+    ShmDetector,
+    authkey_from_env,
+    connect_detector,
+    parse_address,
+    serve_connection,
+    serve_forever,
+    spawn_detector,
+)
+from .rate_control import FrameRateController, rate_controller_from_env
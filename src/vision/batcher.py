@@ -0,0 +1,262 @@
+"""Cross-connection micro-batching of detector inference.
+
+Every Lock-In socket used to run its own batch-of-one forward pass.  The
+:class:`InferenceBatcher` instead collects frames from all connections for
+up to ``max_wait_ms`` (or until ``max_batch`` frames are waiting), runs a
+single batched call in the threadpool, and resolves each caller's future with
+its own result.  Under load, frames that arrive during a forward pass are
+batched into the next one without extra waiting.
+
+Frames are queued per key (the user, or the connection for anonymous
+sockets).  Batches are filled round-robin across keys, so one client that
+streams fast cannot crowd everyone else out of a batch.  Each key can be
+capped to ``rate_limit_fps`` frames per second; frames over the cap raise
+:class:`RateLimited` straight away.  With several ``infer_batch`` callables,
+one per model replica, each replica takes the next batch as soon as it is
+free.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+DEFAULT_MAX_BATCH = 8
+DEFAULT_MAX_WAIT_MS = 5.0
+# Per-user frame cap; the web client sends ~3 frames/s.
+DEFAULT_RATE_LIMIT_FPS = 15.0
+
+InferBatch = Callable[[List[Any]], Sequence[Any]]
+
+
+class RateLimited(RuntimeError):
+    """Raised by :meth:`InferenceBatcher.submit` for a frame over its key's cap."""
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+def _resolve(future: asyncio.Future, result: Any = None, exception: Optional[BaseException] = None) -> None:
+    """Complete ``future`` on its own loop."""
+
+    def _set():
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    future.get_loop().call_soon_threadsafe(_set)
+
+
+class InferenceBatcher:
+    """Groups concurrent :meth:`submit` calls into batched inference calls.
+
+    ``infer_batch(frames)`` must return one result per frame, in order.  Pass
+    a list of them to run one worker per model replica.
+    """
+
+    def __init__(
+        self,
+        infer_batch: Union[InferBatch, Sequence[InferBatch]],
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        rate_limit_fps: float = 0.0,
+    ):
+        self.replicas: List[InferBatch] = list(infer_batch) if isinstance(infer_batch, (list, tuple)) else [infer_batch]
+        self.max_batch = max(1, max_batch)
+        self.max_wait_ms = max_wait_ms
+        self.rate_limit_fps = rate_limit_fps
+        # key -> frames waiting; the first key is served next.
+        self._queues: "OrderedDict[Hashable, Deque[Tuple[Any, asyncio.Future]]]" = OrderedDict()
+        self._depth = 0
+        # submit() may run on other threads' event loops.
+        self._lock = threading.Lock()
+        self._buckets: Dict[Hashable, _TokenBucket] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        # One task per replica; a worker restarted from another thread's loop
+        # is a concurrent future instead.
+        self._workers: List[Any] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.frames = 0
+        self.batch_sizes: Counter = Counter()
+        self.max_depth = 0
+        self.rate_limited: Counter = Counter()
+        self.replica_frames = [0] * len(self.replicas)
+        self.busy = 0
+        self.worker_restarts = [0] * len(self.replicas)
+        self.last_worker_error: Optional[str] = None
+
+    async def submit(self, frame: Any, key: Hashable = None) -> Any:
+        """Queue ``frame`` under ``key`` for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.rate_limit_fps > 0:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _TokenBucket(self.rate_limit_fps, max(1.0, self.rate_limit_fps))
+                if not bucket.take():
+                    self.rate_limited[key] += 1
+                    raise RateLimited(f"over {self.rate_limit_fps:g} frames/s")
+            self._queues.setdefault(key, deque()).append((frame, future))
+            self._depth += 1
+            self.max_depth = max(self.max_depth, self._depth)
+            self._ensure_workers(loop)
+        # Callers may live on other event loops (threads), so always hop
+        # onto the workers' loop rather than touching its Event directly.
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+        return await future
+
+    def _ensure_workers(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start a worker for every replica that has none (caller holds the lock)."""
+        if self._loop is None or self._loop.is_closed():
+            # First frame, or the loop the workers ran on is gone.
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._workers = [loop.create_task(self._run(i)) for i in range(len(self.replicas))]
+            return
+        for replica, worker in enumerate(self._workers):
+            if not worker.done():
+                continue
+            error = "cancelled" if worker.cancelled() else repr(worker.exception())
+            self.worker_restarts[replica] += 1
+            self.last_worker_error = f"replica {replica}: {error}"
+            print(f"[InferenceBatcher] Worker for replica {replica} died ({error}); restarting it")
+            if loop is self._loop:
+                self._workers[replica] = loop.create_task(self._run(replica))
+            else:
+                self._workers[replica] = asyncio.run_coroutine_threadsafe(self._run(replica), self._loop)
+
+    def forget(self, key: Hashable) -> None:
+        """Drop ``key``'s rate-limit state (its last connection closed)."""
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _take_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        """Up to ``max_batch`` frames, one per key in turn."""
+        batch = []
+        with self._lock:
+            while self._queues and len(batch) < self.max_batch:
+                key, queue = next(iter(self._queues.items()))
+                batch.append(queue.popleft())
+                if queue:
+                    self._queues.move_to_end(key)
+                else:
+                    del self._queues[key]
+            self._depth -= len(batch)
+        return batch
+
+    async def _collect(self) -> None:
+        """Wait until a full batch is pending or the wait window closes."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+        while self._depth < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self, replica: int) -> None:
+        batch: List[Tuple[Any, asyncio.Future]] = []
+        try:
+            await self._serve(replica, batch)
+        except BaseException as e:
+            # Don't leave the callers of the batch in hand waiting forever.
+            for _, future in batch:
+                _resolve(future, exception=e if isinstance(e, Exception) else RuntimeError("Inference worker stopped"))
+            raise
+
+    async def _serve(self, replica: int, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Worker loop for ``replica``; ``batch`` holds the frames it is working on."""
+        infer_batch = self.replicas[replica]
+        while True:
+            batch.clear()
+            if not self._depth:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            await self._collect()
+            # Callers that went away (socket closed) no longer need a slot.
+            batch.extend((frame, future) for frame, future in self._take_batch() if not future.cancelled())
+            if not batch:
+                continue
+            if self._depth:
+                # More is waiting: let an idle replica start on it now.
+                self._wakeup.set()
+
+            self.busy += 1
+            try:
+                results = await run_in_threadpool(infer_batch, [frame for frame, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    _resolve(future, exception=e)
+                continue
+            finally:
+                self.busy -= 1
+
+            self.batches += 1
+            self.frames += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            self.replica_frames[replica] += len(batch)
+            for (_, future), result in zip(batch, results):
+                _resolve(future, result=result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queue_by_key = {str(key): len(queue) for key, queue in self._queues.items()}
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+            "replicas": len(self.replicas),
+            "busy_replicas": self.busy,
+            "pending": self._depth,
+            "max_pending": self.max_depth,
+            "queue_by_key": queue_by_key,
+            "rate_limit_fps": self.rate_limit_fps,
+            "rate_limited": sum(self.rate_limited.values()),
+            "batches": self.batches,
+            "frames": self.frames,
+            "replica_frames": list(self.replica_frames),
+            "worker_restarts": list(self.worker_restarts),
+            "last_worker_error": self.last_worker_error,
+            "mean_batch_size": self.frames / self.batches if self.batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+
+def batcher_from_env(infer_batch: Union[InferBatch, Sequence[InferBatch]]) -> InferenceBatcher:
+    """Build a batcher from ``PHONE_DETECT_MAX_BATCH`` / ``PHONE_DETECT_MAX_WAIT_MS`` / ``PHONE_DETECT_USER_FPS``."""
+    return InferenceBatcher(
+        infer_batch,
+        max_batch=int(os.getenv("PHONE_DETECT_MAX_BATCH", DEFAULT_MAX_BATCH)),
+        max_wait_ms=float(os.getenv("PHONE_DETECT_MAX_WAIT_MS", DEFAULT_MAX_WAIT_MS)),
+        rate_limit_fps=float(os.getenv("PHONE_DETECT_USER_FPS", DEFAULT_RATE_LIMIT_FPS)),
+    )
@@ -0,0 +1,157 @@
+"""Cheap-to-expensive detector cascade.
+
+Most Lock-In frames are easy: no phone at all, or one held up to the camera
+that any model is sure about.  :class:`CascadeDetector` runs a fast model
+first (yolo11n, or the same weights at a smaller input size) on every
+frame.  A frame is only escalated to the accurate model (yolo11s) when a
+target-class box from the fast model lands in the uncertainty band
+``[conf_threshold - band, conf_threshold + band)``.  Boxes above the band
+are trusted, and a frame with nothing above its lower edge is taken as
+clear.
+
+:meth:`CascadeDetector.stats` reports the escalation rate and model time
+next to what running the accurate model on every frame would have cost.
+``scripts/detector_parity.py --cascade`` measures the accuracy side
+against the accurate model offline.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .detectors import Detections, detector_from_env
+
+DEFAULT_BAND = 0.1
+
+
+class CascadeDetector:
+    """``fast`` on every frame, ``accurate`` on the uncertain ones."""
+
+    def __init__(
+        self,
+        fast: Any,
+        accurate: Any,
+        class_ids: Iterable[int],
+        conf_threshold: float,
+        band: float = DEFAULT_BAND,
+    ):
+        self.fast = fast
+        self.accurate = accurate
+        self.names: Dict[int, str] = accurate.names
+        self.class_ids = np.array(sorted(class_ids), dtype=np.int64)
+        self.conf_threshold = conf_threshold
+        self.band = band
+        self._classes: Optional[Iterable[int]] = None
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.escalated = 0
+        self.fast_ms = 0.0
+        self.accurate_ms = 0.0
+        self._apply_restrict()
+
+    @property
+    def low(self) -> float:
+        return max(0.0, self.conf_threshold - self.band)
+
+    @property
+    def high(self) -> float:
+        return self.conf_threshold + self.band
+
+    def _apply_restrict(self) -> None:
+        # The fast model must report boxes down to the bottom of the band.
+        self.fast.restrict(self._classes, self.low)
+        self.accurate.restrict(self._classes, self.conf_threshold)
+
+    def restrict(self, class_ids: Optional[Iterable[int]], conf_threshold: Optional[float] = None) -> None:
+        self._classes = class_ids
+        if conf_threshold is not None:
+            self.conf_threshold = conf_threshold
+        self._apply_restrict()
+
+    def uncertain(self, dets: Detections) -> bool:
+        """Whether any target box sits in the uncertainty band."""
+        in_band = np.isin(dets.cls, self.class_ids) & (dets.conf >= self.low) & (dets.conf < self.high)
+        return bool(in_band.any())
+
+    def _settle(self, dets: Detections) -> Detections:
+        """A fast result kept as final: drop the sub-threshold boxes it only reported for the band."""
+        keep = dets.conf >= self.conf_threshold
+        if keep.all():
+            return dets
+        return Detections(dets.xyxy[keep], dets.conf[keep], dets.cls[keep], None if dets.ids is None else dets.ids[keep])
+
+    def predict(self, frames: Sequence[np.ndarray]) -> List[Detections]:
+        started = time.perf_counter()
+        results = self.fast.predict(frames)
+        fast_ms = (time.perf_counter() - started) * 1000
+
+        escalate = [i for i, dets in enumerate(results) if self.uncertain(dets)]
+        accurate_ms = 0.0
+        if escalate:
+            started = time.perf_counter()
+            second = self.accurate.predict([frames[i] for i in escalate])
+            accurate_ms = (time.perf_counter() - started) * 1000
+            for i, dets in zip(escalate, second):
+                results[i] = dets
+        escalated = set(escalate)
+        results = [dets if i in escalated else self._settle(dets) for i, dets in enumerate(results)]
+
+        with self._lock:
+            self.frames += len(frames)
+            self.escalated += len(escalate)
+            self.fast_ms += fast_ms
+            self.accurate_ms += accurate_ms
+        return results
+
+    def warmup(self, shape: Sequence[int] = (480, 640, 3)) -> float:
+        return self.fast.warmup(shape) + self.accurate.warmup(shape)
+
+    def close(self) -> None:
+        for model in (self.fast, self.accurate):
+            close = getattr(model, "close", None)
+            if close is not None:
+                close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            frames, escalated = self.frames, self.escalated
+            fast_ms, accurate_ms = self.fast_ms, self.accurate_ms
+        # Per-frame accurate cost as seen on escalated frames.
+        accurate_per_frame = accurate_ms / escalated if escalated else None
+        return {
+            "band": [round(self.low, 3), round(self.high, 3)],
+            "frames": frames,
+            "escalated": escalated,
+            "escalation_rate": round(escalated / frames, 3) if frames else 0.0,
+            "fast_ms_per_frame": round(fast_ms / frames, 2) if frames else 0.0,
+            "cascade_ms_per_frame": round((fast_ms + accurate_ms) / frames, 2) if frames else 0.0,
+            "accurate_ms_per_frame": round(accurate_per_frame, 2) if accurate_per_frame is not None else None,
+            # Versus running the accurate model on every frame.
+            "saved_ms": round(accurate_per_frame * frames - fast_ms - accurate_ms, 1) if accurate_per_frame is not None else None,
+        }
+
+
+def cascade_from_env(accurate: Any, weights: str, class_ids: Iterable[int], conf_threshold: float) -> Any:
+    """Wrap ``accurate`` in a cascade when ``PHONE_DETECT_CASCADE`` is set.
+
+    ``PHONE_DETECT_CASCADE`` is either a weights file for the fast model
+    (e.g. ``yolo11n.pt``, next to ``weights`` unless a path is given) or an
+    input size (e.g. ``320``) to run ``weights`` smaller.  The fast model
+    uses the same backend/process settings as ``accurate``.
+    ``PHONE_DETECT_CASCADE_BAND`` is the half-width of the uncertainty band.
+    """
+    fast_spec = os.getenv("PHONE_DETECT_CASCADE", "")
+    if not fast_spec:
+        return accurate
+    if fast_spec.isdigit():
+        fast = detector_from_env(weights, imgsz=int(fast_spec))
+    else:
+        fast_weights = fast_spec if os.path.dirname(fast_spec) else os.path.join(os.path.dirname(weights), fast_spec)
+        fast = detector_from_env(fast_weights)
+    band = float(os.getenv("PHONE_DETECT_CASCADE_BAND", DEFAULT_BAND))
+    return CascadeDetector(fast, accurate, class_ids, conf_threshold, band=band)
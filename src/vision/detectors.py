@@ -0,0 +1,327 @@
+"""Pluggable phone-detector backends.
+
+The detector always goes through Ultralytics for pre- and post-processing.
+Only the runtime behind the forward pass changes:
+
+* ``torch``    - the original ``.pt`` weights through PyTorch
+* ``onnx``     - an ONNX export run by ONNX Runtime (optionally INT8 weights)
+* ``openvino`` - an OpenVINO IR export (optionally INT8 via NNCF)
+
+Exports are made once and kept under ``data/detector_exports``.  Whatever
+the backend, :meth:`YoloDetector.predict` returns plain numpy
+:class:`Detections`, so callers never touch backend-specific result types.
+Use :func:`compare_detections` (or ``scripts/detector_parity.py``) to check an
+exported backend against the PyTorch path before switching to it.
+
+:meth:`YoloDetector.restrict` hands a class filter and confidence threshold to
+the model call itself, so NMS and post-processing only ever see the boxes the
+caller cares about.  :meth:`Detections.to_entries` is the per-box JSON layout
+the WebSocket endpoint sends by default; :meth:`Detections.to_compact` is the
+smaller columnar one clients can ask for.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "openvino")
+EXPORT_DIR = os.path.join("data", "detector_exports")
+DEFAULT_IMGSZ = 640
+
+
+@dataclass
+class Detections:
+    """Boxes found in one frame: ``xyxy`` pixels (n, 4), ``conf`` (n,), ``cls`` (n,).
+
+    ``ids`` holds stable track IDs when the boxes come from a tracker.
+    """
+
+    xyxy: np.ndarray
+    conf: np.ndarray
+    cls: np.ndarray
+    ids: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.conf)
+
+    @classmethod
+    def empty(cls, with_ids: bool = False) -> "Detections":
+        return cls(
+            np.zeros((0, 4), np.float32),
+            np.zeros(0, np.float32),
+            np.zeros(0, np.int64),
+            np.zeros(0, np.int64) if with_ids else None,
+        )
+
+    @classmethod
+    def from_results(cls, results: Any) -> "Detections":
+        """Convert one Ultralytics ``Results`` object."""
+        boxes = results.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+        # One device-to-host copy of the (n, 6) xyxy/conf/cls tensor.
+        data = boxes.data.cpu().numpy()
+        return cls(
+            np.ascontiguousarray(data[:, :4], dtype=np.float32),
+            np.ascontiguousarray(data[:, 4], dtype=np.float32),
+            data[:, 5].astype(np.int64),
+        )
+
+    def filter(self, class_ids: Iterable[int], conf_threshold: float) -> "Detections":
+        """The boxes of ``class_ids`` at or above ``conf_threshold``."""
+        keep = np.isin(self.cls, list(class_ids)) & (self.conf >= conf_threshold)
+        if keep.all():
+            return self
+        return Detections(
+            self.xyxy[keep],
+            self.conf[keep],
+            self.cls[keep],
+            None if self.ids is None else self.ids[keep],
+        )
+
+    def to_entries(self, names: Dict[int, str], width: int, height: int) -> List[Dict[str, Any]]:
+        """Per-box JSON layout: ``class``, ``confidence``, ``bbox`` (normalised) and ``bbox_px``.
+
+        ``track_id`` is included when the boxes come from a tracker.
+        """
+        x1, y1, x2, y2 = self.xyxy.astype(np.float64).T
+        w = np.maximum(0.0, x2 - x1) / width
+        h = np.maximum(0.0, y2 - y1) / height
+        norm = np.stack([x1 / width, y1 / height, w, h], axis=1)
+        px = self.xyxy.astype(np.int64)
+        ids = self.ids.tolist() if self.ids is not None else [None] * len(self)
+        entries = []
+        for c, conf, (x, y, w, h), (px1, py1, px2, py2), track_id in zip(
+            self.cls.tolist(), self.conf.tolist(), norm.tolist(), px.tolist(), ids
+        ):
+            entry = {
+                "class": names.get(c, str(c)),
+                "confidence": conf,
+                "bbox": {"x": x, "y": y, "w": w, "h": h},
+                "bbox_px": {"x1": px1, "y1": py1, "x2": px2, "y2": py2},
+            }
+            if track_id is not None:
+                entry["track_id"] = track_id
+            entries.append(entry)
+        return entries
+
+    def to_compact(self, names: Dict[int, str]) -> Dict[str, Any]:
+        """Columnar JSON layout: integer pixel boxes, 3-decimal confidences, class ids.
+
+        ``names`` maps only the class ids present; ``track_id`` is included
+        when the boxes come from a tracker.
+        """
+        out: Dict[str, Any] = {
+            "xyxy": np.rint(self.xyxy).astype(np.int32).tolist(),
+            "conf": np.round(self.conf.astype(np.float64), 3).tolist(),
+            "cls": self.cls.tolist(),
+            "names": {str(c): names.get(c, str(c)) for c in np.unique(self.cls).tolist()},
+        }
+        if self.ids is not None:
+            out["track_id"] = self.ids.tolist()
+        return out
+
+
+def _import_yolo():
+    # Ultralytics reads YOLO_VERBOSE once, at import time; with it off there
+    # is no per-call console output to redirect.
+    os.environ.setdefault("YOLO_VERBOSE", "False")
+    from ultralytics import YOLO
+
+    return YOLO
+
+
+class YoloDetector:
+    """A YOLO model loaded from ``.pt``, ``.onnx`` or an OpenVINO export."""
+
+    def __init__(self, weights: str, backend: str = "torch", imgsz: int = DEFAULT_IMGSZ):
+        YOLO = _import_yolo()
+        self.weights = weights
+        self.backend = backend
+        self.imgsz = imgsz
+        self.model = YOLO(weights, task="detect")
+        self.names: Dict[int, str] = dict(self.model.names)
+        self.classes: Optional[List[int]] = None
+        self.conf: Optional[float] = None
+
+    def restrict(self, class_ids: Optional[Iterable[int]], conf_threshold: Optional[float] = None) -> None:
+        """Only keep ``class_ids`` above ``conf_threshold``, filtered before NMS."""
+        self.classes = sorted(class_ids) if class_ids is not None else None
+        self.conf = conf_threshold
+
+    def predict(self, frames: Sequence[np.ndarray]) -> List[Detections]:
+        """Run one batched forward pass over BGR ``frames``."""
+        kwargs: Dict[str, Any] = {"classes": self.classes}
+        if self.conf is not None:
+            kwargs["conf"] = self.conf
+        results = self.model(list(frames), imgsz=self.imgsz, verbose=False, **kwargs)
+        return [Detections.from_results(r) for r in results]
+
+    def warmup(self, shape: Sequence[int] = (480, 640, 3)) -> float:
+        """Run a dummy frame through the model; returns the time it took in ms.
+
+        The first forward pass pays for lazy initialisation (graph build,
+        kernel selection, memory pools), so do it before a client does.
+        """
+        started = time.perf_counter()
+        self.predict([np.zeros(tuple(shape), np.uint8)])
+        return (time.perf_counter() - started) * 1000
+
+
+def export_path(weights: str, backend: str, int8: bool = False, imgsz: int = DEFAULT_IMGSZ, export_dir: str = EXPORT_DIR) -> str:
+    """Where the cached export for these settings lives."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    tag = f"{stem}_{imgsz}{'_int8' if int8 else ''}"
+    if backend == "onnx":
+        return os.path.join(export_dir, f"{tag}.onnx")
+    # Ultralytics recognises OpenVINO models by the directory suffix.
+    return os.path.join(export_dir, f"{tag}_openvino_model")
+
+
+def _quantize_onnx(src: str, dst: str) -> None:
+    """INT8 weight quantization of an ONNX export, keeping its metadata."""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+    # Ultralytics reads class names, stride and imgsz from the metadata.
+    meta = onnx.load(src, load_external_data=False).metadata_props
+    quantized = onnx.load(dst)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(meta)
+    onnx.save(quantized, dst)
+
+
+def export_model(
+    weights: str,
+    backend: str,
+    int8: bool = False,
+    imgsz: int = DEFAULT_IMGSZ,
+    export_dir: str = EXPORT_DIR,
+) -> str:
+    """Export ``weights`` for ``backend`` once and return the cached path."""
+    target = export_path(weights, backend, int8, imgsz, export_dir)
+    if os.path.exists(target):
+        return target
+
+    YOLO = _import_yolo()
+    os.makedirs(export_dir, exist_ok=True)
+    model = YOLO(weights, task="detect")
+    if backend == "onnx":
+        # Dynamic axes so the batcher can send any batch size.
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            _quantize_onnx(exported, target)
+            os.remove(exported)
+        else:
+            shutil.move(exported, target)
+    elif backend == "openvino":
+        # NNCF post-training quantization needs Ultralytics' calibration set.
+        exported = model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=int8)
+        shutil.move(exported, target)
+    else:
+        raise ValueError(f"Nothing to export for backend '{backend}'")
+    return target
+
+
+def load_detector(weights: str, backend: str = "torch", int8: bool = False, imgsz: int = DEFAULT_IMGSZ) -> YoloDetector:
+    """Load ``weights`` on ``backend``, exporting (and caching) first if needed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}'. Choose one of {list(BACKENDS)}")
+    if backend != "torch":
+        weights = export_model(weights, backend, int8=int8, imgsz=imgsz)
+    return YoloDetector(weights, backend=backend, imgsz=imgsz)
+
+
+def detector_from_env(weights: str, process: Optional[str] = None, imgsz: Optional[int] = None) -> Any:
+    """Load the detector chosen by ``PHONE_DETECT_BACKEND`` / ``PHONE_DETECT_INT8`` / ``PHONE_DETECT_IMGSZ``.
+
+    ``PHONE_DETECT_PROCESS`` (or ``process``) moves it out of this process:
+    ``spawn`` starts a child process, ``host:port`` or a socket path connects
+    to ``phone-detector/app.py --shm-serve``.  Frames then travel through
+    shared memory (see shm_transport.py).  Empty means in-process.
+    ``imgsz`` overrides ``PHONE_DETECT_IMGSZ``.
+    """
+    backend = os.getenv("PHONE_DETECT_BACKEND", "torch").lower()
+    int8 = os.getenv("PHONE_DETECT_INT8", "0") == "1"
+    imgsz = int(os.getenv("PHONE_DETECT_IMGSZ", DEFAULT_IMGSZ)) if imgsz is None else imgsz
+    process = os.getenv("PHONE_DETECT_PROCESS", "") if process is None else process
+    if not process:
+        return load_detector(weights, backend=backend, int8=int8, imgsz=imgsz)
+
+    from . import shm_transport
+
+    slots = int(os.getenv("PHONE_DETECT_SHM_SLOTS", shm_transport.DEFAULT_SLOTS))
+    if process == "spawn":
+        return shm_transport.spawn_detector(weights, backend=backend, int8=int8, imgsz=imgsz, slots=slots)
+    return shm_transport.connect_detector(
+        shm_transport.parse_address(process), shm_transport.authkey_from_env(), slots=slots
+    )
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (n, 4) and (m, 4) xyxy boxes."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def compare_detections(
+    reference: Sequence[Detections],
+    candidate: Sequence[Detections],
+    iou_threshold: float = 0.5,
+    min_conf: float = 0.0,
+    class_ids: Optional[set] = None,
+) -> Dict[str, float]:
+    """Match ``candidate`` boxes to ``reference`` boxes frame by frame.
+
+    Boxes are matched greedily by IoU within the same class.  Returns recall
+    and precision against the reference, plus the mean absolute confidence
+    difference and mean IoU of the matched pairs.
+    """
+    matched = ref_total = cand_total = 0
+    conf_deltas: List[float] = []
+    ious: List[float] = []
+    for ref, cand in zip(reference, candidate):
+        ref_keep = ref.conf >= min_conf
+        cand_keep = cand.conf >= min_conf
+        if class_ids is not None:
+            ref_keep &= np.isin(ref.cls, list(class_ids))
+            cand_keep &= np.isin(cand.cls, list(class_ids))
+        r_xyxy, r_conf, r_cls = ref.xyxy[ref_keep], ref.conf[ref_keep], ref.cls[ref_keep]
+        c_xyxy, c_conf, c_cls = cand.xyxy[cand_keep], cand.conf[cand_keep], cand.cls[cand_keep]
+        ref_total += len(r_conf)
+        cand_total += len(c_conf)
+        if not len(r_conf) or not len(c_conf):
+            continue
+
+        iou = box_iou(r_xyxy, c_xyxy)
+        iou[r_cls[:, None] != c_cls[None, :]] = 0.0
+        while True:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[i, j] < iou_threshold:
+                break
+            matched += 1
+            ious.append(float(iou[i, j]))
+            conf_deltas.append(abs(float(r_conf[i]) - float(c_conf[j])))
+            iou[i, :] = 0.0
+            iou[:, j] = 0.0
+
+    return {
+        "reference_boxes": ref_total,
+        "candidate_boxes": cand_total,
+        "matched": matched,
+        "recall": matched / ref_total if ref_total else 1.0,
+        "precision": matched / cand_total if cand_total else 1.0,
+        "mean_conf_delta": float(np.mean(conf_deltas)) if conf_deltas else 0.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+    }
@@ -0,0 +1,116 @@
+"""Per-connection distraction debouncing.
+
+A single frame with a phone in it is not a distraction: detections flicker,
+and a phone lying far away in the background should not count.  This is the
+streak/cooldown/box-size debounce that ``run_local`` in phone-detector/app.py
+uses, as a state machine the server runs for every socket:
+
+* a frame is a *hit* when a target class is above the confidence threshold
+  and its box covers at least ``min_area_ratio`` of the frame;
+* ``streak_required`` consecutive hits start a distraction, unless the last
+  one ended less than ``cooldown_sec`` ago;
+* ``clear_frames`` consecutive misses end it.
+
+Clients get a ``distraction_started`` / ``distraction_ended`` event only
+when the state changes.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .detectors import Detections
+
+# The web client sends ~3 frames/s, so these are lower than run_local's
+# 15-frame streak at camera rate.
+DEFAULT_STREAK_REQUIRED = 3
+DEFAULT_CLEAR_FRAMES = 3
+DEFAULT_COOLDOWN_SEC = 3.0
+DEFAULT_MIN_AREA_RATIO = 0.01
+
+
+def utc_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+class DistractionDebouncer:
+    """Turns per-frame detections into started/ended distraction events."""
+
+    def __init__(
+        self,
+        class_ids: Iterable[int],
+        conf_threshold: float,
+        streak_required: int = DEFAULT_STREAK_REQUIRED,
+        clear_frames: int = DEFAULT_CLEAR_FRAMES,
+        cooldown_sec: float = DEFAULT_COOLDOWN_SEC,
+        min_area_ratio: float = DEFAULT_MIN_AREA_RATIO,
+    ):
+        self.class_ids = np.array(sorted(class_ids), dtype=np.int64)
+        self.conf_threshold = conf_threshold
+        self.streak_required = streak_required
+        self.clear_frames = clear_frames
+        self.cooldown_sec = cooldown_sec
+        self.min_area_ratio = min_area_ratio
+        self.active = False
+        self.started_at: Optional[float] = None
+        self.count = 0
+        self._hits = 0
+        self._misses = 0
+        self._ended_at = float("-inf")
+
+    def is_hit(self, dets: Detections, frame_shape: Tuple[int, ...]) -> bool:
+        if not len(dets):
+            return False
+        area = (dets.xyxy[:, 2] - dets.xyxy[:, 0]).clip(0) * (dets.xyxy[:, 3] - dets.xyxy[:, 1]).clip(0)
+        keep = (
+            np.isin(dets.cls, self.class_ids)
+            & (dets.conf >= self.conf_threshold)
+            & (area >= self.min_area_ratio * frame_shape[0] * frame_shape[1])
+        )
+        return bool(keep.any())
+
+    def update(self, dets: Detections, frame_shape: Tuple[int, ...], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Feed one frame's detections; returns an event when the state flips."""
+        now = time.time() if now is None else now
+        if self.is_hit(dets, frame_shape):
+            self._hits += 1
+            self._misses = 0
+        else:
+            self._misses += 1
+            self._hits = 0
+
+        if not self.active:
+            if self._hits >= self.streak_required and now - self._ended_at >= self.cooldown_sec:
+                self.active = True
+                self.started_at = now
+                self.count += 1
+                return {"type": "distraction_started", "ts": utc_iso(now), "kind": "phone", "count": self.count}
+        elif self._misses >= self.clear_frames:
+            self.active = False
+            self._ended_at = now
+            started_at, self.started_at = self.started_at, None
+            return {
+                "type": "distraction_ended",
+                "ts": utc_iso(now),
+                "kind": "phone",
+                "started": utc_iso(started_at),
+                "duration_sec": round(now - started_at, 1),
+            }
+        return None
+
+
+def debouncer_from_env(class_ids: Iterable[int], conf_threshold: float) -> DistractionDebouncer:
+    """Build a debouncer from the ``PHONE_DETECT_*`` streak/cooldown/area settings."""
+    return DistractionDebouncer(
+        class_ids,
+        conf_threshold,
+        streak_required=int(os.getenv("PHONE_DETECT_STREAK_REQUIRED", DEFAULT_STREAK_REQUIRED)),
+        clear_frames=int(os.getenv("PHONE_DETECT_CLEAR_FRAMES", DEFAULT_CLEAR_FRAMES)),
+        cooldown_sec=float(os.getenv("PHONE_DETECT_COOLDOWN_SEC", DEFAULT_COOLDOWN_SEC)),
+        min_area_ratio=float(os.getenv("PHONE_DETECT_MIN_AREA_RATIO", DEFAULT_MIN_AREA_RATIO)),
+    )
@@ -0,0 +1,101 @@
+"""Latest-frame-wins mailboxes between pipeline stages.
+
+Clients send frames at a fixed rate regardless of how fast inference runs.
+Awaiting inference for every frame in arrival order lets a backlog build up
+and detections arrive seconds late.  Instead, a receiver task drops each
+frame into a one-slot mailbox, replacing any frame that has not been picked
+up yet.  The consumer always sees the newest frame.  Frames that have waited
+longer than a maximum age are dropped too, so latency stays bounded.
+
+:class:`LatestValue` is the same idea for threads, used between the
+capture, inference and render stages of the local webcam demo.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class LatestFrameSlot:
+    """One-slot async mailbox; :meth:`put` overwrites an untaken frame."""
+
+    def __init__(self, max_age_sec: float):
+        self.max_age_sec = max_age_sec
+        self._item: Optional[Tuple[float, Any]] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.superseded = 0
+        self.stale = 0
+        # How long the last frame returned by get() sat in the slot.
+        self.last_wait_sec = 0.0
+
+    def put(self, frame: Any) -> None:
+        """Offer a frame, stamped with its arrival time."""
+        self.received += 1
+        if self._item is not None:
+            self.superseded += 1
+        self._item = (time.monotonic(), frame)
+        self._ready.set()
+
+    def close(self) -> None:
+        """Wake the consumer; :meth:`get` returns ``None`` once drained."""
+        self._closed = True
+        self._ready.set()
+
+    async def get(self) -> Optional[Any]:
+        """Wait for the newest frame that is still fresh enough to process."""
+        while True:
+            if self._item is None:
+                if self._closed:
+                    return None
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            (received_at, frame), self._item = self._item, None
+            waited = time.monotonic() - received_at
+            if waited > self.max_age_sec:
+                self.stale += 1
+                continue
+            self.last_wait_sec = waited
+            return frame
+
+    def drop_counts(self) -> Dict[str, int]:
+        return {"received": self.received, "superseded": self.superseded, "stale": self.stale}
+
+
+class LatestValue:
+    """One-slot queue between threads; :meth:`put` overwrites an untaken value."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item: Optional[Tuple[Any]] = None
+        self._closed = False
+        self.received = 0
+        self.superseded = 0
+
+    def put(self, value: Any) -> None:
+        with self._cond:
+            self.received += 1
+            if self._item is not None:
+                self.superseded += 1
+            self._item = (value,)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Wake waiting consumers; :meth:`get` returns ``None`` once drained."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Take the newest value, waiting up to ``timeout``; ``None`` if there is none."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            if self._item is None:
+                return None
+            (value,), self._item = self._item, None
+            return value
@@ -0,0 +1,114 @@
+"""Per-stage latency metrics for the phone-detect pipeline.
+
+When Lock-In feels laggy the question is where the time goes: waiting in
+the frame slot, base64, ``cv2.imdecode``, the batcher and threadpool hop,
+the forward pass, post-processing or the send.  Each frame gets a
+:class:`FrameTimer` whose stages are folded into a connection's
+:class:`StageMetrics`, which also feeds the process-wide one.  Both keep a
+rolling window of samples per stage and report p50/p95/p99.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+DEFAULT_WINDOW = 1000
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """Rolling window of one stage's latencies, in milliseconds."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, ms: float) -> None:
+        self.samples.append(ms)
+        self.count += 1
+
+    def stats(self) -> Dict[str, float]:
+        # list() copies the deque in one step, so a concurrent add() is safe.
+        samples = np.array(list(self.samples), dtype=np.float64)
+        if not len(samples):
+            return {"count": self.count}
+        p50, p95, p99 = np.percentile(samples, PERCENTILES)
+        return {
+            "count": self.count,
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "max": round(float(samples.max()), 2),
+        }
+
+
+class StageMetrics:
+    """Latency histograms by stage name; samples also go to ``parent``."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW, parent: Optional["StageMetrics"] = None):
+        self.window = window
+        self.parent = parent
+        self.stages: Dict[str, LatencyHistogram] = {}
+
+    def record(self, stage: str, ms: float) -> None:
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = LatencyHistogram(self.window)
+        hist.add(ms)
+        if self.parent is not None:
+            self.parent.record(stage, ms)
+
+    def record_all(self, timings: Dict[str, float]) -> None:
+        for stage, ms in timings.items():
+            self.record(stage, ms)
+
+    def quantile(self, stage: str, q: float = 50) -> Optional[float]:
+        """The ``q``-th percentile of ``stage`` in ms, or None before any sample."""
+        hist = self.stages.get(stage)
+        samples = list(hist.samples) if hist is not None else []
+        return float(np.percentile(samples, q)) if samples else None
+
+    def child(self) -> "StageMetrics":
+        """Metrics for one connection that also count towards these."""
+        return StageMetrics(self.window, parent=self)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {stage: hist.stats() for stage, hist in list(self.stages.items())}
+
+
+class FrameTimer:
+    """Stage timings for one frame, in milliseconds."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def finish(self) -> Dict[str, float]:
+        """Stamp the ``total`` stage and return the timings."""
+        self.timings["total"] = (time.perf_counter() - self._start) * 1000
+        return self.timings
+
+    def rounded(self) -> Dict[str, float]:
+        return {name: round(ms, 2) for name, ms in self.timings.items()}
+
+
+def metrics_from_env() -> StageMetrics:
+    """Process-wide metrics; ``PHONE_DETECT_METRICS_WINDOW`` sets the samples kept per stage."""
+    return StageMetrics(window=int(os.getenv("PHONE_DETECT_METRICS_WINDOW", DEFAULT_WINDOW)))
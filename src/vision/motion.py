@@ -0,0 +1,129 @@
+"""Motion gate in front of the phone detector.
+
+During a lock-in session the camera mostly sees someone sitting still at a
+desk, and running YOLO on near-identical frames tells us nothing new.  Each
+frame is shrunk to a tiny grayscale thumbnail and compared with the
+thumbnail of the last frame that was actually inferred.  If too few pixels
+changed, the previous detections are reused.  Comparing against the last
+inferred frame rather than the previous one means slow drift still adds up
+to a refresh.  A refresh is also forced every ``refresh_sec``.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+THUMB_SIZE = (64, 48)
+# A thumbnail pixel counts as changed when its gray level moves this much.
+PIXEL_DELTA = 15
+# Fraction of changed thumbnail pixels that triggers a new inference.
+CHANGED_FRACTION = 0.02
+# The web client sends ~3 frames/s, so a distraction streak (distraction.py)
+# spans about a second; refreshing twice as often keeps every streak on at
+# least one fresh inference.
+DEFAULT_REFRESH_SEC = 0.5
+
+
+def thumbnail(frame: np.ndarray) -> np.ndarray:
+    import cv2
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+
+class MotionTotals:
+    """Skip counters aggregated over every connection."""
+
+    def __init__(self):
+        self.frames = 0
+        self.skipped = 0
+        self.saved_ms = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+        }
+
+
+class MotionGate:
+    """Per-connection gate deciding whether a frame needs a fresh inference."""
+
+    def __init__(
+        self,
+        refresh_sec: float = DEFAULT_REFRESH_SEC,
+        changed_fraction: float = CHANGED_FRACTION,
+        totals: Optional[MotionTotals] = None,
+    ):
+        self.refresh_sec = refresh_sec
+        self.changed_fraction = changed_fraction
+        self.totals = totals or MotionTotals()
+        self._reference: Optional[np.ndarray] = None
+        self._candidate: Optional[np.ndarray] = None
+        self._shape = None
+        self._inferred_at = 0.0
+        self._detections: Any = None
+        # Running average of inference cost, used to estimate time saved.
+        self._infer_ms = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.saved_ms = 0.0
+
+    def reuse(self, frame: np.ndarray) -> Optional[Any]:
+        """Return the previous detections if ``frame`` can skip inference.
+
+        Returns ``None`` when the frame must be inferred; call :meth:`update`
+        with the new detections afterwards.
+        """
+        self.frames += 1
+        self.totals.frames += 1
+        self._candidate = thumbnail(frame)
+        if (
+            self._reference is None
+            or frame.shape != self._shape
+            or time.monotonic() - self._inferred_at >= self.refresh_sec
+        ):
+            return None
+        diff = np.abs(self._candidate.astype(np.int16) - self._reference)
+        if np.count_nonzero(diff > PIXEL_DELTA) > self.changed_fraction * diff.size:
+            return None
+
+        self.skipped += 1
+        self.saved_ms += self._infer_ms
+        self.totals.skipped += 1
+        self.totals.saved_ms += self._infer_ms
+        return self._detections
+
+    def update(self, frame: np.ndarray, detections: Any, infer_ms: float) -> None:
+        """Record a fresh inference for the frame last passed to :meth:`reuse`."""
+        self._reference = self._candidate
+        self._shape = frame.shape
+        self._inferred_at = time.monotonic()
+        self._detections = detections
+        self._infer_ms = infer_ms if not self._infer_ms else 0.8 * self._infer_ms + 0.2 * infer_ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+        }
+
+
+def motion_gate_from_env(totals: Optional[MotionTotals] = None) -> Optional[MotionGate]:
+    """Build a gate from ``PHONE_DETECT_MOTION_GATE`` / ``PHONE_DETECT_REFRESH_SEC``.
+
+    Gating is opt-in: returns ``None`` unless ``PHONE_DETECT_MOTION_GATE=1``.
+    """
+    if os.getenv("PHONE_DETECT_MOTION_GATE", "0") != "1":
+        return None
+    return MotionGate(
+        refresh_sec=float(os.getenv("PHONE_DETECT_REFRESH_SEC", DEFAULT_REFRESH_SEC)),
+        totals=totals,
+    )
@@ -0,0 +1,112 @@
+"""Wire format for /ws/phone-detect frames.
+
+Clients may send either of two frame encodings on the same socket:
+
+* JSON text (legacy): ``{"type": "frame", "frame_id": "...", "image": "data:image/jpeg;base64,..."}``
+* Binary: a fixed 16-byte little-endian header followed by the raw JPEG or
+  WebP bytes, with no base64 or JSON step.
+
+Binary header layout::
+
+    offset  size  field
+    0       2     magic b"LF"
+    2       1     version (1)
+    3       1     flags (FLAG_*)
+    4       4     frame_id, uint32
+    8       8     client timestamp, uint64 milliseconds since the epoch
+
+Binary frames are decoded straight from the received buffer.  The
+``split_*`` helpers stop before the image decode, for callers that time the
+two steps separately.
+"""
+
+from __future__ import annotations
+
+import base64
+import struct
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
+
+FRAME_MAGIC = b"LF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBIQ")
+
+# Flag bits (informational: cv2.imdecode sniffs the format itself)
+FLAG_WEBP = 0x01
+
+
+class FrameError(ValueError):
+    """Raised for a frame that cannot be parsed or decoded.
+
+    ``code`` is the error code sent back to the client.
+    """
+
+    def __init__(self, code: str, frame_id: Union[int, str, None] = None):
+        super().__init__(code)
+        self.code = code
+        self.frame_id = frame_id
+
+
+@dataclass(frozen=True)
+class Frame:
+    """One decoded client frame, whichever encoding it arrived in."""
+
+    frame_id: Union[int, str, None]
+    image: np.ndarray
+    client_ts_ms: Optional[int] = None
+    flags: int = 0
+    binary: bool = False
+
+
+def pack_frame(frame_id: int, timestamp_ms: int, image_bytes: bytes, flags: int = 0) -> bytes:
+    """Build a binary frame (used by tests and Python clients)."""
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, frame_id, timestamp_ms) + image_bytes
+
+
+def decode_image(buf: Any, frame_id: Union[int, str, None] = None) -> np.ndarray:
+    """Decode JPEG/WebP bytes (any buffer) to a BGR array."""
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise FrameError("invalid_frame", frame_id)
+    return image
+
+
+def split_binary_frame(data: bytes) -> Tuple[int, int, int, memoryview]:
+    """Check a binary frame's header; returns (frame_id, flags, timestamp_ms, image bytes view)."""
+    if len(data) <= FRAME_HEADER.size:
+        raise FrameError("invalid_frame")
+    magic, version, flags, frame_id, timestamp_ms = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise FrameError("unsupported_frame_version", frame_id)
+    return frame_id, flags, timestamp_ms, memoryview(data)[FRAME_HEADER.size:]
+
+
+def parse_binary_frame(data: bytes) -> Frame:
+    """Parse a binary frame; the image is decoded from a view of ``data``."""
+    frame_id, flags, timestamp_ms, image_bytes = split_binary_frame(data)
+    image = decode_image(image_bytes, frame_id)
+    return Frame(frame_id=frame_id, image=image, client_ts_ms=timestamp_ms, flags=flags, binary=True)
+
+
+def split_json_frame(msg: dict) -> Tuple[Union[int, str, None], bytes]:
+    """Base64-decode a legacy JSON frame message; returns (frame_id, image bytes)."""
+    frame_id = msg.get("frame_id")
+    image_b64 = msg.get("image") or msg.get("data")
+    if not image_b64:
+        raise FrameError("invalid_frame", frame_id)
+    if image_b64.startswith("data:"):
+        image_b64 = image_b64.split(",", 1)[1]
+    try:
+        return frame_id, base64.b64decode(image_b64)
+    except Exception:
+        raise FrameError("invalid_frame", frame_id)
+
+
+def parse_json_frame(msg: dict) -> Frame:
+    """Decode a legacy JSON frame message (already ``json.loads``-ed)."""
+    frame_id, img_bytes = split_json_frame(msg)
+    return Frame(frame_id=frame_id, image=decode_image(img_bytes, frame_id))
@@ -0,0 +1,130 @@
+"""Server-driven frame rate, resolution and JPEG quality for Lock-In clients.
+
+Clients used to pick their own frame rate and size.  Under load that means
+bandwidth and decode time spent on frames the latest-frame slot then drops.
+A :class:`FrameRateController` runs per connection and every
+``interval_sec`` turns measurements into a recommendation:
+
+* fps is capped by the connection's own end-to-end latency (frames sent
+  faster than they are processed only supersede each other), and by its
+  fair share of the detector: ``target_utilization`` of the measured
+  capacity, split across active connections;
+* a per-user frame cap (the batcher's rate limit, split across the user's
+  connections) is never exceeded, since frames over it are dropped anyway;
+* a backlog in the batcher means the share is too generous, so it shrinks;
+* resolution and JPEG quality step down a ladder when even the minimum fps
+  is too much, and back up when there is clear headroom.
+
+Changes are smoothed and move one ladder step at a time, so the loop
+settles instead of oscillating.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+DEFAULT_MIN_FPS = 1.0
+DEFAULT_MAX_FPS = 10.0
+DEFAULT_INITIAL_FPS = 3.0  # what the web client sends before any advice
+DEFAULT_TARGET_UTILIZATION = 0.8
+DEFAULT_INTERVAL_SEC = 2.0
+# (max width, max height, JPEG quality), cheapest first.
+LADDER: Tuple[Tuple[int, int, float], ...] = ((320, 240, 0.5), (320, 240, 0.6), (480, 360, 0.6), (640, 480, 0.7))
+# Ladder step matching the web client's default 320px / 0.6 frames.
+DEFAULT_LEVEL = 1
+# Smoothing factor for fps changes.
+_ALPHA = 0.5
+
+
+class FrameRateController:
+    """Closed-loop frame rate / size advice for one connection."""
+
+    def __init__(
+        self,
+        min_fps: float = DEFAULT_MIN_FPS,
+        max_fps: float = DEFAULT_MAX_FPS,
+        target_utilization: float = DEFAULT_TARGET_UTILIZATION,
+        interval_sec: float = DEFAULT_INTERVAL_SEC,
+        ladder: Sequence[Tuple[int, int, float]] = LADDER,
+        level: int = DEFAULT_LEVEL,
+    ):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.target_utilization = target_utilization
+        self.interval_sec = interval_sec
+        self.ladder = tuple(ladder)
+        self.level = min(max(level, 0), len(self.ladder) - 1)
+        self.fps = min(max(DEFAULT_INITIAL_FPS, min_fps), max_fps)
+        self._last_sent = time.monotonic()
+
+    def due(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return now - self._last_sent >= self.interval_sec
+
+    def advise(
+        self,
+        latency_ms: Optional[float],
+        capacity_fps: Optional[float],
+        clients: int,
+        backlog: int,
+        backlog_limit: int,
+        now: Optional[float] = None,
+        fps_cap: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Update the recommendation and return it as a ``control`` message.
+
+        ``latency_ms`` is this connection's typical end-to-end frame time,
+        ``capacity_fps`` the detector's measured frames/s across replicas,
+        ``backlog`` the frames waiting in the batcher and ``backlog_limit``
+        how many it can absorb without queueing (one batch per replica).
+        ``fps_cap`` is the most this connection may send before frames are
+        rate-limited.
+        """
+        self._last_sent = time.monotonic() if now is None else now
+        share = self.target_utilization * capacity_fps / max(1, clients) if capacity_fps else None
+        target = self.max_fps
+        if latency_ms:
+            target = min(target, 1000.0 / latency_ms)
+        if share is not None:
+            target = min(target, share)
+        if fps_cap:
+            target = min(target, fps_cap)
+        congested = backlog > backlog_limit
+        if congested:
+            target *= 0.7
+
+        if (congested or target < self.min_fps) and self.level > 0:
+            self.level -= 1
+        elif (
+            not congested
+            and share is not None
+            and share >= 2 * self.fps
+            and target >= self.fps
+            and self.level < len(self.ladder) - 1
+        ):
+            # Twice the detector share we use, and latency keeps up: spend it on detail.
+            self.level += 1
+
+        self.fps += _ALPHA * (target - self.fps)
+        self.fps = min(max(self.fps, self.min_fps), self.max_fps)
+        max_width, max_height, quality = self.ladder[self.level]
+        return {
+            "type": "control",
+            "fps": round(self.fps, 1),
+            "max_width": max_width,
+            "max_height": max_height,
+            "jpeg_quality": quality,
+        }
+
+
+def rate_controller_from_env() -> Optional[FrameRateController]:
+    """``PHONE_DETECT_CONTROL=0`` disables advice; ``PHONE_DETECT_MIN_FPS`` / ``_MAX_FPS`` / ``_CONTROL_SEC`` tune it."""
+    if os.getenv("PHONE_DETECT_CONTROL", "1") != "1":
+        return None
+    return FrameRateController(
+        min_fps=float(os.getenv("PHONE_DETECT_MIN_FPS", DEFAULT_MIN_FPS)),
+        max_fps=float(os.getenv("PHONE_DETECT_MAX_FPS", DEFAULT_MAX_FPS)),
+        interval_sec=float(os.getenv("PHONE_DETECT_CONTROL_SEC", DEFAULT_INTERVAL_SEC)),
+    )
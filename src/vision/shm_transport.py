@@ -0,0 +1,279 @@
+"""Shared-memory frame transport to a detector in another process.
+
+Running the detector in its own process keeps torch out of the API workers
+and lets vision scale out separately.  Sending frames there as base64 JSON
+would add an encode, a decode and several copies per frame.  Instead the
+API side owns a :class:`FrameRing`: ``slots`` fixed-size frame buffers in a
+single ``multiprocessing.shared_memory`` block.  A decoded frame is copied
+into the next slot once, and only ``(slot, shape)`` goes over the pipe.  The
+detector process wraps the slot in a numpy array and runs the model on it
+in place.  Results come back over the pipe as small box/conf/class arrays.
+
+:class:`ShmDetector` has the same ``predict`` / ``restrict`` / ``warmup``
+interface as :class:`~src.vision.detectors.YoloDetector`, so the batcher
+and API do not care which one they hold.  The other end is either a child
+process started by :func:`spawn_detector`, or a standalone process
+(``python phone-detector/app.py --shm-serve ADDRESS``) reached with
+:func:`connect_detector`.  Both ends must be on the same host.
+
+Frames larger than a slot fall back to being pickled over the pipe.
+
+A standalone process serves one detector to every client, so its class
+filter is shared too: the first ``restrict`` sets it, and a client asking
+for a different one gets an error instead of changing it under the others.
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .detectors import DEFAULT_IMGSZ, Detections
+
+DEFAULT_SLOTS = 16
+# Largest frame (H, W, C) that travels through shared memory.
+DEFAULT_SLOT_SHAPE = (720, 1280, 3)
+
+Address = Union[str, Tuple[str, int]]
+
+
+class FrameRing:
+    """``slots`` frame buffers of ``slot_bytes`` each in one shared-memory block."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, slot_bytes: int, owner: bool):
+        self.shm = shm
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = owner
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, slots: int = DEFAULT_SLOTS, slot_bytes: int = int(np.prod(DEFAULT_SLOT_SHAPE))) -> "FrameRing":
+        return cls(shared_memory.SharedMemory(create=True, size=slots * slot_bytes), slots, slot_bytes, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, slots: int, slot_bytes: int, untrack: bool = False) -> "FrameRing":
+        """Open a ring created by another process.
+
+        A standalone server has its own resource tracker, which would unlink
+        the block when the server exits; ``untrack`` leaves that to the owner.
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if untrack:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, slots, slot_bytes, owner=False)
+
+    def view(self, slot: int, shape: Sequence[int]) -> np.ndarray:
+        """A uint8 array of ``shape`` backed directly by ``slot``."""
+        return np.ndarray(tuple(shape), dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot: int, frame: np.ndarray) -> Tuple[int, ...]:
+        self.view(slot, frame.shape)[...] = frame
+        return frame.shape
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class ShmDetector:
+    """Detector proxy: frames go through a :class:`FrameRing`, results over ``conn``.
+
+    Calls are serialised on one pipe, so a slot is never reused while the
+    detector process still reads it.
+    """
+
+    def __init__(
+        self,
+        conn: Connection,
+        slots: int = DEFAULT_SLOTS,
+        slot_shape: Sequence[int] = DEFAULT_SLOT_SHAPE,
+        process: Optional[mp.process.BaseProcess] = None,
+    ):
+        self.ring = FrameRing.create(slots, int(np.prod(slot_shape)))
+        self.process = process
+        self.inline_frames = 0
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._next_slot = 0
+        try:
+            # Blocks until the other side has its model loaded.
+            self.names = {int(k): v for k, v in self._call("hello", self.ring.name, slots, self.ring.slot_bytes).items()}
+        except BaseException:
+            self.close()
+            raise
+
+    def _exchange(self, msg: Tuple[Any, ...]) -> Any:
+        self._conn.send(msg)
+        status, result = self._conn.recv()
+        if status == "error":
+            raise RuntimeError(f"Detector process: {result}")
+        return result
+
+    def _call(self, *msg: Any) -> Any:
+        with self._lock:
+            return self._exchange(msg)
+
+    def restrict(self, class_ids, conf_threshold: Optional[float] = None) -> None:
+        self._call("restrict", sorted(class_ids) if class_ids is not None else None, conf_threshold)
+
+    def warmup(self, shape: Sequence[int] = (480, 640, 3)) -> float:
+        return self._call("warmup", tuple(shape))
+
+    def predict(self, frames: Sequence[np.ndarray]) -> List[Detections]:
+        out: List[Detections] = []
+        for start in range(0, len(frames), self.ring.slots):
+            with self._lock:
+                items: List[Any] = []
+                for frame in frames[start:start + self.ring.slots]:
+                    if self.ring.fits(frame):
+                        slot = self._next_slot
+                        self._next_slot = (slot + 1) % self.ring.slots
+                        items.append((slot, self.ring.write(slot, frame)))
+                    else:
+                        self.inline_frames += 1
+                        items.append(np.ascontiguousarray(frame))
+                results = self._exchange(("predict", items))
+            out.extend(Detections(xyxy, conf, cls) for xyxy, conf, cls in results)
+        return out
+
+    def close(self) -> None:
+        """Stop the detector process (if we started it) and free the ring."""
+        try:
+            self._conn.send(("close",))
+        except (OSError, ValueError):
+            pass
+        self._conn.close()
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.ring.close()
+
+
+def serve_connection(
+    conn: Connection,
+    detector: Any,
+    lock: Optional[threading.Lock] = None,
+    untrack: bool = False,
+    shared: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Answer one :class:`ShmDetector` until it closes or disconnects.
+
+    ``shared`` is state common to every connection to ``detector`` (see
+    :func:`serve_forever`); it pins the first class filter requested.
+    """
+    lock = lock or threading.Lock()
+    ring: Optional[FrameRing] = None
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            op = msg[0]
+            if op == "close":
+                return
+            try:
+                with lock:
+                    if op == "hello":
+                        ring = FrameRing.attach(msg[1], msg[2], msg[3], untrack=untrack)
+                        result = detector.names
+                    elif op == "restrict":
+                        if shared is not None:
+                            applied = shared.setdefault("restrict", (msg[1], msg[2]))
+                            if applied != (msg[1], msg[2]):
+                                raise ValueError(f"shared detector is already restricted to {applied}")
+                        detector.restrict(msg[1], msg[2])
+                        result = None
+                    elif op == "warmup":
+                        result = detector.warmup(msg[1])
+                    elif op == "predict":
+                        frames = [item if isinstance(item, np.ndarray) else ring.view(*item) for item in msg[1]]
+                        dets = detector.predict(frames)
+                        # Drop the views before the ring can be closed.
+                        del frames
+                        result = [(d.xyxy, d.conf, d.cls) for d in dets]
+                    else:
+                        raise ValueError(f"Unknown request '{op}'")
+                conn.send(("ok", result))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        if ring is not None:
+            ring.close()
+        conn.close()
+
+
+def _worker_main(conn: Connection, weights: str, backend: str, int8: bool, imgsz: int) -> None:
+    from .detectors import load_detector
+
+    serve_connection(conn, load_detector(weights, backend=backend, int8=int8, imgsz=imgsz))
+
+
+def spawn_detector(
+    weights: str,
+    backend: str = "torch",
+    int8: bool = False,
+    imgsz: int = DEFAULT_IMGSZ,
+    slots: int = DEFAULT_SLOTS,
+    slot_shape: Sequence[int] = DEFAULT_SLOT_SHAPE,
+) -> ShmDetector:
+    """Start a child process that loads the model, and connect to it."""
+    # spawn, not fork: the API process may already hold threads and torch state.
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe()
+    process = ctx.Process(target=_worker_main, args=(child, weights, backend, int8, imgsz), name="phone-detector", daemon=True)
+    process.start()
+    # Only the child holds this end now, so its exit shows up as EOF here.
+    child.close()
+    return ShmDetector(parent, slots, slot_shape, process=process)
+
+
+def parse_address(value: str) -> Address:
+    """``host:port`` for TCP, anything else is a Unix socket path."""
+    host, sep, port = value.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return value
+
+
+def authkey_from_env() -> bytes:
+    """``PHONE_DETECT_AUTHKEY``; requests are pickled, so a key is required."""
+    key = os.getenv("PHONE_DETECT_AUTHKEY")
+    if not key:
+        raise RuntimeError("Set PHONE_DETECT_AUTHKEY to use a standalone detector process")
+    return key.encode("utf-8")
+
+
+def connect_detector(
+    address: Address,
+    authkey: bytes,
+    slots: int = DEFAULT_SLOTS,
+    slot_shape: Sequence[int] = DEFAULT_SLOT_SHAPE,
+) -> ShmDetector:
+    """Connect to a standalone detector process on this host."""
+    return ShmDetector(Client(address, authkey=authkey), slots, slot_shape)
+
+
+def serve_forever(address: Address, detector: Any, authkey: bytes) -> None:
+    """Serve ``detector`` to every API process that connects to ``address``."""
+    lock = threading.Lock()
+    shared: Dict[str, Any] = {}
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=serve_connection, args=(conn, detector, lock, True, shared), daemon=True).start()
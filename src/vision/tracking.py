@@ -0,0 +1,189 @@
+"""Detect-then-track: run the detector every few frames, track in between.
+
+Once a phone is on screen, re-running YOLO just to follow it is wasted work.
+:class:`DetectTracker` keeps a set of tracks with stable IDs.  On detector
+frames (:meth:`observe`) new boxes are matched to existing tracks by IoU
+within the same class; a match keeps its ID.  On the frames in between
+(:meth:`propagate`) every box is carried forward with sparse Lucas-Kanade
+optical flow, using the median motion of corner features inside it.
+
+The detector is due again every ``detect_every`` frames.  It is also due
+straight away when a track loses its features, the frame size changes, or
+nothing has been detected yet.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from .detectors import Detections, box_iou
+
+DEFAULT_DETECT_EVERY = 5
+# Minimum IoU for a detection to continue an existing track.
+MATCH_IOU = 0.3
+# Detector passes a track may go unmatched before it is dropped.
+MAX_MISSES = 2
+# Fewer surviving flow points than this and the track counts as lost.
+MIN_TRACK_POINTS = 4
+
+_FEATURES = dict(maxCorners=30, qualityLevel=0.01, minDistance=3, blockSize=5)
+_FLOW = dict(winSize=(15, 15), maxLevel=2)
+# Lucas-Kanade stops after this many iterations or below this step size.
+_FLOW_ITERATIONS, _FLOW_EPS = 10, 0.03
+
+
+def _gray(frame: np.ndarray) -> np.ndarray:
+    # cv2 is imported on first use so API workers without vision never load it.
+    import cv2
+
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+@dataclass
+class Track:
+    track_id: int
+    box: np.ndarray  # xyxy, float32
+    conf: float
+    cls: int
+    misses: int = 0
+    points: np.ndarray = field(default_factory=lambda: np.zeros((0, 1, 2), np.float32))
+
+
+class DetectTracker:
+    """Stable-ID tracker fed by periodic detections."""
+
+    def __init__(self, detect_every: int = DEFAULT_DETECT_EVERY, match_iou: float = MATCH_IOU, max_misses: int = MAX_MISSES):
+        self.detect_every = max(1, detect_every)
+        self.match_iou = match_iou
+        self.max_misses = max_misses
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self._prev_gray: Optional[np.ndarray] = None
+        self._since_detect = 0
+        self._lost = False
+
+    def due(self, frame: np.ndarray) -> bool:
+        """Whether ``frame`` should go through the detector."""
+        return (
+            self._prev_gray is None
+            or self._prev_gray.shape != frame.shape[:2]
+            or self._lost
+            or self._since_detect >= self.detect_every
+        )
+
+    def observe(self, frame: np.ndarray, dets: Detections) -> Detections:
+        """Fold a detector result into the tracks; returns it with track IDs."""
+        gray = _gray(frame)
+        unmatched = list(range(len(dets)))
+        if self.tracks and len(dets):
+            iou = box_iou(np.stack([t.box for t in self.tracks]), dets.xyxy)
+            iou[np.array([t.cls for t in self.tracks])[:, None] != dets.cls[None, :]] = 0.0
+            matched_tracks = set()
+            while True:
+                i, j = np.unravel_index(np.argmax(iou), iou.shape)
+                if iou[i, j] < self.match_iou:
+                    break
+                track = self.tracks[i]
+                track.box, track.conf, track.misses = dets.xyxy[j].copy(), float(dets.conf[j]), 0
+                matched_tracks.add(i)
+                unmatched.remove(j)
+                iou[i, :] = 0.0
+                iou[:, j] = 0.0
+            for i, track in enumerate(self.tracks):
+                if i not in matched_tracks:
+                    track.misses += 1
+        else:
+            for track in self.tracks:
+                track.misses += 1
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for j in unmatched:
+            self.tracks.append(Track(self._next_id, dets.xyxy[j].copy(), float(dets.conf[j]), int(dets.cls[j])))
+            self._next_id += 1
+
+        for track in self.tracks:
+            track.points = self._features(gray, track.box)
+        self._prev_gray = gray
+        self._since_detect = 0
+        self._lost = False
+        return self.detections()
+
+    def propagate(self, frame: np.ndarray) -> Detections:
+        """Carry the confirmed tracks onto ``frame`` with optical flow."""
+        import cv2
+
+        gray = _gray(frame)
+        self._since_detect += 1
+        confirmed = [t for t in self.tracks if t.misses == 0]
+        live = [t for t in confirmed if len(t.points)]
+        if len(live) < len(confirmed):
+            # A confirmed box with no features (small or textureless) cannot
+            # be followed; re-detect rather than report it unchanged.
+            self._lost = True
+        if live:
+            prev_pts = np.concatenate([t.points for t in live])
+            criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, _FLOW_ITERATIONS, _FLOW_EPS)
+            next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None, criteria=criteria, **_FLOW)
+            offset = 0
+            for track in live:
+                n = len(track.points)
+                ok = status[offset:offset + n, 0] == 1
+                old, new = prev_pts[offset:offset + n][ok, 0], next_pts[offset:offset + n][ok, 0]
+                offset += n
+                if len(new) < MIN_TRACK_POINTS:
+                    # Too little texture left to follow; ask for a detection.
+                    self._lost = True
+                    track.points = new.reshape(-1, 1, 2)
+                    continue
+                track.box = self._move_box(track.box, old, new)
+                track.points = new.reshape(-1, 1, 2)
+        self._prev_gray = gray
+        return self.detections()
+
+    def detections(self) -> Detections:
+        """Tracks confirmed by the latest detector pass, with their IDs."""
+        live = [t for t in self.tracks if t.misses == 0]
+        if not live:
+            return Detections.empty(with_ids=True)
+        return Detections(
+            np.stack([t.box for t in live]).astype(np.float32),
+            np.array([t.conf for t in live], np.float32),
+            np.array([t.cls for t in live], np.int64),
+            ids=np.array([t.track_id for t in live], np.int64),
+        )
+
+    @staticmethod
+    def _features(gray: np.ndarray, box: np.ndarray) -> np.ndarray:
+        import cv2
+
+        h, w = gray.shape
+        x1, y1, x2, y2 = np.clip(box, 0, [w - 1, h - 1, w - 1, h - 1]).astype(int)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return np.zeros((0, 1, 2), np.float32)
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        points = cv2.goodFeaturesToTrack(gray, mask=mask, **_FEATURES)
+        return points if points is not None else np.zeros((0, 1, 2), np.float32)
+
+    @staticmethod
+    def _move_box(box: np.ndarray, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """Shift (and rescale) ``box`` by the median motion of its points."""
+        shift = np.median(new - old, axis=0)
+        old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = old_spread > 1e-3
+        scale = float(np.median(new_spread[valid] / old_spread[valid])) if valid.any() else 1.0
+        center = (box[:2] + box[2:]) / 2 + shift
+        half = (box[2:] - box[:2]) / 2 * scale
+        return np.concatenate([center - half, center + half]).astype(np.float32)
+
+
+def tracker_from_env() -> Optional[DetectTracker]:
+    """``PHONE_DETECT_MODE=track`` enables tracking; ``PHONE_DETECT_TRACK_EVERY`` sets K."""
+    if os.getenv("PHONE_DETECT_MODE", "detect").lower() != "track":
+        return None
+    return DetectTracker(detect_every=int(os.getenv("PHONE_DETECT_TRACK_EVERY", DEFAULT_DETECT_EVERY)))
@@ -0,0 +1,408 @@
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+# Add project root to sys.path to allow imports from src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.dithering import ERROR_DIFFUSION_KERNELS, error_diffusion_dither
+
+BLACK_CREAM = [(0, 0, 0), (254, 241, 220)]
+FOUR_COLORS = [(0, 0, 0), (254, 241, 220), (120, 30, 40), (20, 200, 90)]
+
+
+def _reference_dither(pil_img, palette, kernel):
+    """Per-pixel row-major scan, as the original backend helpers did it."""
+    arr = np.array(pil_img).astype(np.float32)
+    h, w, _ = arr.shape
+    pal = np.array(palette, dtype=np.float32)
+    for y in range(h):
+        for x in range(w):
+            old = arr[y, x].copy()
+            diffs = pal - old
+            nearest = pal[int(np.argmin((diffs * diffs).sum(axis=1)))]
+            arr[y, x] = nearest
+            err = old - nearest
+            for dy, dx, weight in kernel:
+                if y + dy < h and 0 <= x + dx < w:
+                    arr[y + dy, x + dx] += err * weight
+    return np.clip(arr, 0, 255).astype(np.uint8)
+
+
+def test_error_diffusion_matches_reference_scan():
+    rng = np.random.default_rng(0)
+    for h, w in [(1, 1), (1, 7), (6, 1), (13, 9), (40, 33)]:
+        img = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+        for palette in (BLACK_CREAM, FOUR_COLORS):
+            for name, kernel in ERROR_DIFFUSION_KERNELS.items():
+                expected = _reference_dither(img, palette, kernel)
+                actual = np.array(error_diffusion_dither(img, palette, kernel))
+                assert (actual == expected).all(), (name, h, w, len(palette))
+
+
+def test_error_diffusion_is_independent_of_band_size():
+    from src.dithering.error_diffusion import error_diffusion_indices
+
+    rng = np.random.default_rng(1)
+    arr = rng.integers(0, 256, (50, 21, 3)).astype(np.float32)
+    pal = np.array(BLACK_CREAM, dtype=np.float32)
+    for kernel in ERROR_DIFFUSION_KERNELS.values():
+        full = error_diffusion_indices(arr, pal, kernel, band_rows=1000)
+        for band_rows in (1, 2, 3, 16):
+            assert (error_diffusion_indices(arr, pal, kernel, band_rows=band_rows) == full).all()
+
+
+def test_bayer_matrix_is_a_permutation():
+    from src.dithering import bayer_matrix
+
+    for order in (2, 4, 8, 16):
+        assert sorted(bayer_matrix(order).ravel().tolist()) == list(range(order * order))
+
+
+def test_ordered_dither_uses_every_palette_step():
+    from src.dithering import ordered_dither
+
+    ramp = np.tile(np.arange(256, dtype=np.uint8), (16, 1))
+    img = Image.fromarray(np.stack([ramp] * 3, axis=-1))
+    palette = [(0, 0, 0), (85, 85, 85), (170, 170, 170), (255, 255, 255)]
+    out = np.array(ordered_dither(img, palette, order=4))
+    assert {tuple(c) for c in out.reshape(-1, 3)} == set(palette)
+    assert (out[:, 0] == 0).all() and (out[:, -1] == 255).all()
+
+
+def test_ordered_dither_follows_luminance_for_unsorted_palettes():
+    from src.dithering import PALETTES, dither_indices, luminance_ramp
+
+    ramp = np.tile(np.arange(256, dtype=np.uint8), (16, 1))
+    img = Image.fromarray(np.stack([ramp] * 3, axis=-1))
+    pico8 = PALETTES["pico8"]
+    lum = np.array(pico8, dtype=np.float64) @ [0.299, 0.587, 0.114]
+    assert (np.diff(lum[luminance_ramp(pico8)]) >= 0).all()
+
+    out_lum = lum[dither_indices(img, pico8, "Bayer", order=4)]
+    # A grey ramp must come out as a dark-to-light ramp, column averages included.
+    assert out_lum[:, 0].max() == lum.min() and out_lum[:, -1].min() == lum.max()
+    column_mean = out_lum.mean(axis=0)
+    assert np.corrcoef(column_mean, np.arange(256))[0, 1] > 0.99
+
+
+def test_parallel_error_diffusion_is_bit_identical():
+    from src.dithering import parallel_error_diffusion_indices
+    from src.dithering.error_diffusion import error_diffusion_indices
+
+    rng = np.random.default_rng(2)
+    arr = rng.integers(0, 256, (45, 31, 3)).astype(np.float32)
+    pal = np.array(FOUR_COLORS, dtype=np.float32)
+    for name in ("FloydSteinberg", "Stucki"):
+        kernel = ERROR_DIFFUSION_KERNELS[name]
+        expected = error_diffusion_indices(arr, pal, kernel)
+        # Band processes are reused, so a second call must find the semaphores drained.
+        for workers in (3, 2):
+            assert (parallel_error_diffusion_indices(arr, pal, kernel, workers=workers) == expected).all(), name
+
+
+def test_dither_cache_lru_and_disk_tier(tmp_path):
+    from src.dithering import DitherCache, cache_key
+
+    key_a = cache_key(b"photo", "Atkinson", BLACK_CREAM)
+    key_b = cache_key(b"photo", "Sierra", BLACK_CREAM)
+    assert key_a != key_b
+    assert key_a == cache_key(b"photo", "Atkinson", BLACK_CREAM)
+
+    cache = DitherCache(max_bytes=10, disk_dir=str(tmp_path))
+    assert cache.get(key_a) is None
+    cache.put(key_a, b"aaaaaa")
+    cache.put(key_b, b"bbbbbb")  # evicts key_a from memory, still on disk
+    assert cache.stats()["entries"] == 1
+    assert cache.get(key_a) == b"aaaaaa"
+    assert cache.get(key_a) == b"aaaaaa"
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["disk_hits"], stats["memory_hits"]) == (1, 1, 1)
+
+
+def test_open_downscaled_caps_jpeg_decode():
+    import io
+
+    from src.dithering import open_downscaled, resize_renditions
+
+    rng = np.random.default_rng(3)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (900, 1200, 3), dtype=np.uint8)).save(buf, format="JPEG")
+    img = open_downscaled(buf.getvalue(), 256)
+    assert max(img.size) == 256 and img.mode == "RGB"
+    sizes = {size: max(r.size) for size, r in resize_renditions(img, (64, 128, 256)).items()}
+    assert sizes == {64: 64, 128: 128, 256: 256}
+
+
+def test_rendition_pixels_do_not_depend_on_sibling_sizes():
+    import io
+
+    from src.dithering import decode_sizes, free_shared, render_renditions
+    from src.dithering.pool import read_payload
+
+    rng = np.random.default_rng(8)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (900, 1200, 3), dtype=np.uint8)).save(buf, format="JPEG")
+    data = buf.getvalue()
+
+    # 64 alone decodes at 1/8 scale, next to 256 it used to come from the 1/2-scale decode.
+    alone = render_renditions(data, FOUR_COLORS, "Atkinson", [64])
+    together = render_renditions(data, FOUR_COLORS, "Atkinson", [64, 256])
+    assert together[64] == alone[64]
+
+    def pixels_at_64(sizes):
+        decoded = decode_sizes(data, sizes)
+        try:
+            width, height, handle = decoded[64]
+            return width, height, read_payload(handle)
+        finally:
+            for _, _, handle in decoded.values():
+                free_shared(handle)
+
+    assert pixels_at_64([None, 64, 256]) == pixels_at_64([64])
+
+
+def _slow_identity(payload):
+    import time
+
+    time.sleep(0.2)
+    return payload
+
+
+def test_image_pool_rejects_when_saturated():
+    import asyncio
+
+    from src.dithering import ImageJobPool, PoolSaturated
+
+    pool = ImageJobPool(workers=0, max_queue=0)
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(_slow_identity, b"a"))
+        await asyncio.sleep(0.05)
+        try:
+            await pool.run(_slow_identity, b"b")
+        except PoolSaturated as e:
+            assert e.retry_after > 0
+        else:
+            raise AssertionError("second job should have been rejected")
+        assert await first == b"a"
+
+    asyncio.run(scenario())
+    assert pool.stats()["rejected"] == 1
+
+
+def test_image_pool_run_all_fans_out_beyond_capacity():
+    import asyncio
+
+    from src.dithering import ImageJobPool, PoolSaturated
+
+    pool = ImageJobPool(workers=0, max_queue=1)
+    calls = [(_slow_identity, bytes([i])) for i in range(pool.capacity + 3)]
+    results = asyncio.run(pool.run_all(calls))
+    assert results == [bytes([i]) for i in range(len(calls))]
+    assert pool.stats()["rejected"] == 0
+
+    # A plain gather over the same calls overruns the admission limit.
+    async def unbounded():
+        return await asyncio.gather(*(pool.run(*call) for call in calls), return_exceptions=True)
+
+    assert any(isinstance(r, PoolSaturated) for r in asyncio.run(unbounded()))
+
+
+def _granted_workers(payload, workers=1):
+    import time
+
+    time.sleep(0.1)
+    return workers
+
+
+def test_image_pool_shares_one_band_budget():
+    import asyncio
+
+    from src.dithering import ImageJobPool
+
+    serial = ImageJobPool(workers=0, max_queue=4)
+    assert asyncio.run(serial.run(_granted_workers, b"a", bands=True)) == 1
+
+    pool = ImageJobPool(workers=0, max_queue=4, band_workers=4)
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(_granted_workers, b"a", bands=True))
+        await asyncio.sleep(0.02)
+        # The first job holds the whole budget; the second runs serially.
+        second = await pool.run(_granted_workers, b"b", bands=True)
+        return await first, second, await pool.run(_granted_workers, b"c")
+
+    assert asyncio.run(scenario()) == (4, 1, 1)
+    assert pool.stats()["bands_inflight"] == 0
+
+    # With two workers each job gets half the budget, so both run in bands.
+    shared = ImageJobPool(workers=2, max_queue=4, band_workers=4)
+    assert [shared._lease_bands() for _ in range(3)] == [2, 2, 1]
+
+
+def _failing_job(payload):
+    raise ValueError("bad image")
+
+
+def _slow_read_to(payload, out_path):
+    import time
+
+    from src.dithering.pool import read_payload
+
+    open(out_path + ".started", "w").close()
+    time.sleep(0.5)
+    size = len(read_payload(payload))
+    with open(out_path, "w") as f:
+        f.write(str(size))
+
+
+def test_image_pool_counts_outcomes_and_keeps_shared_memory_until_done(tmp_path):
+    import asyncio
+
+    from src.dithering import ImageJobPool
+    from src.dithering.pool import SHARED_MEMORY_MIN_BYTES
+
+    pool = ImageJobPool(workers=0, max_queue=2)
+
+    async def failing():
+        try:
+            await pool.run(_failing_job, b"a")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("job error should propagate")
+        assert await pool.run(_slow_identity, b"b") == b"b"
+
+    asyncio.run(failing())
+    assert (pool.completed, pool.failed) == (1, 1)
+
+    pool = ImageJobPool(workers=1, max_queue=0)
+    out_path = tmp_path / "read.txt"
+    data = b"x" * SHARED_MEMORY_MIN_BYTES
+
+    async def cancelled():
+        job = asyncio.ensure_future(pool.run(_slow_read_to, data, str(out_path)))
+        # Cancel once the worker is running the job, not while it is queued.
+        for _ in range(300):
+            await asyncio.sleep(0.05)
+            if os.path.exists(str(out_path) + ".started"):
+                break
+        job.cancel()
+        try:
+            await job
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(cancelled())
+    finally:
+        pool.shutdown(wait=True)
+    # The worker could still read the whole upload after the request was cancelled.
+    assert out_path.read_text() == str(len(data))
+    assert (pool.completed, pool.cancelled) == (0, 1)
+
+
+def test_shared_memory_payload_round_trip():
+    from multiprocessing import shared_memory
+
+    from src.dithering.pool import SharedBytes, read_payload
+
+    data = bytes(range(256)) * 10
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[:len(data)] = data
+        assert read_payload(SharedBytes(shm.name, len(data))) == data
+        assert read_payload(b"raw") == b"raw"
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_palette_lut_matches_brute_force():
+    from src.dithering import PALETTES, palette_lut
+    from src.dithering.palettes import exact_nearest_indices
+
+    rng = np.random.default_rng(4)
+    pixels = (rng.random((20000, 3)) * 1000 - 350).astype(np.float32)
+    pixels[:5000] = np.round(pixels[:5000] / 8) * 8  # land exactly on cell faces
+    for name, colors in PALETTES.items():
+        lut = palette_lut(colors)
+        assert (lut.nearest_indices(pixels) == exact_nearest_indices(pixels, lut.colors)).all(), name
+
+
+def test_error_diffusion_with_lut_palette_matches_reference():
+    from src.dithering import PALETTES
+
+    rng = np.random.default_rng(5)
+    img = Image.fromarray(rng.integers(0, 256, (12, 10, 3), dtype=np.uint8))
+    kernel = ERROR_DIFFUSION_KERNELS["FloydSteinberg"]
+    expected = _reference_dither(img, PALETTES["pico8"], kernel)
+    assert (np.array(error_diffusion_dither(img, PALETTES["pico8"], kernel)) == expected).all()
+
+
+def test_indexed_encoders_round_trip():
+    import io
+
+    from src.dithering import encode_indexed, render_png
+
+    rng = np.random.default_rng(6)
+    img = Image.fromarray(rng.integers(0, 256, (40, 30, 3), dtype=np.uint8))
+    expected = error_diffusion_dither(img, BLACK_CREAM, ERROR_DIFFUSION_KERNELS["Atkinson"])
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    data = render_png(buf.getvalue(), BLACK_CREAM, "Atkinson", compress_level=9)
+    assert data[24:26] == b"\x01\x03"  # IHDR: 1-bit depth, palette colour type
+    png = Image.open(io.BytesIO(data))
+    assert (np.array(png.convert("RGB")) == np.array(expected)).all()
+
+    idx = rng.integers(0, 4, (16, 16))
+    webp = Image.open(io.BytesIO(encode_indexed(idx, FOUR_COLORS, "webp")))
+    assert webp.format == "WEBP"
+    assert (np.array(webp.convert("RGB")) == np.array(FOUR_COLORS, dtype=np.uint8)[idx]).all()
+
+
+def test_batch_decode_once_matches_single_renders():
+    import io
+    import zipfile
+
+    from src.dithering import decode_sizes, free_shared, render_pixels, render_png, zip_bundle
+
+    rng = np.random.default_rng(7)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (50, 70, 3), dtype=np.uint8)).save(buf, format="PNG")
+    decoded = decode_sizes(buf.getvalue(), [None, 32])
+    assert decoded[None][:2] == (70, 50)
+    assert max(decoded[32][:2]) == 32
+
+    width, height, pixels = decoded[None]
+    try:
+        for algorithm in ("Sierra", "Bayer"):
+            assert render_pixels(pixels, width, height, FOUR_COLORS, algorithm) == render_png(buf.getvalue(), FOUR_COLORS, algorithm)
+    finally:
+        for _, _, handle in decoded.values():
+            free_shared(handle)
+
+    archive = zipfile.ZipFile(io.BytesIO(zip_bundle({"a.png": b"x", "b.png": b"yz"})))
+    assert archive.read("b.png") == b"yz"
+
+
+def test_small_cases_match_benchmark_goldens():
+    import importlib.util
+
+    path = os.path.join(os.path.dirname(__file__), "..", "scripts", "bench_dithering.py")
+    spec = importlib.util.spec_from_file_location("bench_dithering", path)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+
+    goldens = bench.load_goldens()
+    for source in ("noise", "gradient"):
+        for palette in bench.BENCH_PALETTES:
+            for algorithm in bench.ALGORITHMS:
+                name = bench.case_name(source, 64, palette, algorithm)
+                idx, _, _ = bench.run_case(bench.source_image(source, 64), palette, algorithm, repeat=1)
+                assert goldens[name]["output"] == bench.digest(idx.astype(np.uint8)), name
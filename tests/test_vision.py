@@ -0,0 +1,544 @@
+import base64
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+# Add project root to sys.path to allow imports from src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.vision import FLAG_WEBP, FrameError, pack_frame, parse_binary_frame, parse_json_frame
+
+
+def _jpeg(h=24, w=32):
+    img = np.zeros((h, w, 3), dtype=np.uint8)
+    img[:, w // 2:] = (30, 200, 90)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+def test_binary_frame_round_trip():
+    frame = parse_binary_frame(pack_frame(7, 1_700_000_000_123, _jpeg(), flags=FLAG_WEBP))
+    assert frame.binary and frame.frame_id == 7 and frame.flags == FLAG_WEBP
+    assert frame.client_ts_ms == 1_700_000_000_123
+    assert frame.image.shape == (24, 32, 3)
+
+
+def test_binary_frame_errors_keep_frame_id():
+    with pytest.raises(FrameError) as exc:
+        parse_binary_frame(pack_frame(9, 0, b"not an image"))
+    assert exc.value.code == "invalid_frame" and exc.value.frame_id == 9
+
+    with pytest.raises(FrameError) as exc:
+        parse_binary_frame(b"XX" + pack_frame(1, 0, _jpeg())[2:])
+    assert exc.value.code == "unsupported_frame_version"
+
+
+def test_json_frame_still_decodes():
+    data_url = "data:image/jpeg;base64," + base64.b64encode(_jpeg()).decode("ascii")
+    frame = parse_json_frame({"type": "frame", "frame_id": "abc", "image": data_url})
+    assert frame.frame_id == "abc" and not frame.binary
+    assert frame.image.shape == (24, 32, 3)
+
+
+def test_latest_frame_slot_keeps_newest_and_drops_stale():
+    import asyncio
+    import time
+
+    from src.vision import LatestFrameSlot
+
+    async def scenario():
+        slot = LatestFrameSlot(max_age_sec=0.05)
+        for i in range(5):
+            slot.put(i)
+        assert await slot.get() == 4
+
+        slot.put("old")
+        time.sleep(0.08)
+        slot.put("older")  # replaces "old", but is itself fresh
+        assert await slot.get() == "older"
+
+        slot.put("stale")
+        time.sleep(0.08)
+        slot.close()
+        assert await slot.get() is None
+        return slot.drop_counts()
+
+    assert asyncio.run(scenario()) == {"received": 8, "superseded": 5, "stale": 1}
+
+
+def test_inference_batcher_groups_and_routes_results():
+    import asyncio
+
+    from src.vision import InferenceBatcher
+
+    calls = []
+
+    def infer_batch(frames):
+        calls.append(list(frames))
+        return [f * 10 for f in frames]
+
+    async def scenario():
+        batcher = InferenceBatcher(infer_batch, max_batch=4, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [0, 10, 20, 30, 40, 50]
+    assert [len(c) for c in calls] == [4, 2]
+    assert stats["batches"] == 2 and stats["mean_batch_size"] == 3.0
+    assert stats["batch_size_histogram"] == {"2": 1, "4": 1}
+
+
+def test_compare_detections_matches_by_class_and_iou():
+    from src.vision import Detections, compare_detections
+
+    ref = Detections(
+        np.array([[0, 0, 10, 10], [20, 20, 40, 40]], np.float32),
+        np.array([0.9, 0.6], np.float32),
+        np.array([67, 0]),
+    )
+    cand = Detections(
+        np.array([[1, 0, 10, 10], [20, 20, 40, 40], [50, 50, 60, 60]], np.float32),
+        np.array([0.85, 0.6, 0.3], np.float32),
+        np.array([67, 1, 67]),  # second box has the wrong class
+    )
+    report = compare_detections([ref], [cand])
+    assert report["matched"] == 1
+    assert report["recall"] == 0.5 and report["precision"] == 1 / 3
+    assert abs(report["mean_conf_delta"] - 0.05) < 1e-6
+
+    report = compare_detections([ref], [cand], min_conf=0.5, class_ids={67})
+    assert report["recall"] == 1.0 and report["precision"] == 1.0
+
+
+def test_motion_gate_reuses_until_motion_or_refresh():
+    import time
+
+    from src.vision import MotionGate
+
+    still = np.full((120, 160, 3), 90, dtype=np.uint8)
+    gate = MotionGate(refresh_sec=0.2)
+    assert gate.reuse(still) is None  # nothing inferred yet
+    gate.update(still, "dets-1", infer_ms=40.0)
+
+    noisy = still.copy()
+    noisy[0, 0] = 255  # a single pixel is not motion
+    assert gate.reuse(noisy) == "dets-1"
+
+    moved = still.copy()
+    moved[30:90, 40:120] = 200
+    assert gate.reuse(moved) is None
+    gate.update(moved, "dets-2", infer_ms=40.0)
+    assert gate.reuse(moved) == "dets-2"
+
+    time.sleep(0.25)
+    assert gate.reuse(moved) is None  # forced refresh
+    stats = gate.stats()
+    assert stats["skipped"] == 2 and stats["saved_ms"] == 80.0
+    assert gate.totals.stats()["frames"] == 5
+
+
+def test_motion_gate_is_opt_in(monkeypatch):
+    from src.vision import motion_gate_from_env
+
+    monkeypatch.delenv("PHONE_DETECT_MOTION_GATE", raising=False)
+    assert motion_gate_from_env() is None
+    monkeypatch.setenv("PHONE_DETECT_MOTION_GATE", "1")
+    assert motion_gate_from_env().refresh_sec == 0.5
+
+
+def test_detect_tracker_follows_box_and_keeps_ids():
+    from src.vision import DetectTracker, Detections
+
+    rng = np.random.default_rng(0)
+    background = (rng.random((240, 320, 3)) * 60).astype(np.uint8)
+    texture = (rng.random((40, 30, 3)) * 255).astype(np.uint8)
+
+    def frame(x, y):
+        f = background.copy()
+        f[y:y + 40, x:x + 30] = texture
+        return f
+
+    def dets(*boxes):
+        return Detections(np.array(boxes, np.float32), np.full(len(boxes), 0.8, np.float32), np.full(len(boxes), 67))
+
+    tracker = DetectTracker(detect_every=3)
+    first = frame(100, 80)
+    assert tracker.due(first)
+    assert tracker.observe(first, dets([100, 80, 130, 120])).ids.tolist() == [1]
+
+    for k in (1, 2, 3):
+        moved = frame(100 + 3 * k, 80 + 2 * k)
+        assert not tracker.due(moved)
+        box = tracker.propagate(moved).xyxy[0]
+        assert np.allclose(box, [100 + 3 * k, 80 + 2 * k, 130 + 3 * k, 120 + 2 * k], atol=1.0)
+    assert tracker.due(moved)
+
+    # The same phone keeps its ID; a new one gets the next ID.
+    assert tracker.observe(moved, dets([109, 86, 139, 126], [10, 10, 40, 40])).ids.tolist() == [1, 2]
+    # Missed once: hidden from output but kept, so the ID survives a flicker.
+    assert tracker.observe(moved, dets([10, 10, 40, 40])).ids.tolist() == [2]
+    assert tracker.observe(moved, dets([109, 86, 139, 126], [10, 10, 40, 40])).ids.tolist() == [1, 2]
+
+
+def test_detect_tracker_redetects_featureless_track():
+    from src.vision import Detections, DetectTracker
+
+    flat = np.full((240, 320, 3), 90, np.uint8)
+    tracker = DetectTracker(detect_every=10)
+    box = Detections(np.array([[100, 80, 130, 120]], np.float32), np.array([0.8], np.float32), np.array([67]))
+    assert tracker.observe(flat, box).ids.tolist() == [1]
+    assert not tracker.due(flat)
+
+    # No corners to follow: the detector must run on the next frame.
+    tracker.propagate(flat)
+    assert tracker.due(flat)
+
+
+def test_distraction_debouncer_streak_cooldown_and_clear():
+    from src.vision import Detections, DistractionDebouncer
+
+    shape = (480, 640, 3)
+    phone = Detections(np.array([[100, 100, 200, 250]], np.float32), np.array([0.6], np.float32), np.array([67]))
+    tiny = Detections(np.array([[0, 0, 10, 10]], np.float32), np.array([0.9], np.float32), np.array([67]))
+    none = Detections.empty()
+    deb = DistractionDebouncer({67}, 0.2, streak_required=3, clear_frames=2, cooldown_sec=3.0)
+
+    # A background-sized box never counts; a real one needs the full streak.
+    assert [deb.update(tiny, shape, now=t) for t in range(3)] == [None] * 3
+    assert deb.update(phone, shape, now=10) is None
+    assert deb.update(phone, shape, now=11) is None
+    started = deb.update(phone, shape, now=12)
+    assert started["type"] == "distraction_started" and started["count"] == 1 and deb.active
+
+    # A one-frame flicker does not end it; clear_frames misses do.
+    assert deb.update(none, shape, now=13) is None
+    assert deb.update(phone, shape, now=14) is None
+    assert deb.update(none, shape, now=15) is None
+    ended = deb.update(none, shape, now=16)
+    assert ended["type"] == "distraction_ended" and ended["duration_sec"] == 4.0 and not deb.active
+
+    # Within the cooldown a new streak waits; after it, the next event fires.
+    assert [deb.update(phone, shape, now=t) for t in (17, 17.5, 18)] == [None] * 3
+    assert deb.update(phone, shape, now=19.5)["count"] == 2
+
+
+def test_detections_filter_and_compact_layout():
+    from src.vision import Detections
+
+    dets = Detections(
+        np.array([[1.4, 2.6, 11.5, 22.0], [0, 0, 5, 5], [3, 3, 9, 9]], np.float32),
+        np.array([0.9, 0.8, 0.1], np.float32),
+        np.array([67, 0, 67]),
+        ids=np.array([4, 5, 6]),
+    )
+    kept = dets.filter({67}, 0.2)
+    assert len(kept) == 1 and kept.ids.tolist() == [4]
+    assert kept.to_compact({67: "cell phone"}) == {
+        "xyxy": [[1, 3, 12, 22]],
+        "conf": [0.9],
+        "cls": [67],
+        "names": {"67": "cell phone"},
+        "track_id": [4],
+    }
+    assert Detections.empty().to_compact({}) == {"xyxy": [], "conf": [], "cls": [], "names": {}}
+
+
+def test_detections_entries_keep_the_per_box_layout():
+    from src.vision import Detections
+
+    dets = Detections(np.array([[10, 20, 30, 60]], np.float32), np.array([0.5], np.float32), np.array([67]))
+    (entry,) = dets.to_entries({67: "cell phone"}, 100, 200)
+    assert entry == {
+        "class": "cell phone",
+        "confidence": 0.5,
+        "bbox": {"x": 0.1, "y": 0.1, "w": 0.2, "h": 0.2},
+        "bbox_px": {"x1": 10, "y1": 20, "x2": 30, "y2": 60},
+    }
+    assert Detections.empty().to_entries({}, 100, 200) == []
+
+
+def test_stage_metrics_percentiles_roll_up_to_parent():
+    from src.vision import FrameTimer, StageMetrics
+
+    overall = StageMetrics(window=100)
+    conn = overall.child()
+    for ms in range(1, 201):
+        conn.record("infer", float(ms))
+    overall.record("model", 4.0)
+
+    infer = conn.stats()["infer"]
+    # Only the newest 100 samples are kept, but the count covers all of them.
+    assert infer["count"] == 200 and infer["max"] == 200.0
+    assert infer["p50"] == 150.5 and 195 < infer["p95"] < infer["p99"] <= 200
+    assert set(overall.stats()) == {"infer", "model"} and "model" not in conn.stats()
+
+    timer = FrameTimer()
+    timer.add("queue", 1.5)
+    with timer.stage("decode"):
+        pass
+    timings = timer.finish()
+    assert set(timings) == {"queue", "decode", "total"} and timings["total"] >= timings["decode"]
+
+
+def test_shm_detector_round_trip_through_ring():
+    import multiprocessing
+    import threading
+
+    from src.vision import Detections, ShmDetector, serve_connection
+
+    class MeanDetector:
+        names = {67: "cell phone"}
+        classes = None
+
+        def restrict(self, classes, conf):
+            self.classes = classes
+
+        def warmup(self, shape):
+            return 1.0
+
+        def predict(self, frames):
+            # The result depends on the pixels, so the slots must carry them.
+            return [
+                Detections(np.array([[0, 0, f.shape[1], f.shape[0]]], np.float32), np.array([f.mean() / 255], np.float32), np.array([67]))
+                for f in frames
+            ]
+
+    backend = MeanDetector()
+    client_end, server_end = multiprocessing.Pipe()
+    server = threading.Thread(target=serve_connection, args=(server_end, backend))
+    server.start()
+    proxy = ShmDetector(client_end, slots=2, slot_shape=(8, 8, 3))
+    try:
+        assert proxy.names == {67: "cell phone"}
+        proxy.restrict({67, 65}, 0.2)
+        assert backend.classes == [65, 67] and proxy.warmup() == 1.0
+
+        frames = [np.full((8, 8, 3), v, np.uint8) for v in (51, 102, 153)] + [np.full((16, 16, 3), 204, np.uint8)]
+        dets = proxy.predict(frames)
+        assert [round(float(d.conf[0]), 2) for d in dets] == [0.2, 0.4, 0.6, 0.8]
+        assert dets[3].xyxy.tolist() == [[0, 0, 16, 16]]
+        # Three frames fit the 2-slot ring over two round trips; the big one went inline.
+        assert proxy.inline_frames == 1
+    finally:
+        proxy.close()
+        server.join(timeout=5)
+    assert not server.is_alive()
+
+
+def test_shared_detector_refuses_a_conflicting_restrict():
+    import multiprocessing
+    import threading
+
+    from src.vision import ShmDetector, serve_connection
+
+    class FilterDetector:
+        names = {67: "cell phone"}
+        classes = None
+
+        def restrict(self, classes, conf):
+            self.classes = classes
+
+    backend, lock, shared = FilterDetector(), threading.Lock(), {}
+    proxies, servers = [], []
+    for _ in range(2):
+        client_end, server_end = multiprocessing.Pipe()
+        servers.append(threading.Thread(target=serve_connection, args=(server_end, backend, lock, False, shared)))
+        servers[-1].start()
+        proxies.append(ShmDetector(client_end, slots=1, slot_shape=(4, 4, 3)))
+    try:
+        proxies[0].restrict({67}, 0.2)
+        proxies[1].restrict({67}, 0.2)  # the same filter is fine
+        with pytest.raises(RuntimeError, match="already restricted"):
+            proxies[1].restrict({0, 67}, 0.2)
+        assert backend.classes == [67]
+    finally:
+        for proxy in proxies:
+            proxy.close()
+        for server in servers:
+            server.join(timeout=5)
+
+
+def test_inference_batcher_round_robins_users_caps_rate_and_uses_replicas():
+    import asyncio
+    import time
+
+    from src.vision import InferenceBatcher, RateLimited
+
+    calls = []
+
+    def replica(frames):
+        calls.append(list(frames))
+        time.sleep(0.05)
+        return frames
+
+    async def scenario():
+        batcher = InferenceBatcher([replica, replica], max_batch=4, max_wait_ms=20, rate_limit_fps=5)
+        # "hog" floods the queue, but "calm" still gets a frame into the first batch.
+        jobs = [batcher.submit(f"hog{i}", key="hog") for i in range(5)]
+        jobs += [batcher.submit(f"calm{i}", key="calm") for i in range(2)]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert calls[0] == ["hog0", "calm0", "hog1", "calm1"]
+    # The rest went to the second replica while the first was still busy.
+    assert sorted(stats["replica_frames"]) == [3, 4] and stats["max_pending"] == 7
+    # A burst of five per key fits under the 5 frames/s cap.
+    assert not any(isinstance(r, RateLimited) for r in results)
+
+    async def flood():
+        batcher = InferenceBatcher(lambda frames: frames, max_batch=8, max_wait_ms=1, rate_limit_fps=2)
+        return await asyncio.gather(*(batcher.submit(i, key="u") for i in range(4)), return_exceptions=True), batcher
+
+    flooded, batcher = asyncio.run(flood())
+    assert flooded[:2] == [0, 1] and all(isinstance(r, RateLimited) for r in flooded[2:])
+    assert batcher.stats()["rate_limited"] == 2
+
+
+def test_inference_batcher_restarts_only_the_dead_replica():
+    import asyncio
+
+    from src.vision import InferenceBatcher
+
+    class WorkerKilled(BaseException):
+        pass
+
+    def healthy(frames):
+        return frames
+
+    def dies_once(frames):
+        if not dies_once.died:
+            dies_once.died = True
+            raise WorkerKilled("replica lost")
+        return frames
+
+    dies_once.died = False
+
+    async def scenario():
+        batcher = InferenceBatcher([dies_once, healthy], max_batch=1, max_wait_ms=1)
+        # Both workers start idle; the first frame goes to replica 0, which dies on it.
+        first = await asyncio.gather(batcher.submit("a"), return_exceptions=True)
+        await asyncio.sleep(0.01)
+        survivor = batcher._workers[1]
+        assert batcher._workers[0].done() and not survivor.done()
+
+        results = await asyncio.gather(*(batcher.submit(f"f{i}") for i in range(4)))
+        return first, results, survivor, batcher
+
+    first, results, survivor, batcher = asyncio.run(scenario())
+    # The caller of the lost batch is told, instead of waiting forever.
+    assert isinstance(first[0], RuntimeError)
+    assert results == ["f0", "f1", "f2", "f3"]
+    # Only replica 0 was restarted; the live replica 1 worker was kept.
+    assert batcher._workers[1] is survivor and len(batcher._workers) == 2
+    stats = batcher.stats()
+    assert stats["worker_restarts"] == [1, 0] and "WorkerKilled" in stats["last_worker_error"]
+
+
+def test_frame_rate_controller_tracks_capacity_and_backlog():
+    from src.vision import FrameRateController
+
+    ctl = FrameRateController(min_fps=1, max_fps=10, interval_sec=2.0)
+    assert not ctl.due(now=ctl._last_sent + 1) and ctl.due(now=ctl._last_sent + 2)
+
+    # Idle detector: fps climbs towards the cap and detail goes up a step at a time.
+    quiet = dict(latency_ms=40, capacity_fps=100, clients=1, backlog=0, backlog_limit=8)
+    first = ctl.advise(**quiet)
+    assert first == {"type": "control", "fps": 6.5, "max_width": 480, "max_height": 360, "jpeg_quality": 0.6}
+    for _ in range(5):
+        advice = ctl.advise(**quiet)
+    assert advice["fps"] > 9.5 and advice["max_width"] == 640
+
+    # Ten clients sharing 4 frames/s: floor fps, cheapest frames.
+    for _ in range(5):
+        advice = ctl.advise(latency_ms=40, capacity_fps=4, clients=10, backlog=0, backlog_limit=8)
+    assert advice["fps"] == 1.0 and (advice["max_width"], advice["jpeg_quality"]) == (320, 0.5)
+
+    # A backlog shrinks the rate even when the share looks fine.
+    ctl = FrameRateController(min_fps=1, max_fps=10)
+    calm = ctl.advise(latency_ms=40, capacity_fps=20, clients=2, backlog=0, backlog_limit=8)["fps"]
+    ctl = FrameRateController(min_fps=1, max_fps=10)
+    busy = ctl.advise(latency_ms=40, capacity_fps=20, clients=2, backlog=12, backlog_limit=8)
+    assert busy["fps"] < calm and busy["max_width"] == 320 and busy["jpeg_quality"] == 0.5
+
+    # Two tabs sharing one user's 15 frames/s cap are each held to half of it.
+    ctl = FrameRateController(min_fps=1, max_fps=10)
+    for _ in range(6):
+        capped = ctl.advise(latency_ms=40, capacity_fps=100, clients=2, backlog=0, backlog_limit=8, fps_cap=7.5)
+    assert 7 < capped["fps"] <= 7.5
+
+
+def test_cascade_escalates_only_uncertain_frames():
+    from src.vision import CascadeDetector, Detections
+
+    class ScriptedDetector:
+        names = {0: "person", 67: "cell phone"}
+
+        def __init__(self, scores):
+            self.scores = scores
+            self.seen = []
+            self.conf = None
+
+        def restrict(self, classes, conf):
+            self.conf = conf
+
+        def warmup(self, shape):
+            return 1.0
+
+        def predict(self, frames):
+            self.seen.extend(int(f[0, 0, 0]) for f in frames)
+            return [
+                Detections(np.array([[0, 0, 10, 10]] * len(s), np.float32), np.array([c for _, c in s], np.float32), np.array([k for k, _ in s]))
+                for s in (self.scores[int(f[0, 0, 0])] for f in frames)
+            ]
+
+    # Frame id -> (class, conf) boxes from each model.
+    fast = ScriptedDetector({0: [], 1: [(67, 0.9)], 2: [(67, 0.15)], 3: [(67, 0.25), (0, 0.9)], 4: [(0, 0.15)], 5: [(67, 0.05)]})
+    accurate = ScriptedDetector({2: [], 3: [(67, 0.6), (0, 0.9)]})
+    cascade = CascadeDetector(fast, accurate, {67}, conf_threshold=0.2, band=0.1)
+    assert fast.conf == pytest.approx(0.1) and accurate.conf == 0.2
+
+    frames = [np.full((4, 4, 3), i, np.uint8) for i in range(6)]
+    dets = cascade.predict(frames)
+    # Clear (0, 5) and confident (1) frames stay on the fast model; only 2 and 3 are in the band.
+    assert accurate.seen == [2, 3]
+    assert [d.conf.astype(float).round(2).tolist() for d in dets] == [[], [0.9], [], [0.6, 0.9], [], []]
+    stats = cascade.stats()
+    assert stats["frames"] == 6 and stats["escalated"] == 2 and stats["band"] == [0.1, 0.3]
+    assert cascade.warmup() == 2.0
+
+
+def test_latest_value_hands_newest_across_threads():
+    import threading
+
+    from src.vision import LatestValue
+
+    slot = LatestValue()
+    assert slot.get(timeout=0.01) is None
+    for i in range(3):
+        slot.put(i)
+    assert slot.get(timeout=0) == 2 and slot.superseded == 2
+
+    got = []
+    consumer = threading.Thread(target=lambda: got.append(slot.get(timeout=5)))
+    consumer.start()
+    slot.put("frame")
+    consumer.join(timeout=5)
+    assert got == ["frame"]
+
+    slot.close()
+    assert slot.get(timeout=5) is None
+
+
+def test_importing_vision_does_not_load_cv2():
+    import subprocess
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    code = "import sys, src.vision; print('cv2' in sys.modules, 'ultralytics' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False"]